@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import copy
 import os
 from pathlib import Path
 
@@ -37,13 +38,16 @@ INSTALLED_APPS = [
     "django.contrib.contenttypes",
     "django.contrib.sessions",
     "django.contrib.messages",
-    "django.contrib.staticfiles",
+    "store.apps.StoreStaticFilesConfig",  # django.contrib.staticfiles with an ignore list
     "store",
     "store.templatetags.store_extras",
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "store.middleware.StaticFilesMiddleware",
+    "store.middleware.CompressionMiddleware",
+    "store.middleware.ReplicaPinningMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -75,11 +79,85 @@ WSGI_APPLICATION = "ghee_store.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# Select the backend with DB_ENGINE=sqlite (default) or DB_ENGINE=postgres.
+# PostgreSQL settings:
+#   DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+#   DB_POOL=1              use Django's built-in psycopg pool (pip install "psycopg[pool]")
+#   DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE
+#   DB_PGBOUNCER=1         running behind PgBouncer in transaction pooling mode
+# Both backends:
+#   DB_CONN_MAX_AGE        seconds to keep a connection open between requests
+
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+DB_CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", "60"))
+
+if DB_ENGINE == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DB_NAME", "ghee_store"),
+            "USER": os.environ.get("DB_USER", "postgres"),
+            "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+            "HOST": os.environ.get("DB_HOST", "localhost"),
+            "PORT": os.environ.get("DB_PORT", "5432"),
+            "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
+    }
+    if os.environ.get("DB_POOL") == "1":
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+            "timeout": 10,
+        }
+        # Pooled connections are returned to the pool after each request
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+    if os.environ.get("DB_PGBOUNCER") == "1":
+        # Server-side cursors do not survive transaction pooling
+        DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                # Take the write lock at BEGIN so busy_timeout can wait for it,
+                # instead of failing when a reader upgrades to a writer
+                "transaction_mode": "IMMEDIATE",
+            },
+            # A file (in WAL mode, like production) rather than the shared-cache
+            # in-memory default, whose table locks make concurrent readers fail
+            # while a checkout transaction is writing
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
+        }
     }
+# Read replicas: DB_REPLICAS is a comma-separated list of replica hosts
+# (PostgreSQL) or database files (SQLite). Catalog reads are routed to them by
+# store.routers; tests mirror them onto the default test database.
+DB_REPLICAS = [replica for replica in os.environ.get("DB_REPLICAS", "").split(",") if replica]
+REPLICA_DATABASES = []
+for number, replica in enumerate(DB_REPLICAS, start=1):
+    alias = f"replica{number}"
+    DATABASES[alias] = copy.deepcopy(DATABASES["default"])
+    DATABASES[alias]["HOST" if DB_ENGINE == "postgres" else "NAME"] = replica
+    DATABASES[alias]["TEST"] = {"MIRROR": "default"}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ["store.routers.PrimaryReplicaRouter"]
+# After a write, keep the client on the primary for this long (replication lag)
+REPLICA_PIN_SECONDS = 5
+
+# Applied to every new SQLite connection by store.db (connection_created)
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,  # ms
+    "mmap_size": 134217728,  # 128 MB
+    "cache_size": -20000,  # ~20 MB
+    "temp_store": "MEMORY",
 }
 
 
@@ -126,12 +204,57 @@ STATIC_URL = "static/"
 STATICFILES_DIRS = [BASE_DIR / "store" / "static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# collectstatic writes content-hashed copies (for far-future caching) and
+# .gz/.br siblings of every text asset
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "store.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+
 # Media files (User uploads)
 # https://docs.djangoproject.com/en/5.2/topics/files/
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# StaticFilesMiddleware serves STATIC_ROOT and MEDIA_ROOT in-process.
+# Content-hashed static files are cached for a year; everything else for:
+STATIC_SERVE_MAX_AGE = 60
+# Behind nginx, map URL prefixes to `internal` locations so the proxy sends
+# the file via X-Accel-Redirect, e.g. {"/static/": "/protected/static/"}
+STATIC_SERVE_ACCEL_REDIRECT = {}
+
+# CompressionMiddleware: brotli is used when the `brotli` package is
+# installed and the client accepts it, gzip otherwise
+COMPRESSION_MIN_SIZE = 512  # bytes; smaller responses are sent as-is
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+# Random gzip header padding against BREACH, as in Django's GZipMiddleware
+COMPRESSION_MAX_RANDOM_BYTES = 100
+
+# Seconds a coupon lookup (or a miss for an unknown code) is cached
+COUPON_CACHE_TTL = 30
+
+# Waiting room in front of checkout and cart changes (store/admission.py).
+# ADMISSION_RATE visitors are let in per second, in arrival order; 0 turns
+# the queue off. Needs a shared CACHES backend with several worker processes.
+ADMISSION_RATE = float(os.environ.get("ADMISSION_RATE", "0"))
+ADMISSION_BURST = 20             # visitors let straight in after a quiet spell
+ADMISSION_PASS_SECONDS = 15 * 60  # how long an admitted visitor stays admitted
+ADMISSION_POLL_SECONDS = 3
+# Gated requests running at once per process (0 = no limit), and how long an
+# extra request waits for a free slot before being sent to the waiting room
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", "0"))
+ADMISSION_CONCURRENCY_WAIT = 5
+
+# Seconds a placed order is remembered by its checkout key, so resubmits of
+# "place order" are answered from the cache (the database check stays after)
+CHECKOUT_IDEMPOTENCY_TTL = 15 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -164,3 +287,14 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_PASSWORD', '')  # Set via environmen
 # Store owner email for order notifications
 STORE_EMAIL = 'gaumaatri@gmail.com'  # Email to receive order notifications
 DEFAULT_FROM_EMAIL = 'gaumaatri@gmail.com'  # Email that will appear as sender
+
+# Seller details and tax rate printed on GST invoices (manage.py generate_invoices).
+# Orders shipped within INVOICE_SELLER['state'] are billed CGST + SGST, others IGST.
+INVOICE_SELLER = {
+    'name': 'Gaumaatri',
+    'address': os.environ.get('INVOICE_SELLER_ADDRESS', ''),
+    'state': os.environ.get('INVOICE_SELLER_STATE', ''),
+    'gstin': os.environ.get('INVOICE_SELLER_GSTIN', ''),
+}
+INVOICE_HSN = '0405'          # butter, ghee and other milk fats
+INVOICE_GST_PERCENT = 5       # prices are inclusive of GST
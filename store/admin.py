@@ -1,8 +1,58 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
 from django.utils.html import format_html
 from django.urls import reverse
-from django.http import HttpResponseRedirect
-from .models import Product, Order, OrderItem, Category, ProductSize, ProductStock, Coupon
+from django.http import HttpResponseRedirect, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from .models import (Product, Order, OrderItem, Category, ProductSize, ProductStock, Coupon,
+                     ShippingTier, PricingSettings, Sale, SaleItem, EffectivePrice, ShippingZone, ShippingRate,
+                     Pincode, CustomerStats, SalesRollup, Invoice, PriceChange, StockSync)
+from .customers import SEGMENTS, segment_filter, set_order_status
+from .fulfilment import batch_html, packing_slips_csv, pick_list_csv
+from .images import variant_url
+from .price_changes import TARGET_FIELDS, PriceChangeError, change_prices, preview_prices
+from .rollups import dashboard
+
+class PriceChangeForm(forms.Form):
+    field = forms.ChoiceField(choices=PriceChange.FIELDS)
+    mode = forms.ChoiceField(choices=PriceChange.MODES)
+    amount = forms.DecimalField(max_digits=10, decimal_places=2,
+                                help_text="Negative to lower; for 'Change by %', 10 means +10%")
+    
+    def __init__(self, *args, target, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['field'].choices = [
+            choice for choice in PriceChange.FIELDS if choice[0] in TARGET_FIELDS[target]
+        ]
+
+def price_change_action(modeladmin, request, queryset, target):
+    """Intermediate page of the "Change prices" actions: preview first, then apply."""
+    submitted = 'preview' in request.POST or 'apply' in request.POST
+    form = PriceChangeForm(request.POST if submitted else None, target=target)
+    preview = None
+    if form.is_valid():
+        field, mode, amount = form.cleaned_data['field'], form.cleaned_data['mode'], form.cleaned_data['amount']
+        try:
+            if 'apply' in request.POST:
+                selection = request.GET.urlencode() if request.POST.get('select_across') == '1' else ''
+                change = change_prices(queryset, field, mode, amount, user=request.user,
+                                       selection=selection or f"{queryset.count()} selected rows")
+                modeladmin.message_user(request, f"Changed {change.rows} rows: {change}")
+                return None
+            preview = preview_prices(queryset, field, mode, amount)
+        except PriceChangeError as e:
+            form.add_error(None, str(e))
+    return TemplateResponse(request, 'admin/store/price_change.html', {
+        **modeladmin.admin_site.each_context(request),
+        'opts': modeladmin.model._meta,
+        'title': 'Change prices',
+        'form': form,
+        'preview': preview,
+        'action': request.POST.get('action'),
+        'selected': request.POST.getlist(ACTION_CHECKBOX_NAME),
+        'select_across': request.POST.get('select_across', '0'),
+    })
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -32,7 +82,9 @@ class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     filter_horizontal = ('categories', 'sizes')
     readonly_fields = ('created_at', 'updated_at')
-    list_editable = ('is_featured', 'discount_percent', 'stock_quantity')
+    # stock_quantity is the total of the size stocks for most products, so it is not editable in the list
+    list_editable = ('is_featured', 'discount_percent')
+    actions = ['bulk_change_prices']
     fieldsets = (
         ('Basic Information', {
             'fields': ('name', 'slug', 'image', 'price', 'discount_percent', 'stock_quantity',
@@ -52,9 +104,17 @@ class ProductAdmin(admin.ModelAdmin):
     )
     readonly_fields = ('stock_status', 'created_at', 'updated_at')
     
+    def get_readonly_fields(self, request, obj=None):
+        readonly = super().get_readonly_fields(request, obj)
+        if obj is not None and obj.size_stocks.exists():
+            # save() sets it to the total of the size stocks
+            return (*readonly, 'stock_quantity')
+        return readonly
+    
     def display_image(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height: 50px; max-width: 100px;" />', obj.image.url)
+            return format_html('<img src="{}" style="max-height: 50px; max-width: 100px;" />',
+                               variant_url(obj.image, 'thumb'))
         return "No Image"
     display_image.short_description = 'Image'
     
@@ -69,22 +129,27 @@ class ProductAdmin(admin.ModelAdmin):
     def get_discounted_price(self, obj):
         return obj.discounted_price
     get_discounted_price.short_description = 'Discounted Price'
+    
+    def bulk_change_prices(self, request, queryset):
+        return price_change_action(self, request, queryset, 'product')
+    bulk_change_prices.short_description = "Change price or discount of selected products"
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
-    readonly_fields = ('product', 'quantity', 'price', 'total_price')
+    readonly_fields = ('product', 'size', 'quantity', 'price', 'total_price')
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('order_id', 'full_name', 'email', 'total_amount', 'payment_status',
+    list_display = ('order_id', 'full_name', 'email', 'item_count', 'total_amount', 'payment_status',
                     'payment_method', 'status', 'created_at')
     list_filter = ('status', 'payment_status', 'payment_method', 'created_at')
     search_fields = ('order_id', 'full_name', 'email', 'phone', 'tracking_number')
     readonly_fields = ('order_id', 'created_at', 'updated_at')
     inlines = [OrderItemInline]
     date_hierarchy = 'created_at'
-    actions = ['export_orders_to_csv', 'mark_as_processing', 'mark_as_shipped', 'mark_as_delivered']
+    actions = ['export_orders_to_csv', 'mark_as_processing', 'mark_as_shipped', 'mark_as_delivered',
+               'print_pick_list', 'download_pick_list_csv', 'download_packing_slips_csv']
     
     fieldsets = (
         ('Customer Information', {
@@ -106,25 +171,59 @@ class OrderAdmin(admin.ModelAdmin):
     export_orders_to_csv.short_description = "Export selected orders to CSV"
     
     def mark_as_processing(self, request, queryset):
-        queryset.update(status='processing')
-        self.message_user(request, f"{queryset.count()} orders marked as processing")
+        changed = set_order_status(queryset, 'processing')
+        self.message_user(request, f"{changed} orders marked as processing")
     mark_as_processing.short_description = "Mark selected orders as processing"
     
     def mark_as_shipped(self, request, queryset):
-        queryset.update(status='shipped')
-        self.message_user(request, f"{queryset.count()} orders marked as shipped")
+        changed = set_order_status(queryset, 'shipped')
+        self.message_user(request, f"{changed} orders marked as shipped")
     mark_as_shipped.short_description = "Mark selected orders as shipped"
     
     def mark_as_delivered(self, request, queryset):
-        queryset.update(status='delivered')
-        self.message_user(request, f"{queryset.count()} orders marked as delivered")
+        changed = set_order_status(queryset, 'delivered')
+        self.message_user(request, f"{changed} orders marked as delivered")
     mark_as_delivered.short_description = "Mark selected orders as delivered"
     
+    def _fulfilment_batch(self, request, queryset):
+        orders = queryset.filter(status='processing').order_by('created_at', 'id')
+        if not orders.exists():
+            self.message_user(request, "None of the selected orders are processing", level='warning')
+            return None
+        return orders
+    
+    def print_pick_list(self, request, queryset):
+        orders = self._fulfilment_batch(request, queryset)
+        if orders is not None:
+            return StreamingHttpResponse(batch_html(orders), content_type='text/html; charset=utf-8')
+    print_pick_list.short_description = "Print pick list and packing slips (processing orders)"
+    
+    def download_pick_list_csv(self, request, queryset):
+        orders = self._fulfilment_batch(request, queryset)
+        if orders is not None:
+            response = StreamingHttpResponse(pick_list_csv(orders), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="pick_list.csv"'
+            return response
+    download_pick_list_csv.short_description = "Download pick list CSV (processing orders)"
+    
+    def download_packing_slips_csv(self, request, queryset):
+        orders = self._fulfilment_batch(request, queryset)
+        if orders is not None:
+            response = StreamingHttpResponse(packing_slips_csv(orders), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="packing_slips.csv"'
+            return response
+    download_packing_slips_csv.short_description = "Download packing slips CSV (processing orders)"
+    
 @admin.register(ProductStock)
 class ProductStockAdmin(admin.ModelAdmin):
-    list_display = ('product', 'size', 'quantity')
+    list_display = ('product', 'size', 'quantity', 'price')
     list_filter = ('product', 'size')
     search_fields = ('product__name',)
+    actions = ['bulk_change_prices']
+    
+    def bulk_change_prices(self, request, queryset):
+        return price_change_action(self, request, queryset, 'stock')
+    bulk_change_prices.short_description = "Change price of selected size stocks"
     
     class Media:
         js = ('admin/js/stock_admin.js',)
@@ -165,3 +264,164 @@ class CouponAdmin(admin.ModelAdmin):
         elif obj.discount_amount > 0:
             obj.discount_percent = 0
         super().save_model(request, obj, form, change)
+
+@admin.register(ShippingTier)
+class ShippingTierAdmin(admin.ModelAdmin):
+    list_display = ('min_subtotal', 'cost', 'is_active')
+    list_editable = ('cost', 'is_active')
+
+class CustomerSegmentFilter(admin.SimpleListFilter):
+    title = 'segment'
+    parameter_name = 'segment'
+    
+    def lookups(self, request, model_admin):
+        return [(name, label) for name, (label, _) in SEGMENTS.items()]
+    
+    def queryset(self, request, queryset):
+        if self.value() in SEGMENTS:
+            return queryset.filter(segment_filter(self.value()))
+        return queryset
+
+@admin.register(CustomerStats)
+class CustomerStatsAdmin(admin.ModelAdmin):
+    """Read-only; kept up to date from the orders (``manage.py rebuild_customer_stats`` to recompute)."""
+    list_display = ('__str__', 'email', 'order_count', 'lifetime_spend', 'average_order_value',
+                    'cancelled_count', 'first_order_at', 'last_order_at')
+    list_filter = (CustomerSegmentFilter, 'last_order_at')
+    list_select_related = ('user',)
+    search_fields = ('email', 'user__username', 'user__email')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(SalesRollup)
+class SalesRollupAdmin(admin.ModelAdmin):
+    """Sales dashboard in place of the change list, read only from the rollup tables."""
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
+    def changelist_view(self, request, extra_context=None):
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Sales dashboard',
+            **dashboard(),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/store/sales_dashboard.html', context)
+
+@admin.register(Invoice)
+class InvoiceAdmin(admin.ModelAdmin):
+    """Read-only; invoices are rendered by ``manage.py generate_invoices``."""
+    list_display = ('number', 'order', 'created_at', 'view_link')
+    search_fields = ('number', 'order__order_id', 'order__email')
+    list_select_related = ('order',)
+    fields = ('number', 'order', 'created_at', 'view_link')
+    readonly_fields = fields
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('html')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def view_link(self, obj):
+        return format_html('<a href="{}" target="_blank">View</a>', reverse('order_invoice', args=[obj.order.order_id]))
+    view_link.short_description = 'Invoice'
+
+@admin.register(PriceChange)
+class PriceChangeAdmin(admin.ModelAdmin):
+    """Read-only audit log of bulk price changes."""
+    list_display = ('created_at', 'target', 'field', 'mode', 'amount', 'rows', 'user', 'selection')
+    list_filter = ('target', 'field', 'mode')
+    list_select_related = ('user',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(StockSync)
+class StockSyncAdmin(admin.ModelAdmin):
+    """Read-only log of supplier stock feeds applied by ``manage.py sync_stock``."""
+    list_display = ('created_at', 'source', 'rows', 'changed', 'unknown', 'skipped')
+    list_filter = ('source',)
+    readonly_fields = ('source', 'feed_hash', 'rows', 'changed', 'unknown', 'skipped', 'report', 'created_at')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+class ShippingRateInline(admin.TabularInline):
+    model = ShippingRate
+    extra = 1
+
+@admin.register(ShippingZone)
+class ShippingZoneAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'cod_available', 'extra_per_kg')
+    search_fields = ('code', 'name')
+    inlines = [ShippingRateInline]
+
+@admin.register(Pincode)
+class PincodeAdmin(admin.ModelAdmin):
+    """Individual pincode fixes; load the full table with ``manage.py import_pincodes``."""
+    list_display = ('pincode', 'zone', 'is_serviceable', 'cod_available')
+    list_filter = ('zone', 'is_serviceable', 'cod_available')
+    list_select_related = ('zone',)
+    search_fields = ('=pincode',)
+
+@admin.register(PricingSettings)
+class PricingSettingsAdmin(admin.ModelAdmin):
+    list_display = ('gift_wrap_cost', 'updated_at')
+
+class SaleItemInline(admin.TabularInline):
+    model = SaleItem
+    extra = 1
+    autocomplete_fields = ('product',)
+
+@admin.register(Sale)
+class SaleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'starts_at', 'ends_at', 'is_active', 'is_running_now')
+    list_filter = ('is_active',)
+    search_fields = ('name',)
+    inlines = [SaleItemInline]
+    
+    def is_running_now(self, obj):
+        return obj.is_running()
+    is_running_now.boolean = True
+    is_running_now.short_description = 'Running'
+
+@admin.register(EffectivePrice)
+class EffectivePriceAdmin(admin.ModelAdmin):
+    """Read-only view of the prices the storefront is using."""
+    list_display = ('product', 'size', 'price', 'discount_percent', 'sale', 'updated_at')
+    list_filter = ('sale',)
+    search_fields = ('product__name',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,181 @@
+"""Virtual waiting room in front of checkout and cart changes.
+
+Two independent limits, both off by default:
+
+* ``ADMISSION_RATE``: visitors let in per second. Each visitor that reaches a
+  gated view without an admission pass takes a numbered ticket; a token
+  bucket (``ADMISSION_BURST`` tokens) moves the "now serving" number forward,
+  so visitors are admitted strictly in ticket order. Waiting visitors are
+  sent to the waiting room page, which polls ``waiting_room_status``.
+  Admitted visitors keep a pass for ``ADMISSION_PASS_SECONDS``.
+* ``ADMISSION_MAX_CONCURRENT``: gated requests allowed to run at once in
+  this process. Extra requests wait up to ``ADMISSION_CONCURRENCY_WAIT``
+  seconds for a slot before being turned away with "busy".
+
+Ticket counters live in the Django cache. The default local-memory cache is
+per process; use a shared backend (file, Redis, Memcached) when running
+several workers so they share one queue.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.utils.http import urlencode
+
+TAIL_KEY = 'admission:tail'      # last ticket handed out
+HEAD_KEY = 'admission:head'      # last ticket admitted
+REFILL_KEY = 'admission:refill'  # time the token bucket was last drawn from
+LOCK_KEY = 'admission:lock'
+
+TICKET_SESSION_KEY = 'admission_ticket'
+PASS_SESSION_KEY = 'admission_pass_until'
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def rate():
+    return getattr(settings, 'ADMISSION_RATE', 0)
+
+
+def _counter(key):
+    return cache.get(key) or 0
+
+
+def _next_ticket():
+    cache.add(TAIL_KEY, 0, None)
+    try:
+        return cache.incr(TAIL_KEY)
+    except ValueError:
+        # Evicted between add() and incr(); start a new sequence
+        cache.add(TAIL_KEY, 0, None)
+        return cache.incr(TAIL_KEY)
+
+
+def advance(now=None):
+    """
+    Admit as many waiting tickets as the token bucket allows.
+
+    Returns:
+        int: the highest admitted ticket number
+    """
+    now = now or time.time()
+    per_second = rate()
+    burst = getattr(settings, 'ADMISSION_BURST', 20)
+    head = _counter(HEAD_KEY)
+    waiting = _counter(TAIL_KEY) - head
+    if per_second <= 0 or waiting <= 0:
+        return head
+    if not cache.add(LOCK_KEY, 1, 5):
+        # Another request is advancing the queue right now
+        return head
+    try:
+        refill = max(cache.get(REFILL_KEY) or 0, now - burst / per_second)
+        admitted = min(int((now - refill) * per_second), waiting)
+        if admitted > 0:
+            cache.add(HEAD_KEY, 0, None)
+            head = cache.incr(HEAD_KEY, admitted)
+            cache.set(REFILL_KEY, refill + admitted / per_second, None)
+    finally:
+        cache.delete(LOCK_KEY)
+    return head
+
+
+def has_pass(request):
+    return request.session.get(PASS_SESSION_KEY, 0) > time.time()
+
+
+def check_in(request):
+    """
+    Place the visitor in the queue (if not already) and admit them if it is their turn.
+
+    Returns:
+        int: number of visitors ahead; 0 means admitted (a pass is stored in the session)
+    """
+    if rate() <= 0 or has_pass(request):
+        return 0
+    ticket = request.session.get(TICKET_SESSION_KEY)
+    if ticket is None or ticket > _counter(TAIL_KEY):
+        # New visitor, or the counters were reset (cache flush or eviction)
+        ticket = _next_ticket()
+        request.session[TICKET_SESSION_KEY] = ticket
+
+    position = ticket - advance()
+    if position <= 0:
+        request.session.pop(TICKET_SESSION_KEY, None)
+        request.session[PASS_SESSION_KEY] = time.time() + getattr(settings, 'ADMISSION_PASS_SECONDS', 900)
+        return 0
+    return position
+
+
+def _semaphore():
+    global _slots
+    limit = getattr(settings, 'ADMISSION_MAX_CONCURRENT', 0)
+    if not limit:
+        return None
+    with _slots_lock:
+        if _slots is None or _slots.limit != limit:
+            _slots = threading.BoundedSemaphore(limit)
+            _slots.limit = limit
+        return _slots
+
+
+@contextmanager
+def concurrency_slot():
+    """Yield True while holding one of the ADMISSION_MAX_CONCURRENT slots, False if none freed up in time."""
+    slots = _semaphore()
+    if slots is None:
+        yield True
+        return
+    acquired = slots.acquire(timeout=getattr(settings, 'ADMISSION_CONCURRENCY_WAIT', 5))
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            slots.release()
+
+
+def waiting_response(request, position=0):
+    """Send the visitor to the waiting room (JSON 429 for AJAX calls)."""
+    next_url = request.get_full_path() if request.method == 'GET' else request.META.get('HTTP_REFERER', '/')
+    waiting_room = f"{reverse('waiting_room')}?{urlencode({'next': next_url})}"
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        response = JsonResponse({
+            'success': False,
+            'waiting': True,
+            'position': position,
+            'message': "We're busy right now. You're in line and will be let in shortly.",
+            'redirect': waiting_room,
+        }, status=429)
+        response['Retry-After'] = str(getattr(settings, 'ADMISSION_POLL_SECONDS', 3))
+        return response
+    return redirect(waiting_room)
+
+
+def admission_required(methods=None):
+    """
+    Gate a view behind the waiting room and the concurrency limit.
+
+    Args:
+        methods: HTTP methods to gate (all methods when None)
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if methods is not None and request.method not in methods:
+                return view(request, *args, **kwargs)
+            position = check_in(request)
+            if position > 0:
+                return waiting_response(request, position)
+            with concurrency_slot() as acquired:
+                if not acquired:
+                    return waiting_response(request)
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
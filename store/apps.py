@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.contrib.staticfiles.apps import StaticFilesConfig
 
 
 class StoreConfig(AppConfig):
+    default = True
     default_auto_field = "django.db.models.BigAutoField"
     name = "store"
+
+    def ready(self):
+        from . import db, signals  # noqa: F401
+
+
+class StoreStaticFilesConfig(StaticFilesConfig):
+    """staticfiles with an ignore list for junk that should never be collected."""
+    ignore_patterns = StaticFilesConfig.ignore_patterns + [
+        ".DS_Store",
+        "README.txt",
+        "*.md",
+        "*.psd",
+        "Thumbs.db",
+    ]
@@ -0,0 +1,373 @@
+"""Bulk catalog import from a CSV or JSON feed.
+
+The feed has one row per product size (SKU), as CSV, a JSON array or JSON
+lines (``.jsonl``); all three are streamed, one row at a time. Columns:
+
+* ``name``, ``price``: required; ``price`` is the product's base price
+* ``slug``: optional, ``slugify(name)`` otherwise; identifies the product
+* ``size``, ``size_price``, ``quantity``: the size stock (``size_price``
+  defaults to ``price``); without a size, ``quantity`` is the product's stock.
+  An empty ``quantity`` leaves an existing stock as it is (new stocks start
+  at 0)
+* ``category``: category names separated by ``;``, matched to existing
+  categories by name or slug
+* ``discount_percent``, ``description``, ``short_description``,
+  ``is_featured``, ``image`` (a storage name such as ``products/ghee.jpg``):
+  optional, left as they are when the column is absent or empty
+
+Rows are processed in batches. Each batch reads the current products and
+stocks it names in one query each and compares them in memory; only new or
+changed rows are written, with ``bulk_create(update_conflicts=True)`` on the
+product slug and on (product, size). Slugs never go through
+``Product.save()``'s query loop.
+
+Bulk writes send no signals, so at the end the product stock totals, the
+effective prices and (if sizes were added) the shipping index are refreshed
+once each.
+"""
+import csv
+import json
+import os
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import Category, Product, ProductSize, ProductStock
+from .sales import refresh_effective_prices
+from .shipping import invalidate_shipping_index
+from .stock import refresh_product_stock
+
+SIZE_NAMES = {name for name, _ in ProductSize.SIZE_CHOICES}
+TRUE_VALUES = {'1', 'y', 'yes', 'true', 't'}
+
+# Optional product columns, written only when the feed gives a value
+PRODUCT_FIELDS = ('discount_percent', 'description', 'short_description', 'is_featured', 'image')
+
+# Above this many products, refresh every effective price rather than list them
+REFRESH_ALL_OVER = 1000
+
+
+class CatalogImportError(ValueError):
+    """A feed that cannot be read at all (bad rows are reported and skipped)."""
+
+
+def iter_json_array(f, chunk_size=1 << 16):
+    """
+    Items of the JSON array in file ``f``, decoded one at a time.
+
+    Raises:
+        ValueError: if the file is not a JSON array
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+
+    def next_char():
+        # First non-whitespace character, reading more of the file as needed
+        nonlocal buffer, eof
+        while True:
+            buffer = buffer.lstrip()
+            if buffer or eof:
+                return buffer[:1]
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+
+    if next_char() != '[':
+        raise ValueError("expected a JSON array")
+    buffer = buffer[1:]
+    if next_char() == ']':
+        return
+    while True:
+        next_char()
+        # A value is only complete once something follows it (or the file ends)
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            item, end = None, None
+        if end is None or (end == len(buffer) and not eof):
+            if eof:
+                raise ValueError("invalid or truncated JSON array")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+        separator = next_char()
+        buffer = buffer[1:]
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError("expected ',' or ']' between JSON array items")
+
+
+def read_feed(path):
+    """
+    Rows of a CSV, JSON or JSON lines feed.
+
+    Yields:
+        tuple: (row number, dict)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            if extension == '.csv':
+                yield from enumerate(csv.DictReader(f), start=2)
+            elif extension in ('.jsonl', '.ndjson'):
+                for number, line in enumerate(f, start=1):
+                    if line.strip():
+                        yield number, json.loads(line)
+            elif extension == '.json':
+                yield from enumerate(iter_json_array(f), start=1)
+            else:
+                raise CatalogImportError(f"Unknown feed type {extension!r}; use .csv, .json or .jsonl")
+    except CatalogImportError:
+        raise
+    except (OSError, ValueError, csv.Error) as e:
+        raise CatalogImportError(f"Cannot read {path}: {e}")
+
+
+def _text(row, column):
+    value = row.get(column)
+    return '' if value is None else str(value).strip()
+
+
+def _decimal(value, column):
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"{column} is not a number: {value!r}")
+    if not number.is_finite() or number < 0:
+        raise ValueError(f"{column} must be zero or more")
+    return number.quantize(Decimal('0.01'))
+
+
+def _integer(value, column, maximum=None):
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{column} is not a whole number: {value!r}")
+    if number < 0 or (maximum is not None and number > maximum):
+        raise ValueError(f"{column} must be between 0 and {maximum}" if maximum else f"{column} must be zero or more")
+    return number
+
+
+def parse_row(row):
+    """
+    Validate one feed row.
+
+    Returns:
+        dict: ``slug``, ``product`` (field values), ``categories``, ``size``,
+        ``size_price`` and ``quantity``
+
+    Raises:
+        ValueError: with a message for the import report
+    """
+    name = _text(row, 'name')
+    if not name:
+        raise ValueError("name is required")
+    slug = slugify(_text(row, 'slug') or name)
+    if not slug:
+        raise ValueError(f"no slug can be made from {name!r}")
+    if not _text(row, 'price'):
+        raise ValueError("price is required")
+    price = _decimal(_text(row, 'price'), 'price')
+
+    product = {'name': name[:200], 'price': price}
+    for field in PRODUCT_FIELDS:
+        value = _text(row, field)
+        if not value:
+            continue
+        if field == 'discount_percent':
+            value = _integer(value, field, maximum=100)
+        elif field == 'is_featured':
+            value = value.lower() in TRUE_VALUES
+        product[field] = value
+
+    categories = row.get('category') or []
+    if isinstance(categories, str):
+        categories = categories.split(';')
+    size = _text(row, 'size')
+    if size and size not in SIZE_NAMES:
+        raise ValueError(f"unknown size {size!r}")
+    quantity = _text(row, 'quantity')
+    quantity = _integer(quantity, 'quantity') if quantity else None
+    if not size and quantity is not None:
+        product['stock_quantity'] = quantity
+    return {
+        'slug': slug,
+        'product': product,
+        'categories': [name for name in (str(c).strip() for c in categories) if name],
+        'size': size,
+        'size_price': _decimal(_text(row, 'size_price'), 'size_price') if _text(row, 'size_price') else price,
+        'quantity': quantity,
+    }
+
+
+class CatalogImport:
+    """
+    One import run; feed it batches with ``import_rows`` and call ``finish``.
+
+    ``report`` counts what was created, updated and left unchanged;
+    ``errors`` lists (row number, message) for skipped rows.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.report = Counter()
+        self.errors = []
+        self.touched = set()
+        self.categories = {}
+        self.category_names = {}
+        for slug, name, category_id in Category.objects.order_by('id').values_list('slug', 'name', 'id'):
+            if slug:
+                self.categories[slug] = category_id
+            self.category_names.setdefault(name.casefold(), category_id)
+        self.sizes = {}
+        for size_id, name in ProductSize.objects.order_by('id').values_list('id', 'name'):
+            self.sizes.setdefault(name, size_id)
+
+    def run(self, rows):
+        """Import ``(row number, dict)`` pairs in batches, then ``finish``."""
+        batch = []
+        for number, row in rows:
+            batch.append((number, row))
+            if len(batch) >= self.batch_size:
+                self.import_rows(batch)
+                batch = []
+        if batch:
+            self.import_rows(batch)
+        self.finish()
+        return self.report
+
+    def import_rows(self, batch):
+        products, links, stocks = {}, set(), {}
+        for number, row in batch:
+            self.report['rows'] += 1
+            try:
+                parsed = parse_row(row)
+            except (ValueError, TypeError, AttributeError) as e:
+                # AttributeError: a JSON row that is not an object
+                self.errors.append((number, str(e)))
+                continue
+            slug = parsed['slug']
+            products.setdefault(slug, {}).update(parsed['product'])
+            links.update((slug, 'category', name) for name in parsed['categories'])
+            if parsed['size']:
+                links.add((slug, 'size', parsed['size']))
+                stocks[(slug, parsed['size'])] = (parsed['quantity'], parsed['size_price'])
+        if not products:
+            return
+
+        self._ensure_categories({name for _, kind, name in links if kind == 'category'})
+        self._ensure_sizes({size for _, size in stocks})
+        ids = self._upsert_products(products)
+        self._link(ids, links)
+        self._upsert_stocks(ids, stocks)
+
+    def _category_id(self, name):
+        return self.category_names.get(name.casefold()) or self.categories.get(slugify(name))
+
+    def _ensure_categories(self, names):
+        missing = {slugify(name): name for name in names if self._category_id(name) is None}
+        if missing:
+            Category.objects.bulk_create([Category(name=name, slug=slug) for slug, name in missing.items()],
+                                         ignore_conflicts=True)
+            self.categories.update(Category.objects.filter(slug__in=missing).values_list('slug', 'id'))
+            self.report['categories created'] += len(missing)
+
+    def _ensure_sizes(self, names):
+        missing = sorted(names - set(self.sizes))
+        if missing:
+            for size in ProductSize.objects.bulk_create([ProductSize(name=name) for name in missing]):
+                self.sizes[size.name] = size.pk
+            self.report['sizes created'] += len(missing)
+
+    def _upsert_products(self, products):
+        fields = ['name', 'price', 'stock_quantity', *PRODUCT_FIELDS]
+        existing = {row['slug']: row for row in Product.objects.filter(slug__in=products).values('id', 'slug', *fields)}
+        now = timezone.now()
+        # bulk_create needs one update_fields list per statement; group rows by the columns they set
+        groups = {}
+        for slug, values in products.items():
+            current = existing.get(slug)
+            if current is None:
+                self.report['products created'] += 1
+            elif any(current[field] != value for field, value in values.items()):
+                self.report['products updated'] += 1
+                self.touched.add(current['id'])
+            else:
+                self.report['products unchanged'] += 1
+                continue
+            groups.setdefault(tuple(sorted(values)), []).append(Product(slug=slug, updated_at=now, **values))
+        for columns, rows in groups.items():
+            Product.objects.bulk_create(rows, update_conflicts=True, unique_fields=['slug'],
+                                        update_fields=[*columns, 'updated_at'])
+
+        ids = dict(Product.objects.filter(slug__in=products).values_list('slug', 'id'))
+        self.touched.update(ids[slug] for slug in products if slug not in existing)
+        return ids
+
+    def _link(self, ids, links):
+        categories = Product.categories.through
+        sizes = Product.sizes.through
+        categories.objects.bulk_create([
+            categories(product_id=ids[slug], category_id=self._category_id(name))
+            for slug, kind, name in links if kind == 'category'
+        ], ignore_conflicts=True)
+        sizes.objects.bulk_create([
+            sizes(product_id=ids[slug], productsize_id=self.sizes[name])
+            for slug, kind, name in links if kind == 'size'
+        ], ignore_conflicts=True)
+
+    def _upsert_stocks(self, ids, stocks):
+        existing = {
+            (product_id, size_id): (quantity, price)
+            for product_id, size_id, quantity, price in ProductStock.objects.filter(
+                product_id__in=ids.values()).values_list('product_id', 'size_id', 'quantity', 'price')
+        }
+        # Stocks without a quantity only update their price; one statement per column list
+        groups = {}
+        for (slug, size), (quantity, price) in stocks.items():
+            key = (ids[slug], self.sizes[size])
+            current = existing.get(key)
+            if current is not None and current == (current[0] if quantity is None else quantity, price):
+                self.report['stocks unchanged'] += 1
+                continue
+            self.report['stocks created' if current is None else 'stocks updated'] += 1
+            self.touched.add(key[0])
+            columns = ('price',) if quantity is None else ('quantity', 'price')
+            groups.setdefault(columns, []).append(
+                ProductStock(product_id=key[0], size_id=key[1], quantity=quantity or 0, price=price))
+        for columns, rows in groups.items():
+            ProductStock.objects.bulk_create(rows, update_conflicts=True, unique_fields=['product', 'size'],
+                                             update_fields=list(columns))
+
+    def finish(self):
+        """Refresh what the bulk writes bypassed, once for the whole import."""
+        if not self.touched:
+            return
+        refresh_product_stock(self.touched)
+        refresh_effective_prices(product_ids=self.touched if len(self.touched) <= REFRESH_ALL_OVER else None)
+        if self.report['sizes created']:
+            invalidate_shipping_index()
+            transaction.on_commit(invalidate_shipping_index)
+
+
+def import_catalog(path, batch_size=1000, dry_run=False):
+    """
+    Import a feed in one transaction (rolled back for ``dry_run``).
+
+    Returns:
+        CatalogImport: with ``report`` and ``errors``
+    """
+    with transaction.atomic():
+        catalog = CatalogImport(batch_size=batch_size)
+        catalog.run(read_feed(path))
+        if dry_run:
+            transaction.set_rollback(True)
+    return catalog
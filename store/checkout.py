@@ -0,0 +1,289 @@
+"""Checkout validation and order placement.
+
+Shared by the multi-step checkout pages and the JSON checkout API, so both
+validate, price and create orders the same way.
+"""
+import logging
+import re
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError
+
+from .coupons import CouponError, get_coupon, redeem_coupon
+from .db import write_attempts
+from .idempotency import checkout_key, claim, completed_order_id, release, remember_order, wait_for_order
+from .models import Order, OrderItem, Product, ProductSize
+from .money import to_json, to_rupees
+from .pricing import price_cart
+from .rollups import rollup_change
+from .shipping import check_pincode
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_METHODS = dict(Order.PAYMENT_METHODS)
+
+ADDRESS_FIELDS = ('first_name', 'last_name', 'email', 'phone', 'address', 'city', 'state', 'pincode')
+PHONE_RE = re.compile(r'^(\+?91)?[6-9]\d{9}$')
+PINCODE_RE = re.compile(r'^[1-9]\d{5}$')
+
+
+class CheckoutError(Exception):
+    """The order could not be placed; the message can be shown to the customer."""
+
+
+def validate_checkout_data(data):
+    """
+    Validate shipping details as posted by the address form or the API.
+
+    Args:
+        data: Mapping with the ADDRESS_FIELDS (``zipcode`` is accepted for ``pincode``)
+
+    Returns:
+        tuple: (checkout_data for the session, {field: error message})
+    """
+    values = {field: str(data.get(field) or '').strip() for field in ADDRESS_FIELDS}
+    if not values['pincode']:
+        values['pincode'] = str(data.get('zipcode') or '').strip()
+
+    errors = {field: "This field is required." for field, value in values.items() if not value}
+    if values['email'] and 'email' not in errors:
+        try:
+            validate_email(values['email'])
+        except ValidationError:
+            errors['email'] = "Enter a valid email address."
+    phone = re.sub(r'[\s-]', '', values['phone'])
+    if phone and not PHONE_RE.match(phone):
+        errors['phone'] = "Enter a valid 10-digit mobile number."
+    if values['pincode'] and not PINCODE_RE.match(values['pincode']):
+        errors['pincode'] = "Enter a valid 6-digit PIN code."
+    elif values['pincode'] and not check_pincode(values['pincode']).serviceable:
+        errors['pincode'] = "Sorry, we don't deliver to this PIN code yet."
+
+    checkout_data = {
+        'full_name': f"{values['first_name']} {values['last_name']}".strip(),
+        'email': values['email'],
+        'phone': phone,
+        'address': values['address'],
+        'city': values['city'],
+        'state': values['state'],
+        'pincode': values['pincode'],
+        'order_notes': str(data.get('order_notes') or '').strip(),
+    }
+    return checkout_data, errors
+
+
+def payment_method_error(payment_method, pincode=None):
+    """Why ``payment_method`` cannot be used for delivery to ``pincode``, or None."""
+    if payment_method not in PAYMENT_METHODS:
+        return "Choose a valid payment method."
+    if payment_method == 'cod' and pincode and not check_pincode(pincode).cod_available:
+        return "Cash on delivery is not available for this PIN code."
+    return None
+
+
+def session_quote(request, cart=None, pincode=None):
+    """
+    Price the session cart with its gift wrap choice and applied coupon.
+
+    Shipping uses the zone rate for ``pincode`` (default: the pincode of the
+    shipping details already entered).
+    """
+    applied_coupon = request.session.get('applied_coupon')
+    coupon = get_coupon(applied_coupon.get('code')) if applied_coupon else None
+    if pincode is None:
+        pincode = (request.session.get('checkout_data') or {}).get('pincode')
+    return price_cart(
+        request.session.get('cart', []) if cart is None else cart,
+        gift_wrap=request.session.get('gift_wrap', False),
+        coupon=coupon,
+        pincode=pincode,
+    ), coupon
+
+
+def checkout_lines(quote):
+    """Checkout/email line dicts for the priced lines of a cart quote."""
+    product_map = Product.objects.in_bulk({line.product_id for line in quote.lines})
+    return [
+        {
+            'product': product_map[line.product_id],
+            'quantity': line.quantity,
+            'price': to_rupees(line.unit_price),
+            'total': to_rupees(line.total),
+            'size_id': int(line.size_id) if line.size_id else None,
+        }
+        for line in quote.lines
+        if line.product_id in product_map
+    ]
+
+
+def quote_json(quote, products):
+    """JSON-ready summary of a cart quote and its checkout lines."""
+    names = {item['product'].id: item['product'].name for item in products}
+    return {
+        'items': [
+            {
+                'product_id': line.product_id,
+                'name': names[line.product_id],
+                'size_id': line.size_id,
+                'quantity': line.quantity,
+                'price': to_json(line.unit_price),
+                'total': to_json(line.total),
+            }
+            for line in quote.lines
+            if line.product_id in names
+        ],
+        'item_count': quote.item_count,
+        'subtotal': to_json(quote.subtotal),
+        'coupon_discount': to_json(quote.coupon_discount),
+        'shipping_cost': to_json(quote.shipping_cost),
+        'gift_wrap_cost': to_json(quote.gift_wrap_cost),
+        'total': to_json(quote.total),
+    }
+
+
+def process_order_emails(request, order, products):
+    """Send order confirmation emails to both customer and store owner"""
+
+    # Get site URL for email templates
+    site_url = request.build_absolute_uri('/')[:-1]  # Get base URL without trailing slash
+
+    # Send confirmation emails to both customer and store owner using the utility function
+    from .email_utils import send_order_confirmation_emails
+    customer_sent, owner_sent = send_order_confirmation_emails(
+        order=order,
+        products=products,
+        site_url=site_url
+    )
+
+    # Log the result
+    if customer_sent and owner_sent:
+        print(f"Order confirmation emails sent for order #{order.order_id}")
+    else:
+        print(f"Some order confirmation emails failed for order #{order.order_id}")
+
+
+def _create_order(request, order_key, payment_verified):
+    checkout_data = request.session.get('checkout_data')
+    if not checkout_data:
+        raise CheckoutError("Please enter your shipping details before placing the order.")
+    payment_method = request.session.get('payment_method', 'cod')
+    error = payment_method_error(payment_method, checkout_data.get('pincode'))
+    if error:
+        raise CheckoutError(error)
+    # For UPI payments, mark as paid if user confirmed
+    payment_status = payment_verified if payment_method == 'upi' else False
+
+    # Price the cart with the same rules the cart page used; the applied
+    # coupon is re-checked against the final subtotal
+    quote, coupon = session_quote(request)
+    if not quote.coupon_discount:
+        coupon = None
+    products = checkout_lines(quote)
+    if not products:
+        raise CheckoutError("Your cart is empty. Please add items before placing an order.")
+
+    # Sizes removed since they were added to the cart are recorded as no size
+    sizes = set(ProductSize.objects.filter(
+        pk__in={item['size_id'] for item in products if item['size_id']}).values_list('pk', flat=True))
+
+    # Prices are resolved above so the write transaction stays short;
+    # it is retried if SQLite reports the database as locked
+    for attempt in write_attempts():
+        with attempt:
+            if coupon is not None:
+                # Counts the use atomically; raises CouponError when used up
+                redeem_coupon(coupon)
+            order = Order.objects.create(
+                order_id=uuid.uuid4(),
+                checkout_key=order_key,
+                user=request.user if request.user.is_authenticated else None,
+                full_name=checkout_data.get('full_name', ''),
+                email=checkout_data.get('email', ''),
+                phone=checkout_data.get('phone', ''),
+                address=checkout_data.get('address', ''),
+                city=checkout_data.get('city', ''),
+                state=checkout_data.get('state', ''),
+                pincode=checkout_data.get('pincode', ''),
+                subtotal=to_rupees(quote.subtotal),
+                coupon=coupon,
+                coupon_discount=to_rupees(quote.coupon_discount),
+                shipping_cost=to_rupees(quote.shipping_cost),
+                total_amount=to_rupees(quote.total),
+                payment_method=payment_method,
+                payment_status=payment_status,
+                status='pending',
+                **Order.summary_for((item['product'], item['quantity']) for item in products),
+            )
+            # bulk_create sends no signals; count the items in the sales rollups here
+            with rollup_change([order.pk]):
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product=item['product'],
+                        size_id=item['size_id'] if item['size_id'] in sizes else None,
+                        quantity=item['quantity'],
+                        price=item['price']
+                    )
+                    for item in products
+                ])
+    return order, products
+
+
+def place_order(request, session_id, payment_verified=False):
+    """
+    Place the order for the session cart, once per checkout ``session_id``.
+
+    A replayed submit (double click, retry, back button) gets the order that
+    was already placed; a concurrent one waits for it.
+
+    Returns:
+        UUID: order_id of the new or previously placed order
+
+    Raises:
+        CheckoutError: with a message for the customer
+    """
+    order_key = checkout_key(request, session_id)
+    existing_order_id = completed_order_id(order_key)
+    if existing_order_id is None and not claim(order_key):
+        existing_order_id = wait_for_order(order_key)
+        if existing_order_id is None:
+            raise CheckoutError("Your order could not be confirmed. Please review it and try again.")
+    if existing_order_id is not None:
+        return existing_order_id
+
+    try:
+        order, products = _create_order(request, order_key, payment_verified)
+        remember_order(order_key, order.order_id)
+    except CouponError:
+        request.session.pop('applied_coupon', None)
+        raise CheckoutError("Sorry, your coupon has just run out. Please review your order total and try again.")
+    except IntegrityError:
+        # Lost a race with another submit of the same checkout
+        existing_order_id = completed_order_id(order_key)
+        if existing_order_id is not None:
+            return existing_order_id
+        logger.exception("Error creating order")
+        raise CheckoutError("There was an error processing your order. Please try again.")
+    except CheckoutError:
+        raise
+    except Exception:
+        logger.exception("Error creating order")
+        raise CheckoutError("There was an error processing your order. Please try again.")
+    finally:
+        release(order_key)
+
+    # Send emails (non-blocking - don't let email failures stop order)
+    try:
+        process_order_emails(request, order, products)
+    except Exception as email_error:
+        print(f"Email sending failed but order created: {str(email_error)}")
+
+    # Clear the cart and checkout data
+    request.session['cart'] = []
+    request.session.pop('checkout_data', None)
+    request.session.pop('payment_method', None)
+    request.session.pop('applied_coupon', None)
+    request.session.modified = True
+    return order.order_id
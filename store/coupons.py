@@ -0,0 +1,75 @@
+"""Coupon lookup and redemption.
+
+Lookups go through a short-lived cache (including "no such coupon" answers)
+so repeated apply attempts do not hit the database. Redemption is a single
+conditional UPDATE, so ``used_count`` can never pass ``usage_limit`` no
+matter how many checkouts race for the last use.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Coupon
+
+# Cached in place of a coupon for codes that do not exist
+_MISSING = 'missing'
+
+
+class CouponError(Exception):
+    """The coupon cannot be redeemed (unknown, expired or used up)."""
+
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+
+def _cache_key(code):
+    return f'coupon:{code}'
+
+
+def get_coupon(code):
+    """
+    Return the Coupon for ``code`` or None, using a short-TTL cache.
+
+    The cached object may carry a slightly stale ``used_count``; the usage
+    limit is enforced again by ``redeem_coupon``.
+    """
+    code = normalize_code(code)
+    if not code:
+        return None
+    cached = cache.get(_cache_key(code))
+    if cached is not None:
+        return None if cached == _MISSING else cached
+
+    coupon = Coupon.objects.filter(code=code).first()
+    ttl = getattr(settings, 'COUPON_CACHE_TTL', 30)
+    cache.set(_cache_key(code), coupon if coupon is not None else _MISSING, ttl)
+    return coupon
+
+
+def invalidate_coupon(code):
+    cache.delete(_cache_key(normalize_code(code)))
+
+
+def redeem_coupon(coupon):
+    """
+    Count one use of ``coupon``; call inside the order-creation transaction.
+
+    Raises:
+        CouponError: if the coupon is inactive, outside its validity window or
+            already used ``usage_limit`` times. The caller's transaction should
+            be rolled back so the order is not created without its discount.
+    """
+    now = timezone.now()
+    updated = Coupon.objects.filter(
+        pk=coupon.pk,
+        is_active=True,
+        valid_from__lte=now,
+        valid_to__gte=now,
+        used_count__lt=F('usage_limit'),
+    ).update(used_count=F('used_count') + 1)
+    if not updated:
+        # Drop the cached copy so the next lookup sees it as used up
+        invalidate_coupon(coupon.code)
+        raise CouponError(f"Coupon {coupon.code} is no longer valid")
@@ -0,0 +1,220 @@
+"""Incremental per-customer lifetime metrics (``CustomerStats``).
+
+Each order counts towards one stats row: its user's, or for guest checkouts
+the row of its normalized email. A change to an order is applied as the
+difference between what the order contributed before and after it, with F()
+expressions in the same transaction as the order write:
+
+* order placed: one more order and its total (``post_save`` on Order)
+* cancelled / un-cancelled, total or customer edited: the difference
+* order deleted: its contribution taken away
+
+``QuerySet.update()`` sends no signals, so bulk status changes go through
+``set_order_status``, which also keeps the sales rollups in step.
+``first_order_at``/``last_order_at`` only ever move outwards;
+``manage.py rebuild_customer_stats`` recomputes everything from the orders.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import DateTimeField, F, Q, Value
+from django.db.models.functions import Coalesce, Greatest, Least, Lower, Trim
+from django.utils import timezone
+
+from .db import write_attempts
+from .models import CustomerStats, Order
+from .rollups import rollup_change
+
+# Order fields that change what an order contributes
+TRACKED_FIELDS = ('user', 'email', 'status', 'total_amount', 'created_at')
+CONTRIBUTION_FIELDS = ('user_id', 'email', 'status', 'total_amount', 'created_at')
+
+# A rebuild recomputes the customers whose stats changed since this long
+# before its scan began (covers order transactions still open at the start)
+REBUILD_OVERLAP = timedelta(minutes=5)
+
+Contribution = namedtuple('Contribution', 'key email orders cancelled spend placed_at')
+
+SEGMENTS = {
+    'new': ("One order", lambda now: Q(order_count=1)),
+    'repeat': ("2-4 orders", lambda now: Q(order_count__range=(2, 4))),
+    'loyal': ("5+ orders", lambda now: Q(order_count__gte=5)),
+    'lapsed': ("No order in 180 days", lambda now: Q(last_order_at__lt=now - timedelta(days=180))),
+}
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def customer_key(user_id, email):
+    """Hashable identity of the stats row an order belongs to."""
+    return ('user', user_id) if user_id else ('email', normalize_email(email))
+
+
+def _lookup(key):
+    kind, value = key
+    return {'user_id': value} if kind == 'user' else {'user__isnull': True, 'email': value}
+
+
+def contribution(user_id, email, status, total_amount, created_at):
+    """What one order adds to its customer's stats."""
+    cancelled = status == 'cancelled'
+    return Contribution(
+        customer_key(user_id, email),
+        normalize_email(email),
+        0 if cancelled else 1,
+        1 if cancelled else 0,
+        Decimal('0') if cancelled else Decimal(total_amount),
+        created_at,
+    )
+
+
+def order_contribution(order):
+    return contribution(order.user_id, order.email, order.status, order.total_amount, order.created_at)
+
+
+def stored_contribution(order_id):
+    """Contribution of the order as currently saved, or None."""
+    row = Order.objects.filter(pk=order_id).values_list(
+        'user_id', 'email', 'status', 'total_amount', 'created_at').first()
+    return contribution(*row) if row else None
+
+
+def _add(key, email, orders=0, cancelled=0, spend=Decimal('0'), placed_at=None):
+    if not (orders or cancelled or spend or placed_at):
+        return
+    now = timezone.now()
+    changes = {
+        'order_count': F('order_count') + orders,
+        'cancelled_count': F('cancelled_count') + cancelled,
+        'lifetime_spend': F('lifetime_spend') + spend,
+        'updated_at': now,
+    }
+    if placed_at is not None:
+        placed = Value(placed_at, output_field=DateTimeField())
+        changes['first_order_at'] = Least(Coalesce('first_order_at', placed), placed)
+        changes['last_order_at'] = Greatest(Coalesce('last_order_at', placed), placed)
+        if key[0] == 'user':
+            changes['email'] = email
+    if CustomerStats.objects.filter(**_lookup(key)).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            CustomerStats.objects.create(
+                user_id=key[1] if key[0] == 'user' else None, email=email,
+                order_count=orders, cancelled_count=cancelled, lifetime_spend=spend,
+                first_order_at=placed_at, last_order_at=placed_at, updated_at=now,
+            )
+    except IntegrityError:
+        # Created by a concurrent order for the same customer
+        CustomerStats.objects.filter(**_lookup(key)).update(**changes)
+
+
+def apply_change(before, after):
+    """
+    Update the stats for an order going from ``before`` to ``after``.
+
+    Args:
+        before: Contribution before the change (None for a new order)
+        after: Contribution after the change (None for a deleted order)
+    """
+    if before is not None and after is not None and before.key == after.key:
+        _add(after.key, after.email,
+             after.orders - before.orders, after.cancelled - before.cancelled, after.spend - before.spend,
+             placed_at=after.placed_at if after.placed_at != before.placed_at else None)
+        return
+    if before is not None:
+        _add(before.key, before.email, -before.orders, -before.cancelled, -before.spend)
+    if after is not None:
+        _add(after.key, after.email, after.orders, after.cancelled, after.spend, placed_at=after.placed_at)
+
+
+def set_order_status(queryset, status):
+    """
+    ``queryset.update(status=status)`` that keeps the customer stats and
+    sales rollups in step.
+
+    Returns:
+        int: number of orders changed
+    """
+    with transaction.atomic():
+        rows = list(queryset.exclude(status=status).values_list(
+            'pk', 'user_id', 'email', 'status', 'total_amount', 'created_at'))
+        order_ids = [row[0] for row in rows]
+        with rollup_change(order_ids):
+            changed = Order.objects.filter(pk__in=order_ids).update(status=status, updated_at=timezone.now())
+        deltas = {}
+        for _, user_id, email, old_status, total_amount, created_at in rows:
+            before = contribution(user_id, email, old_status, total_amount, created_at)
+            after = contribution(user_id, email, status, total_amount, created_at)
+            delta = deltas.setdefault(after.key, [after.email, 0, 0, Decimal('0')])
+            delta[1] += after.orders - before.orders
+            delta[2] += after.cancelled - before.cancelled
+            delta[3] += after.spend - before.spend
+        for key, (email, orders, cancelled, spend) in deltas.items():
+            _add(key, email, orders, cancelled, spend)
+    return changed
+
+
+def segment_filter(name, now=None):
+    """Q object selecting the CustomerStats rows of a segment from SEGMENTS."""
+    return SEGMENTS[name][1](now or timezone.now())
+
+
+def _totals(rows):
+    totals = {}
+    for row in rows:
+        part = contribution(*row)
+        stats = totals.get(part.key)
+        if stats is None:
+            stats = totals[part.key] = CustomerStats(
+                user_id=part.key[1] if part.key[0] == 'user' else None, email=part.email,
+                first_order_at=part.placed_at, last_order_at=part.placed_at,
+            )
+        stats.order_count += part.orders
+        stats.cancelled_count += part.cancelled
+        stats.lifetime_spend += part.spend
+        stats.first_order_at = min(stats.first_order_at, part.placed_at)
+        if part.placed_at >= stats.last_order_at:
+            stats.last_order_at = part.placed_at
+            stats.email = part.email
+    return totals
+
+
+def _customer_orders(keys):
+    users = [value for kind, value in keys if kind == 'user']
+    emails = [value for kind, value in keys if kind == 'email']
+    return (Order.objects.order_by().annotate(normalized_email=Lower(Trim('email')))
+            .filter(Q(user_id__in=users) | Q(user__isnull=True, normalized_email__in=emails)))
+
+
+def rebuild_customer_stats(chunk_size=2000):
+    """
+    Recompute every CustomerStats row from the orders.
+
+    Orders are streamed in chunks and totalled in memory (one entry per
+    customer) outside any transaction, so checkouts carry on during the
+    scan. The table is then replaced in one short transaction, after
+    recomputing the few customers whose stats changed while the scan ran.
+
+    Returns:
+        int: number of customers
+    """
+    since = timezone.now() - REBUILD_OVERLAP
+    totals = _totals(Order.objects.order_by().values_list(*CONTRIBUTION_FIELDS).iterator(chunk_size=chunk_size))
+
+    for attempt in write_attempts():
+        with attempt:
+            rebuilt = dict(totals)
+            changed = {customer_key(user_id, email) for user_id, email in
+                       CustomerStats.objects.filter(updated_at__gte=since).values_list('user_id', 'email')}
+            if changed:
+                for key in changed:
+                    rebuilt.pop(key, None)
+                rebuilt.update(_totals(_customer_orders(changed).values_list(*CONTRIBUTION_FIELDS)))
+            CustomerStats.objects.all().delete()
+            CustomerStats.objects.bulk_create(rebuilt.values(), batch_size=chunk_size)
+    return len(rebuilt)
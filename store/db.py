@@ -0,0 +1,149 @@
+"""Database connection tuning and write-retry helpers.
+
+SQLite connections are configured through ``connection_created`` with the
+PRAGMAs in ``settings.SQLITE_PRAGMAS`` (WAL journal, relaxed fsync, busy
+timeout, memory-mapped I/O and a larger page cache), so readers no longer
+queue behind writers.
+
+Writers can still collide. ``retry_write`` and ``write_attempts`` rerun a
+whole write transaction with jittered exponential backoff when SQLite
+reports that the database is locked.
+"""
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_pragmas():
+    """The PRAGMAs from ``settings.SQLITE_PRAGMAS`` (none when unset)."""
+    return getattr(settings, 'SQLITE_PRAGMAS', {})
+
+
+def apply_sqlite_pragmas(cursor, pragmas=None):
+    """Run ``PRAGMA name=value`` for each entry on a DB-API cursor."""
+    for name, value in (pragmas if pragmas is not None else sqlite_pragmas()).items():
+        cursor.execute(f"PRAGMA {name}={value}")
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_sqlite_pragmas(cursor)
+
+
+def is_locked_error(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def _backoff(attempt, base_delay, max_delay):
+    # Full jitter keeps retrying writers from waking up in lockstep
+    time.sleep(random.uniform(0, min(max_delay, base_delay * (2 ** attempt))))
+
+
+def retry_write(func=None, *, attempts=5, base_delay=0.05, max_delay=1.0, using=None):
+    """
+    Run the decorated function in a transaction, retrying on "database is locked".
+
+    Usage::
+
+        @retry_write
+        def place_order(...):
+            ...
+
+        @retry_write(attempts=10)
+        def bump_counter(...):
+            ...
+
+    When called inside an existing atomic block the function runs once, as
+    only the outermost transaction can be safely retried.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(*args, **kwargs):
+            for attempt in write_attempts(attempts, base_delay, max_delay, using):
+                with attempt:
+                    result = view_func(*args, **kwargs)
+                if attempt.succeeded:
+                    return result
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+class _WriteAttempt:
+    def __init__(self, number, attempts, base_delay, max_delay, using):
+        self.number = number
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.atomic = transaction.atomic(using=using)
+        self.succeeded = False
+
+    def __enter__(self):
+        # Nothing has run yet if BEGIN itself hits the lock, so just retry it
+        for number in range(self.attempts):
+            try:
+                self.atomic.__enter__()
+                return self
+            except OperationalError as error:
+                if not is_locked_error(error) or number == self.attempts - 1:
+                    raise
+                _backoff(number, self.base_delay, self.max_delay)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.atomic.__exit__(exc_type, exc_value, traceback)
+        except OperationalError as commit_error:
+            # The COMMIT itself can hit the lock
+            if exc_type is not None or not self._retryable(commit_error):
+                raise
+            self._wait()
+            return False
+        if exc_type is None:
+            self.succeeded = True
+            return False
+        if issubclass(exc_type, OperationalError) and self._retryable(exc_value):
+            self._wait()
+            return True  # swallow and let write_attempts() hand out the next attempt
+        return False
+
+    def _retryable(self, error):
+        return is_locked_error(error) and self.number < self.attempts - 1
+
+    def _wait(self):
+        logger.warning("Database locked, retrying write (attempt %d/%d)", self.number + 1, self.attempts)
+        _backoff(self.number, self.base_delay, self.max_delay)
+
+
+def write_attempts(attempts=5, base_delay=0.05, max_delay=1.0, using=None):
+    """
+    Context-manager form of ``retry_write`` for inline blocks::
+
+        for attempt in write_attempts():
+            with attempt:
+                order = Order.objects.create(...)
+                ...
+
+    Each ``with attempt`` is its own transaction. The loop stops after the
+    first successful attempt; the last failure is re-raised.
+    """
+    if connections[using or 'default'].in_atomic_block:
+        attempts = 1
+    for number in range(attempts):
+        attempt = _WriteAttempt(number, attempts, base_delay, max_delay, using)
+        yield attempt
+        if attempt.succeeded:
+            return
@@ -0,0 +1,84 @@
+"""Warehouse pick lists and packing slips for a batch of orders.
+
+The pick list is one grouped query over the batch's items: total units per
+(product, size) and how many orders need them. Packing slips stream the
+orders oldest first in chunks, each chunk with its items in one extra query,
+so a batch of thousands is written out without holding it in memory.
+
+Both come as HTML (one printable page: pick sheet then a slip per order) or
+CSV, as iterators of strings for ``StreamingHttpResponse`` or a file.
+"""
+import csv
+
+from django.db.models import Count, Prefetch, Sum
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Order, OrderItem
+
+FORMATS = ('html', 'csv')
+
+
+def batch(status='processing'):
+    """Orders to fulfil, oldest first (read off ``order_status_created_idx``)."""
+    return Order.objects.filter(status=status).order_by('created_at', 'id')
+
+
+def pick_list(orders):
+    """
+    Units to pick per product size for ``orders``, in one grouped query.
+
+    Returns:
+        list: dicts with ``product__name``, ``size__name``, ``units`` and ``orders``
+    """
+    return list(
+        OrderItem.objects.filter(order__in=orders.order_by().values('pk'))
+        .values('product_id', 'product__name', 'size__name')
+        .annotate(units=Sum('quantity'), orders=Count('order', distinct=True))
+        .order_by('product__name', 'size__name')
+    )
+
+
+def _with_items(orders, chunk_size):
+    items = Prefetch('items', queryset=OrderItem.objects.select_related('product', 'size').order_by('id'))
+    return orders.prefetch_related(items).iterator(chunk_size=chunk_size)
+
+
+class _Line:
+    """File-like object for csv.writer that hands back each row."""
+
+    def write(self, value):
+        return value
+
+
+def pick_list_csv(orders):
+    writer = csv.writer(_Line())
+    yield writer.writerow(['product', 'size', 'units', 'orders'])
+    for row in pick_list(orders):
+        yield writer.writerow([row['product__name'], row['size__name'] or '', row['units'], row['orders']])
+
+
+def packing_slips_csv(orders, chunk_size=500):
+    """One row per order item, with the order's shipping details."""
+    writer = csv.writer(_Line())
+    yield writer.writerow(['order_id', 'created_at', 'full_name', 'phone', 'address', 'city', 'state', 'pincode',
+                           'payment_method', 'product', 'size', 'quantity'])
+    for order in _with_items(orders, chunk_size):
+        for item in order.items.all():
+            yield writer.writerow([
+                order.order_id, timezone.localtime(order.created_at).strftime('%Y-%m-%d %H:%M'), order.full_name,
+                order.phone, order.address, order.city, order.state, order.pincode, order.payment_method,
+                item.product.name, item.size.name if item.size else '', item.quantity,
+            ])
+
+
+def batch_html(orders, chunk_size=500):
+    """Printable pick sheet followed by one packing slip per order (page break between)."""
+    yield render_to_string('store/fulfilment/pick_sheet.html', {
+        'rows': pick_list(orders),
+        'order_count': orders.count(),
+        'generated_at': timezone.localtime(),
+    })
+    for order in _with_items(orders, chunk_size):
+        yield render_to_string('store/fulfilment/packing_slip.html', {'order': order, 'items': order.items.all()})
+    yield '</body>\n</html>\n'
@@ -0,0 +1,72 @@
+"""Idempotent order placement.
+
+Every checkout flow carries a ``session_id`` in its URL. Together with the
+browser session it forms the idempotency key stored (unique) on the Order,
+so a double click, retry or back-button resubmit of "place order" returns
+the order that was already created instead of pricing and writing a new one.
+
+Completed keys are also cached for ``CHECKOUT_IDEMPOTENCY_TTL`` seconds so a
+replay is answered without touching the database, and a short in-flight
+marker makes a duplicate that arrives while the first submit is still
+running wait for its result.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Order
+
+IN_FLIGHT_SECONDS = 30
+
+
+def checkout_key(request, session_id):
+    """Idempotency key for one checkout flow of one browser session."""
+    raw = f"{request.session.session_key or ''}:{session_id}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _done_key(key):
+    return f'checkout:done:{key}'
+
+
+def _in_flight_key(key):
+    return f'checkout:in-flight:{key}'
+
+
+def completed_order_id(key):
+    """order_id of the order already placed with ``key``, or None."""
+    order_id = cache.get(_done_key(key))
+    if order_id is None:
+        order_id = Order.objects.filter(checkout_key=key).values_list('order_id', flat=True).first()
+        if order_id is not None:
+            remember_order(key, order_id)
+    return order_id
+
+
+def remember_order(key, order_id):
+    cache.set(_done_key(key), order_id, getattr(settings, 'CHECKOUT_IDEMPOTENCY_TTL', 15 * 60))
+
+
+def claim(key):
+    """True if this request is now the only one placing the order for ``key``."""
+    return cache.add(_in_flight_key(key), 1, IN_FLIGHT_SECONDS)
+
+
+def release(key):
+    cache.delete(_in_flight_key(key))
+
+
+def wait_for_order(key, timeout=10.0, interval=0.1):
+    """Wait for a concurrent submit of ``key`` to finish; its order_id, or None if it failed."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        order_id = cache.get(_done_key(key))
+        if order_id is not None:
+            return order_id
+        if cache.get(_in_flight_key(key)) is None:
+            # The other submit finished without an order (or with one we can look up)
+            return completed_order_id(key)
+        time.sleep(interval)
+    return completed_order_id(key)
@@ -0,0 +1,157 @@
+"""Pre-generated image derivatives for product photos.
+
+Every uploaded ``Product.image`` gets a fixed set of resized copies (thumbnail,
+card and detail widths) in both WebP and JPEG. The copies are written next to
+the original, e.g. ``products/ghee.jpg`` -> ``products/ghee_jpg_card.webp``, so
+templates and the admin never have to ship the full-size upload.
+
+``Product.image_variants`` records which image the copies were made from.
+Rendering trusts it rather than asking the storage whether each copy exists,
+so a listing costs no file system (or remote storage) calls; until the copies
+of the current image are made, the original is served.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> target width in pixels (height keeps the aspect ratio)
+IMAGE_VARIANTS = {
+    'thumb': 100,
+    'card': 400,
+    'detail': 900,
+}
+
+# Output format -> (file extension, Pillow format name, save options)
+IMAGE_FORMATS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def derivative_name(name, variant, fmt='webp'):
+    """Return the storage name of a derivative of the image stored at ``name``."""
+    stem, source_extension = os.path.splitext(name)
+    # The source extension stays in the name, so ghee.jpg and ghee.png never share copies
+    if source_extension:
+        stem = f"{stem}_{source_extension[1:].lower()}"
+    extension = IMAGE_FORMATS[fmt][0]
+    return f"{stem}_{variant}.{extension}"
+
+
+def generate_derivatives(name, storage=None, overwrite=False):
+    """
+    Create all size/format derivatives for one stored image.
+
+    Args:
+        name: Storage name of the original image (e.g. 'products/ghee.jpg')
+        storage: Storage backend to read from and write to (default_storage if None)
+        overwrite: Regenerate derivatives that already exist
+
+    Returns:
+        list: Storage names of the derivatives that were written
+    """
+    from PIL import Image, ImageOps
+
+    storage = storage or default_storage
+    written = []
+
+    with storage.open(name, 'rb') as original:
+        source = Image.open(original)
+        source = ImageOps.exif_transpose(source)
+        source.load()
+
+    for variant, width in IMAGE_VARIANTS.items():
+        resized = None
+        for fmt, (_, pil_format, options) in IMAGE_FORMATS.items():
+            target = derivative_name(name, variant, fmt)
+            if not overwrite and storage.exists(target):
+                continue
+
+            if resized is None:
+                resized = source.copy()
+                # thumbnail() never upscales, so small originals keep their size
+                resized.thumbnail((width, width * 4), Image.LANCZOS)
+
+            image = resized
+            if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+
+            buffer = BytesIO()
+            image.save(buffer, pil_format, **options)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(buffer.getvalue()))
+            written.append(target)
+
+    return written
+
+
+def delete_derivatives(name, storage=None):
+    """Remove every derivative of the image stored at ``name``."""
+    storage = storage or default_storage
+    for variant in IMAGE_VARIANTS:
+        for fmt in IMAGE_FORMATS:
+            target = derivative_name(name, variant, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+
+
+def update_product_derivatives(product):
+    """
+    Generate the derivatives of a product's current image if they are not recorded yet.
+
+    Copies of a replaced image are deleted unless another product still uses
+    it, and ``product.image_variants`` is updated without saving the product.
+
+    Returns:
+        list: Storage names of the derivatives that were written
+    """
+    from .models import Product
+
+    name = product.image.name if product.image else ''
+    previous = product.image_variants
+    if previous == name:
+        return []
+    written = []
+    if name:
+        # A reused name may still have copies of an earlier file
+        written = generate_derivatives(name, storage=product.image.storage, overwrite=True)
+    if previous and not Product.objects.filter(image=previous).exclude(pk=product.pk).exists():
+        delete_derivatives(previous, storage=product.image.storage)
+    Product.objects.filter(pk=product.pk).update(image_variants=name)
+    product.image_variants = name
+    return written
+
+
+def has_derivatives(image):
+    """Whether the derivatives of an image field's current file have been generated."""
+    return bool(image) and getattr(image.instance, 'image_variants', None) == image.name
+
+
+def variant_url(image, variant, fmt='jpeg'):
+    """
+    URL of a derivative for an ImageField value, falling back to the original.
+
+    The fallback keeps pages working for images uploaded before derivatives
+    existed and not yet backfilled with ``generate_image_variants``.
+    """
+    if not image:
+        return ''
+    if has_derivatives(image):
+        return image.storage.url(derivative_name(image.name, variant, fmt))
+    return image.url
+
+
+def srcset(image, fmt='webp'):
+    """Build a ``srcset`` attribute value covering every generated width."""
+    if not has_derivatives(image):
+        return ''
+    return ', '.join(
+        f"{image.storage.url(derivative_name(image.name, variant, fmt))} {width}w"
+        for variant, width in IMAGE_VARIANTS.items()
+    )
@@ -0,0 +1,175 @@
+"""GST invoices, rendered in the background and stored once per order.
+
+``manage.py generate_invoices`` finds orders that are being fulfilled and
+have no invoice yet, renders them in batches across a process pool, and
+stores each document in ``Invoice``. Requests only ever read the stored
+HTML; nothing is rendered on the request path. The unique ``Invoice.order``
+means a second worker, or a rerun, never replaces an invoice.
+
+Prices include GST. Each line's taxable value is backed out of its
+inclusive amount in paise, so the lines always add up to the order total.
+"""
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Invoice, Order
+from .money import to_paise, to_rupees
+
+# Orders invoiced once they are being fulfilled
+INVOICE_STATUSES = ('processing', 'shipped', 'delivered')
+
+
+def invoice_number(order):
+    """``INV/<financial year>/<order pk>``, e.g. INV/2026-27/000123 (Indian FY starts in April)."""
+    placed = timezone.localdate(order.created_at)
+    year = placed.year if placed.month >= 4 else placed.year - 1
+    return f"INV/{year}-{(year + 1) % 100:02d}/{order.pk:06d}"
+
+
+def pending_orders():
+    """Orders that should have an invoice and do not yet."""
+    return Order.objects.filter(status__in=INVOICE_STATUSES, invoice__isnull=True).order_by('pk')
+
+
+def _line(description, hsn, quantity, amount, rate):
+    # amount * 100 / (100 + rate), rounded half up to the paisa
+    inclusive = 100 + rate
+    taxable = (amount * 200 + inclusive) // (inclusive * 2)
+    return {
+        'description': description,
+        'hsn': hsn,
+        'quantity': quantity,
+        'taxable': taxable,
+        'tax': amount - taxable,
+        'amount': amount,
+    }
+
+
+def invoice_context(order, items):
+    """
+    Template context for an order's invoice, with every amount in rupees.
+
+    Args:
+        order: The Order
+        items: Its OrderItems, with ``product`` and ``size`` loaded
+    """
+    seller = getattr(settings, 'INVOICE_SELLER', {})
+    hsn = getattr(settings, 'INVOICE_HSN', '')
+    rate = getattr(settings, 'INVOICE_GST_PERCENT', 0)
+
+    lines = []
+    for item in items:
+        name = f"{item.product.name} ({item.size})" if item.size else item.product.name
+        lines.append(_line(name, hsn, item.quantity, to_paise(item.price) * item.quantity, rate))
+    if order.coupon_discount:
+        lines.append(_line("Discount", hsn, None, -to_paise(order.coupon_discount), rate))
+    if order.shipping_cost:
+        lines.append(_line("Shipping", '', None, to_paise(order.shipping_cost), rate))
+    # Gift wrap and anything else charged on top, so the lines add up to the total
+    other = to_paise(order.total_amount) - sum(line['amount'] for line in lines)
+    if other:
+        lines.append(_line("Other charges", '', None, other, rate))
+
+    taxable = sum(line['taxable'] for line in lines)
+    tax = sum(line['tax'] for line in lines)
+    intra_state = bool(seller.get('state')) and seller['state'].strip().lower() == order.state.strip().lower()
+    cgst = tax // 2 if intra_state else 0
+    totals = {
+        'taxable': taxable,
+        'cgst': cgst,
+        'sgst': tax - cgst if intra_state else 0,
+        'igst': 0 if intra_state else tax,
+        'tax': tax,
+        'total': taxable + tax,
+    }
+    for line in lines:
+        for key in ('taxable', 'tax', 'amount'):
+            line[key] = to_rupees(line[key])
+    return {
+        'order': order,
+        'number': invoice_number(order),
+        'issued_on': timezone.localdate(),
+        'seller': seller,
+        'rate': rate,
+        'half_rate': rate / 2,
+        'intra_state': intra_state,
+        'lines': lines,
+        'totals': {key: to_rupees(value) for key, value in totals.items()},
+    }
+
+
+def render_invoices(order_ids):
+    """
+    Render the invoices of ``order_ids`` (two queries for the whole batch).
+
+    Returns:
+        list: Unsaved Invoice objects
+    """
+    orders = Order.objects.filter(pk__in=order_ids).prefetch_related('items__product', 'items__size')
+    invoices = []
+    for order in orders:
+        context = invoice_context(order, order.items.all())
+        html = render_to_string('store/invoice.html', context)
+        invoices.append(Invoice(order_id=order.pk, number=context['number'], html=html,
+                                etag=hashlib.sha256(html.encode()).hexdigest()[:32]))
+    return invoices
+
+
+def _init_worker():
+    # Spawned workers (macOS/Windows) start without a configured Django
+    import django
+    django.setup()
+
+
+def _render_batch(order_ids):
+    # Pool processes only render; the parent writes, so rows are stored once
+    return [(invoice.order_id, invoice.number, invoice.html, invoice.etag) for invoice in render_invoices(order_ids)]
+
+
+def generate_invoices(workers=None, batch_size=50, limit=None):
+    """
+    Render and store the invoices of all pending orders.
+
+    Args:
+        workers: Worker processes (defaults to the CPU count); 0 renders in this process
+        batch_size: Orders rendered per task
+        limit: Most orders to invoice in this run
+
+    Returns:
+        int: number of invoices this run stored (any stored first by an overlapping run are kept, not counted)
+    """
+    order_ids = list(pending_orders().values_list('pk', flat=True)[:limit])
+    batches = [order_ids[n:n + batch_size] for n in range(0, len(order_ids), batch_size)]
+    if not batches:
+        return 0
+
+    rendered_count = 0
+
+    def store(invoices):
+        # ignore_conflicts: an order invoiced meanwhile by another run keeps its invoice.
+        # bulk_create returns every object it was given, so count the rows instead.
+        stored = Invoice.objects.filter(order_id__in=[invoice.order_id for invoice in invoices])
+        with transaction.atomic():
+            before = stored.count()
+            Invoice.objects.bulk_create(invoices, ignore_conflicts=True)
+            return stored.count() - before
+
+    if workers == 0:
+        for batch in batches:
+            rendered_count += store(render_invoices(batch))
+        return rendered_count
+
+    # Forked workers must not share this process's database connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for rendered in pool.map(_render_batch, batches):
+            rendered_count += store([
+                Invoice(order_id=order_id, number=number, html=html, etag=etag)
+                for order_id, number, html, etag in rendered
+            ])
+    return rendered_count
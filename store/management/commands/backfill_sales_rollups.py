@@ -0,0 +1,17 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from store.rollups import backfill
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily/monthly sales rollups from the orders (whole months; default all history)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=date.fromisoformat, help="First day, YYYY-MM-DD")
+        parser.add_argument('--to', dest='end', type=date.fromisoformat, help="Last day, YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        rows = backfill(options['start'], options['end'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} daily rollup rows"))
@@ -0,0 +1,75 @@
+import json
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from store.money import percent_off, to_json, to_paise
+
+
+def _decimal_cart(prices, discounts, quantities):
+    """The old approach: Decimal arithmetic throughout."""
+    subtotal = Decimal('0')
+    for price, discount, quantity in zip(prices, discounts, quantities):
+        unit = price * (Decimal('1') - Decimal(discount) / Decimal('100'))
+        subtotal += Decimal(str(unit)) * quantity
+    shipping = Decimal('0') if subtotal >= 1000 else Decimal('50')
+    return subtotal + shipping
+
+
+def _paise_cart(prices, discounts, quantities):
+    subtotal = 0
+    for price, discount, quantity in zip(prices, discounts, quantities):
+        subtotal += percent_off(price, discount) * quantity
+    shipping = 0 if subtotal >= 100000 else 5000
+    return subtotal + shipping
+
+
+def _decimal_catalog(prices, discounts):
+    return json.dumps({
+        n: {'price': float(price * (Decimal('1') - Decimal(discount) / Decimal('100'))), 'original_price': float(price)}
+        for n, (price, discount) in enumerate(zip(prices, discounts))
+    })
+
+
+def _paise_catalog(prices, discounts):
+    return json.dumps({
+        n: {'price': to_json(percent_off(price, discount)), 'original_price': to_json(price)}
+        for n, (price, discount) in enumerate(zip(prices, discounts))
+    })
+
+
+def _timed(func, *args, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+class Command(BaseCommand):
+    help = "Benchmark Decimal vs integer-paise arithmetic for cart pricing and catalog JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000, help="Cart lines / catalog entries")
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        items, repeat = options['items'], options['repeat']
+        prices = [Decimal(rng.randint(10000, 200000)) / 100 for _ in range(items)]
+        discounts = [rng.choice((0, 5, 10, 15, 25)) for _ in range(items)]
+        quantities = [rng.randint(1, 5) for _ in range(items)]
+        prices_paise = [to_paise(price) for price in prices]
+
+        runs = (
+            ('cart', _timed(_decimal_cart, prices, discounts, quantities, repeat=repeat),
+             _timed(_paise_cart, prices_paise, discounts, quantities, repeat=repeat)),
+            ('catalog', _timed(_decimal_catalog, prices, discounts, repeat=repeat),
+             _timed(_paise_catalog, prices_paise, discounts, repeat=repeat)),
+        )
+        for label, decimal_ms, paise_ms in runs:
+            self.stdout.write(
+                f"{label:>8}: Decimal {decimal_ms:8.3f} ms  paise {paise_ms:8.3f} ms  "
+                f"({decimal_ms / paise_ms:.1f}x faster)"
+            )
@@ -0,0 +1,54 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from store.shipping import ShippingIndex, Zone
+
+
+def _build(factory):
+    """Build with ``factory`` and return (result, bytes allocated)."""
+    tracemalloc.start()
+    result = factory()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def _timed(lookup, queries):
+    start = time.perf_counter()
+    for pincode in queries:
+        lookup(pincode)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+class Command(BaseCommand):
+    help = "Benchmark the array-backed pincode index against a plain dict (synthetic data, no database)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pincodes', type=int, default=20000)
+        parser.add_argument('--lookups', type=int, default=200000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        zones = [Zone(n, f'Z{n}', f'Zone {n}', True, ((500, 4000), (1000, 6000)), 3000) for n in range(1, 6)]
+        pincodes = rng.sample(range(110001, 855118), options['pincodes'])
+        rows = [(pincode, rng.randint(1, 5), rng.random() > 0.02, rng.random() > 0.1) for pincode in pincodes]
+
+        index, index_bytes = _build(lambda: ShippingIndex(None, zones, rows))
+        by_position = {zone.id: zone for zone in zones}
+        table, dict_bytes = _build(lambda: {
+            str(pincode): (serviceable, cod, by_position[zone_id]) for pincode, zone_id, serviceable, cod in rows
+        })
+
+        # Half known pincodes, half random (mostly unknown) ones, as typed by customers
+        queries = [str(rng.choice(pincodes)) for _ in range(options['lookups'] // 2)]
+        queries += [str(rng.randint(110001, 855117)) for _ in range(options['lookups'] // 2)]
+        rng.shuffle(queries)
+
+        index_us = _timed(index.lookup, queries)
+        dict_us = _timed(table.get, queries)
+        self.stdout.write(f"{len(index)} pincodes, {len(queries)} lookups")
+        self.stdout.write(f"  array index: {index_us:6.2f} us/lookup  {index_bytes / 1024:8.0f} KiB")
+        self.stdout.write(f"  dict:        {dict_us:6.2f} us/lookup  {dict_bytes / 1024:8.0f} KiB")
@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.db import apply_sqlite_pragmas, is_locked_error, sqlite_pragmas
+
+
+def _run(path, pragmas, readers, writers, duration):
+    """Hammer a SQLite file with concurrent readers and writers for `duration` seconds."""
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def connect():
+        # isolation_level=None: we issue BEGIN/COMMIT ourselves, like Django's atomic()
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        apply_sqlite_pragmas(conn.cursor(), pragmas)
+        return conn
+
+    def reader():
+        conn = connect()
+        done = 0
+        while time.monotonic() < stop:
+            conn.execute("SELECT COUNT(*), SUM(total) FROM bench_order WHERE id > ?",
+                         (done % 1000,)).fetchone()
+            done += 1
+        conn.close()
+        with lock:
+            counts['reads'] += done
+
+    def writer():
+        conn = connect()
+        done = locked = 0
+        while time.monotonic() < stop:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("INSERT INTO bench_order (email, total) VALUES (?, ?)", ('a@example.com', 999))
+                conn.execute("UPDATE bench_counter SET value = value + 1 WHERE id = 1")
+                conn.execute("COMMIT")
+                done += 1
+            except sqlite3.OperationalError as e:
+                if not is_locked_error(e):
+                    raise
+                locked += 1
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+        conn.close()
+        with lock:
+            counts['writes'] += done
+            counts['locked'] += locked
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+class Command(BaseCommand):
+    help = "Benchmark concurrent SQLite read/write throughput with default vs tuned PRAGMAs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds per run")
+        parser.add_argument('--rows', type=int, default=10000, help="Rows to seed before each run")
+
+    def handle(self, *args, **options):
+        runs = (
+            ('default', {}),
+            ('tuned', sqlite_pragmas()),
+        )
+        for label, pragmas in runs:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                conn = sqlite3.connect(path)
+                conn.execute("CREATE TABLE bench_order (id INTEGER PRIMARY KEY, email TEXT, total INTEGER)")
+                conn.execute("CREATE TABLE bench_counter (id INTEGER PRIMARY KEY, value INTEGER)")
+                conn.execute("INSERT INTO bench_counter VALUES (1, 0)")
+                conn.executemany("INSERT INTO bench_order (email, total) VALUES (?, ?)",
+                                 (('seed@example.com', n) for n in range(options['rows'])))
+                conn.commit()
+                conn.close()
+
+                counts = _run(path, pragmas, options['readers'], options['writers'], options['duration'])
+
+            duration = options['duration']
+            self.stdout.write(
+                f"{label:>8}: {counts['reads'] / duration:10.0f} reads/s  "
+                f"{counts['writes'] / duration:8.0f} writes/s  "
+                f"{counts['locked']} 'database is locked' errors"
+            )
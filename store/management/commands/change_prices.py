@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.price_changes import MODELS, MODES, PriceChangeError, change_prices, preview_prices
+
+
+class Command(BaseCommand):
+    help = "Change the price or discount of a filtered set of products or size stocks in one UPDATE"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=MODELS, default='product')
+        parser.add_argument('--field', default='price', help="price, or for products discount_percent")
+        parser.add_argument('--mode', choices=MODES, required=True,
+                            help="percent: change by AMOUNT %%; amount: add AMOUNT; set: set to AMOUNT")
+        parser.add_argument('--amount', required=True)
+        parser.add_argument('--category', help="Only products in this category (slug)")
+        parser.add_argument('--sale', type=int, help="Only products in this sale (id)")
+        parser.add_argument('--product', type=int, action='append', help="Only this product id (repeatable)")
+        parser.add_argument('--size', help="Only this size name, e.g. 500g (size stocks only)")
+        parser.add_argument('--dry-run', action='store_true', help="Show what would change without writing")
+
+    def handle(self, *args, **options):
+        prefix = '' if options['target'] == 'product' else 'product__'
+        rows = MODELS[options['target']].objects.all()
+        filters = []
+        if options['category']:
+            rows = rows.filter(**{f'{prefix}categories__slug': options['category']})
+            filters.append(f"category={options['category']}")
+        if options['sale']:
+            rows = rows.filter(**{f'{prefix}sale_items__sale': options['sale']})
+            filters.append(f"sale={options['sale']}")
+        if options['product']:
+            rows = rows.filter(**{f'{prefix}pk__in': options['product']})
+            filters.append(f"product={','.join(map(str, options['product']))}")
+        if options['size']:
+            if options['target'] != 'stock':
+                raise CommandError("--size needs --target stock")
+            rows = rows.filter(size__name=options['size'])
+            filters.append(f"size={options['size']}")
+        rows = rows.distinct()
+
+        change = (options['field'], options['mode'], options['amount'])
+        try:
+            if options['dry_run']:
+                count, sample = preview_prices(rows, *change)
+                self.stdout.write(f"{count} row(s) would change")
+                for label, old, new in sample:
+                    self.stdout.write(f"  {label}: {old} -> {new}")
+                return
+            result = change_prices(rows, *change, selection=f"manage.py change_prices {' '.join(filters)}".strip())
+        except PriceChangeError as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(f"Changed {result.rows} row(s): {result}"))
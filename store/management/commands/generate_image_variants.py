@@ -0,0 +1,56 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from store.images import generate_derivatives
+from store.models import Product
+
+
+def _init_worker():
+    # Spawned workers (macOS/Windows) start without a configured Django
+    import django
+    django.setup()
+
+
+def _generate(name, overwrite):
+    return generate_derivatives(name, overwrite=overwrite)
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail/card/detail WebP and JPEG variants for existing product images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Number of worker processes (defaults to the CPU count)")
+        parser.add_argument('--overwrite', action='store_true',
+                            help="Regenerate variants of images that already have them")
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='')
+        if not options['overwrite']:
+            products = products.exclude(image_variants=F('image'))
+        names = sorted(set(products.values_list('image', flat=True)))
+        if not names:
+            self.stdout.write("No product images need variants.")
+            return
+
+        written = 0
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            futures = {pool.submit(_generate, name, options['overwrite']): name for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    created = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"Failed {name}: {e}")
+                    continue
+                written += len(created)
+                Product.objects.filter(image=name).update(image_variants=name)
+                self.stdout.write(f"{name}: {len(created)} variant(s) written")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {len(names)} image(s), wrote {written} variant(s), {failed} failure(s)"
+        ))
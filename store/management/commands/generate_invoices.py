@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from store.invoices import generate_invoices
+
+
+class Command(BaseCommand):
+    help = "Render and store invoices for orders being fulfilled (run under a process supervisor or cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Invoice the pending orders once and exit (for cron)")
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds between checks for new orders")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Number of worker processes (defaults to the CPU count; 0 renders in-process)")
+        parser.add_argument('--batch-size', type=int, default=50, help="Orders rendered per worker task")
+        parser.add_argument('--limit', type=int, default=None, help="Most orders to invoice per round")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            rendered = generate_invoices(workers=options['workers'], batch_size=options['batch_size'],
+                                         limit=options['limit'])
+            if rendered or options['once']:
+                self.stdout.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} rendered {rendered} invoice(s)")
+            if options['once']:
+                return
+            time.sleep(options['interval'])
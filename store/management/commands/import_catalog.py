@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.catalog_import import CatalogImportError, import_catalog
+
+
+class Command(BaseCommand):
+    help = ("Create or update products, categories, sizes and size stock from a CSV, JSON or JSON lines feed "
+            "(one row per product size, streamed; see store/catalog_import.py for the columns)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('feed')
+        parser.add_argument('--batch-size', type=int, default=1000, help="Feed rows per round of queries")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change, then roll back")
+        parser.add_argument('--show-errors', type=int, default=20, help="Skipped rows to list")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            catalog = import_catalog(options['feed'], batch_size=options['batch_size'], dry_run=options['dry_run'])
+        except CatalogImportError as e:
+            raise CommandError(e)
+
+        for number, message in catalog.errors[:options['show_errors']]:
+            self.stderr.write(f"row {number}: {message}")
+        if len(catalog.errors) > options['show_errors']:
+            self.stderr.write(f"... and {len(catalog.errors) - options['show_errors']} more")
+        for key, count in sorted(catalog.report.items()):
+            self.stdout.write(f"  {key}: {count}")
+        verb = "Checked" if options['dry_run'] else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {catalog.report['rows']} rows in {time.perf_counter() - started:.1f}s, "
+            f"{len(catalog.errors)} skipped{' (dry run, nothing saved)' if options['dry_run'] else ''}"
+        ))
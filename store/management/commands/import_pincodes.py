@@ -0,0 +1,74 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from store.models import Pincode, ShippingZone
+from store.shipping import get_shipping_index, invalidate_shipping_index, parse_pincode
+
+TRUE_VALUES = {'1', 'y', 'yes', 'true', 't'}
+
+
+def _flag(row, column):
+    value = (row.get(column) or '').strip().lower()
+    return value in TRUE_VALUES if value else True
+
+
+class Command(BaseCommand):
+    help = ("Load the pincode serviceability table from CSV. Columns: pincode, zone (zone code) and "
+            "optionally serviceable and cod (yes/no, default yes). Unknown zones are created.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument('--replace', action='store_true', help="Delete pincodes missing from the file")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as f:
+                reader = csv.DictReader(f)
+                missing = {'pincode', 'zone'} - set(reader.fieldnames or ())
+                if missing:
+                    raise CommandError(f"Missing column(s): {', '.join(sorted(missing))}")
+                rows = {}
+                skipped = 0
+                for row in reader:
+                    pincode = parse_pincode(row['pincode'])
+                    zone = (row['zone'] or '').strip()
+                    if pincode is None or not zone:
+                        skipped += 1
+                        continue
+                    rows[pincode] = (zone, _flag(row, 'serviceable'), _flag(row, 'cod'))
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['csv_file']}: {e}")
+
+        with transaction.atomic():
+            zones = {zone.code: zone for zone in ShippingZone.objects.all()}
+            for code in sorted({zone for zone, _, _ in rows.values()} - set(zones)):
+                zones[code] = ShippingZone.objects.create(code=code, name=code)
+                self.stdout.write(f"Created zone {code}; set its rates in the admin")
+
+            Pincode.objects.bulk_create(
+                [
+                    Pincode(pincode=pincode, zone=zones[zone], is_serviceable=serviceable, cod_available=cod)
+                    for pincode, (zone, serviceable, cod) in rows.items()
+                ],
+                batch_size=options['batch_size'],
+                update_conflicts=True,
+                unique_fields=['pincode'],
+                update_fields=['zone', 'is_serviceable', 'cod_available'],
+            )
+            removed = 0
+            if options['replace']:
+                existing = set(Pincode.objects.values_list('pincode', flat=True))
+                stale = sorted(existing - set(rows))
+                for start in range(0, len(stale), options['batch_size']):
+                    removed += Pincode.objects.filter(pincode__in=stale[start:start + options['batch_size']]).delete()[0]
+            # bulk writes send no signals
+            transaction.on_commit(invalidate_shipping_index)
+
+        index = get_shipping_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {len(rows)} pincodes ({skipped} rows skipped, {removed} removed); "
+            f"index holds {len(index)} pincodes in {index.nbytes() / 1024:.0f} KiB"
+        ))
@@ -0,0 +1,111 @@
+import statistics
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+
+from store.models import Order, ProductStock
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = ("Simulate many shoppers adding to cart and checking out at once, and report latency. "
+            "Creates real orders: run it against a scratch database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50)
+        parser.add_argument('--stock', type=int, help="ProductStock id to buy (defaults to the first one in stock)")
+        parser.add_argument('--rate', type=float, help="Override ADMISSION_RATE for this run")
+        parser.add_argument('--max-concurrent', type=int, help="Override ADMISSION_MAX_CONCURRENT for this run")
+        parser.add_argument('--timeout', type=float, default=120.0, help="Give up on a shopper after this many seconds")
+
+    def handle(self, *args, **options):
+        stock = (ProductStock.objects.filter(pk=options['stock']) if options['stock']
+                 else ProductStock.objects.filter(quantity__gt=0)).select_related('product').first()
+        if stock is None:
+            raise CommandError("No product stock to buy")
+
+        overrides = {}
+        if options['rate'] is not None:
+            overrides['ADMISSION_RATE'] = options['rate']
+        if options['max_concurrent'] is not None:
+            overrides['ADMISSION_MAX_CONCURRENT'] = options['max_concurrent']
+
+        # Allows the 'testserver' host and keeps order emails in memory
+        setup_test_environment()
+        user, _ = User.objects.get_or_create(username='loadtest', defaults={'email': 'loadtest@example.com'})
+        orders_before = Order.objects.count()
+
+        results = []
+        lock = threading.Lock()
+        start = threading.Barrier(options['clients'])
+
+        def shopper(number):
+            client = Client()
+            client.force_login(user)
+            timings = {'waits': 0, 'requests': []}
+            deadline = time.monotonic() + options['timeout']
+
+            def request(method, url, data=None):
+                # Retry through the waiting room until admitted or out of time
+                while time.monotonic() < deadline:
+                    began = time.perf_counter()
+                    response = getattr(client, method)(url, data or {})
+                    timings['requests'].append(time.perf_counter() - began)
+                    if response.status_code == 302 and reverse('waiting_room') in response.url:
+                        timings['waits'] += 1
+                        client.get(reverse('waiting_room_status'))
+                        time.sleep(0.2)
+                        continue
+                    return response
+                return None
+
+            start.wait()
+            began = time.perf_counter()
+            url = f"{reverse('checkout')}?session_id=loadtest-{number}"
+            ok = (
+                request('post', reverse('cart'), {'product_id': stock.product_id, 'size_id': stock.size_id, 'quantity': 1})
+                and request('post', url + '&step=address', {
+                    'first_name': 'Load', 'last_name': f'Test {number}', 'email': 'loadtest@example.com',
+                    'phone': '9876543210', 'address': '1 Test Street', 'city': 'Mumbai',
+                    'state': 'Maharashtra', 'zipcode': '400001',
+                })
+                and request('post', url + '&step=payment', {'payment_method': 'cod'})
+                and request('post', url + '&step=review', {'place_order': '1'})
+            )
+            timings['total'] = time.perf_counter() - began
+            timings['ok'] = bool(ok)
+            close_old_connections()
+            with lock:
+                results.append(timings)
+
+        with override_settings(**overrides):
+            threads = [threading.Thread(target=shopper, args=(n,)) for n in range(options['clients'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        latencies = [t * 1000 for result in results for t in result['requests']]
+        totals = [result['total'] for result in results]
+        self.stdout.write(
+            f"{sum(r['ok'] for r in results)}/{len(results)} shoppers finished, "
+            f"{Order.objects.count() - orders_before} orders created, "
+            f"{sum(r['waits'] for r in results)} waiting-room redirects"
+        )
+        self.stdout.write(
+            f"request latency: p50 {_percentile(latencies, 50):.0f} ms  p95 {_percentile(latencies, 95):.0f} ms  "
+            f"p99 {_percentile(latencies, 99):.0f} ms  max {max(latencies, default=0):.0f} ms"
+        )
+        self.stdout.write(f"time to order: median {statistics.median(totals):.1f} s  max {max(totals):.1f} s")
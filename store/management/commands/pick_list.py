@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.fulfilment import FORMATS, batch, batch_html, packing_slips_csv, pick_list_csv
+
+
+class Command(BaseCommand):
+    help = "Write the pick list and packing slips for all orders in a status (default: processing)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', default='processing')
+        parser.add_argument('--format', choices=FORMATS, default='html',
+                            help="html: pick sheet and packing slips; csv: pick list (see --slips)")
+        parser.add_argument('--slips', action='store_true', help="With --format csv, write the packing slips instead")
+        parser.add_argument('--output', '-o', help="File to write (default: stdout)")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Orders read per database round trip")
+
+    def handle(self, *args, **options):
+        orders = batch(options['status'])
+        if options['format'] == 'html':
+            parts = batch_html(orders, chunk_size=options['chunk_size'])
+        elif options['slips']:
+            parts = packing_slips_csv(orders, chunk_size=options['chunk_size'])
+        else:
+            parts = pick_list_csv(orders)
+
+        if not options['output']:
+            for part in parts:
+                self.stdout.write(part, ending='')
+            return
+        try:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+                out.writelines(parts)
+        except OSError as error:
+            raise CommandError(error)
+        self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}"))
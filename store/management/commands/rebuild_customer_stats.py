@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store.customers import rebuild_customer_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the customer stats table from all orders (after imports or raw SQL changes to orders)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Orders read per database round trip")
+
+    def handle(self, *args, **options):
+        customers = rebuild_customer_stats(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {customers} customers"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.stock import refresh_product_stock, stock_drift
+
+
+class Command(BaseCommand):
+    help = "Set every product's stock to the total of its size stocks where the two have drifted apart"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="List the drifted products without fixing them")
+        parser.add_argument('--show', type=int, default=20, help="Drifted products to list")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = list(stock_drift().order_by('pk').values_list('pk', 'name', 'stock_quantity', 'size_total'))
+            for pk, name, quantity, total in drifted[:options['show']]:
+                self.stdout.write(f"  {name} (#{pk}): {quantity} -> {total}")
+            if len(drifted) > options['show']:
+                self.stdout.write(f"  ... and {len(drifted) - options['show']} more")
+            if options['dry_run']:
+                self.stdout.write(f"{len(drifted)} product(s) have drifted (dry run, nothing saved)")
+                return
+            refresh_product_stock(pk for pk, *_ in drifted)
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {len(drifted)} product(s)"))
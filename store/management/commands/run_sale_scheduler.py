@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from store.sales import next_boundary, refresh_effective_prices
+
+
+class Command(BaseCommand):
+    help = "Refresh effective prices at every flash sale start and end (run under a process supervisor or cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Refresh once and exit (for cron)")
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help="Longest sleep between refreshes, so edits to running sales are picked up")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            changes = refresh_effective_prices()
+            if changes:
+                self.stdout.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} updated {changes} effective price(s)")
+            if options['once']:
+                return
+
+            delay = options['interval']
+            boundary = next_boundary()
+            if boundary is not None:
+                delay = min(delay, max((boundary - timezone.now()).total_seconds(), 0))
+            time.sleep(delay)
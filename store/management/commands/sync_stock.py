@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from store.catalog_import import CatalogImportError
+from store.stock_sync import sync_stock
+
+
+class Command(BaseCommand):
+    help = ("Apply supplier stock levels from a CSV, JSON or JSON lines feed (slug or name, size, quantity), "
+            "then check the feed again every few minutes")
+
+    def add_arguments(self, parser):
+        parser.add_argument('feed')
+        parser.add_argument('--once', action='store_true', help="Sync once and exit (for cron)")
+        parser.add_argument('--interval', type=float, default=300.0, help="Seconds between checks of the feed")
+        parser.add_argument('--force', action='store_true', help="Apply the feed even if it was applied before")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change, then roll back")
+        parser.add_argument('--batch-size', type=int, default=500, help="Size stocks per UPDATE")
+        parser.add_argument('--show-changes', type=int, default=20, help="Changed size stocks to list")
+
+    def handle(self, *args, **options):
+        once = options['once'] or options['dry_run']
+        force = options['force']
+        while True:
+            close_old_connections()
+            try:
+                result = sync_stock(options['feed'], batch_size=options['batch_size'], force=force,
+                                    dry_run=options['dry_run'])
+            except (CatalogImportError, OSError) as e:
+                if once:
+                    raise CommandError(e)
+                self.stderr.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} {e}")
+                result = None
+            else:
+                force = False
+                if result is None:
+                    if once:
+                        self.stdout.write("Feed unchanged since the last sync (use --force to apply it again)")
+                else:
+                    self.report(result, options)
+            if once:
+                return
+            time.sleep(options['interval'])
+
+    def report(self, result, options):
+        for number, message in result.errors[:options['show_changes']]:
+            self.stderr.write(f"row {number}: {message}")
+        for slug, size, old, new in result.changes[:options['show_changes']]:
+            self.stdout.write(f"  {slug} {size}: {old} -> {new}")
+        if len(result.changes) > options['show_changes']:
+            self.stdout.write(f"  ... and {len(result.changes) - options['show_changes']} more")
+        counts = ', '.join(f"{count} {key}" for key, count in sorted(result.report.items()) if key != 'rows')
+        self.stdout.write(self.style.SUCCESS(
+            f"{timezone.now():%Y-%m-%d %H:%M:%S} {result.report['rows']} rows: {counts or 'nothing to apply'}, "
+            f"{len(result.errors)} skipped{' (dry run, nothing saved)' if options['dry_run'] else ''}"
+        ))
@@ -0,0 +1,436 @@
+"""Middleware for the store project."""
+import logging
+import mimetypes
+import os
+import re
+import secrets
+import stat
+import struct
+import time
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+from . import routers
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# collectstatic's manifest storage inserts a 12 hex digit content hash
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^/]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+# Accept-Encoding token -> suffix written by store.storage.compress_file
+PRECOMPRESSED_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def parse_accept_encoding(header):
+    """
+    Parse an ``Accept-Encoding`` header.
+
+    Returns:
+        dict: content coding (lower-cased) -> q-value; a malformed q-value counts as 0
+    """
+    codings = {}
+    for item in header.split(','):
+        coding, *params = item.split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value.strip())
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def accepts_encoding(codings, coding):
+    """Whether parsed ``Accept-Encoding`` codings allow ``coding`` (directly or through ``*``)."""
+    return codings.get(coding, codings.get('*', 0.0)) > 0
+
+
+def _stream_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+class StaticFilesMiddleware:
+    """
+    Serve STATIC_ROOT and MEDIA_ROOT from the application process.
+
+    Requests that do not match a file fall through to the rest of the stack.
+    Whole files go out as ``FileResponse`` so the WSGI server can use
+    ``wsgi.file_wrapper`` (``os.sendfile`` under gunicorn/uWSGI). Supports:
+
+    * ``.br``/``.gz`` siblings chosen by ``Accept-Encoding``
+    * ``If-None-Match`` (304) and single ``Range`` requests (206/416), with
+      ``If-Range`` so a stale validator gets the whole current file
+    * immutable cache headers for content-hashed static files
+    * ``X-Accel-Redirect`` hand-off when ``STATIC_SERVE_ACCEL_REDIRECT`` is set,
+      mapping each URL prefix to an nginx ``internal`` location
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.roots = []
+        if settings.STATIC_URL and settings.STATIC_ROOT:
+            self.roots.append((settings.STATIC_URL, str(settings.STATIC_ROOT), True))
+        if settings.MEDIA_URL and settings.MEDIA_ROOT:
+            self.roots.append((settings.MEDIA_URL, str(settings.MEDIA_ROOT), False))
+        self.max_age = getattr(settings, 'STATIC_SERVE_MAX_AGE', 60)
+        self.accel_redirect = getattr(settings, 'STATIC_SERVE_ACCEL_REDIRECT', {})
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD'):
+            for url_prefix, root, is_static in self.roots:
+                if request.path.startswith(url_prefix):
+                    response = self.serve(request, url_prefix, root, is_static)
+                    if response is not None:
+                        return response
+        return self.get_response(request)
+
+    def serve(self, request, url_prefix, root, is_static):
+        relative_path = request.path[len(url_prefix):]
+        try:
+            path = safe_join(root, relative_path)
+        except SuspiciousFileOperation:
+            return None
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(stat_result.st_mode):
+            return None
+
+        content_type, _ = mimetypes.guess_type(path)
+        content_type = content_type or 'application/octet-stream'
+        range_header = request.headers.get('Range')
+        if range_header and not self._if_range_matches(request.headers.get('If-Range'), stat_result):
+            range_header = None
+
+        # Ranges are always served from the identity representation
+        encoding = None
+        if not range_header:
+            accepted = parse_accept_encoding(request.headers.get('Accept-Encoding', ''))
+            for token, suffix in PRECOMPRESSED_ENCODINGS:
+                if accepts_encoding(accepted, token):
+                    try:
+                        compressed_stat = os.stat(path + suffix)
+                    except OSError:
+                        continue
+                    encoding = token
+                    path += suffix
+                    relative_path += suffix
+                    stat_result = compressed_stat
+                    break
+
+        size = stat_result.st_size
+        etag = self._etag(stat_result, encoding)
+
+        if is_static and HASHED_NAME_RE.search(path):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            cache_control = f'public, max-age={self.max_age}'
+
+        headers = {
+            'ETag': etag,
+            'Last-Modified': http_date(stat_result.st_mtime),
+            'Cache-Control': cache_control,
+            'Accept-Ranges': 'bytes',
+            'Vary': 'Accept-Encoding',
+        }
+        if encoding:
+            headers['Content-Encoding'] = encoding
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in if_none_match):
+            response = HttpResponse(status=304)
+            for header, value in headers.items():
+                response[header] = value
+            return response
+
+        prefix = self._accel_prefix(request.path)
+        if prefix:
+            # The proxy streams the file and handles Range itself
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = prefix + relative_path
+            for header, value in headers.items():
+                response[header] = value
+            return response
+
+        start, length = 0, size
+        if range_header:
+            match = RANGE_RE.match(range_header.strip())
+            if match and (match.group(1) or match.group(2)):
+                first, last = match.group(1), match.group(2)
+                if first:
+                    start = int(first)
+                    end = min(int(last), size - 1) if last else size - 1
+                else:
+                    # Suffix range: the last N bytes
+                    start = max(size - int(last), 0)
+                    end = size - 1
+                if start > end or start >= size:
+                    response = HttpResponse(status=416)
+                    response['Content-Range'] = f'bytes */{size}'
+                    return response
+                length = end - start + 1
+
+        if length != size:
+            response = StreamingHttpResponse(
+                _stream_range(path, start, length), status=206, content_type=content_type
+            )
+            response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+            response['Content-Length'] = str(length)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response.block_size = CHUNK_SIZE
+            # Assets are displayed inline; the filename would name the .gz/.br file
+            del response['Content-Disposition']
+
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    @staticmethod
+    def _etag(stat_result, encoding=None):
+        return f'"{int(stat_result.st_mtime):x}-{stat_result.st_size:x}{"-" + encoding if encoding else ""}"'
+
+    def _if_range_matches(self, if_range, stat_result):
+        """Whether a Range request may be answered with part of the file (RFC 9110 §13.1.5)."""
+        if not if_range:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith(('"', 'W/')):
+            # Strong comparison: a weak validator never matches
+            return if_range == self._etag(stat_result)
+        return parse_http_date_safe(if_range) == int(stat_result.st_mtime)
+
+    def _accel_prefix(self, request_path):
+        for url_prefix, internal_prefix in self.accel_redirect.items():
+            if request_path.startswith(url_prefix):
+                return internal_prefix
+        return None
+
+
+# Content types that are already compressed; recompressing only burns CPU
+INCOMPRESSIBLE_CONTENT_TYPES = (
+    'image/', 'video/', 'audio/', 'font/woff',
+    'application/zip', 'application/gzip', 'application/x-gzip',
+    'application/pdf', 'application/octet-stream',
+)
+
+
+class _GzipCompressor:
+    """
+    gzip writer with the BREACH mitigation of Django's ``compress_string``.
+
+    A random-length file name in the gzip header changes the response length
+    by 0-``max_random_bytes`` bytes, so compressed sizes no longer reveal how
+    well a guess matches a secret (CSRF token, session data) on the page.
+    Unlike ``compress_sequence`` the deflate stream is flushed after each chunk.
+    """
+
+    def __init__(self, level, max_random_bytes=0):
+        # Raw deflate; the gzip header and trailer are written here
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._crc = 0
+        self._size = 0
+        # magic, deflate, FNAME flag, mtime 0, no extra flags, unknown OS
+        self._header = b'\x1f\x8b\x08\x08\x00\x00\x00\x00\x00\xff'
+        if max_random_bytes:
+            self._header += b'a' * secrets.randbelow(max_random_bytes)
+        self._header += b'\x00'
+
+    def process(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        output = self._header + self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._header = b''
+        return output
+
+    def finish(self):
+        trailer = struct.pack('<II', self._crc, self._size & 0xffffffff)
+        return self._header + self._compressor.flush(zlib.Z_FINISH) + trailer
+
+
+class _BrotliCompressor:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def process(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with brotli (when installed and accepted) or gzip.
+
+    Regular responses smaller than ``COMPRESSION_MIN_SIZE`` and already
+    compressed content types are left alone. Streaming responses are
+    compressed chunk by chunk, flushing after each one so the client still
+    receives data incrementally.
+
+    Against BREACH, gzip output is padded like Django's ``GZipMiddleware``
+    (``COMPRESSION_MAX_RANDOM_BYTES``). Brotli has no room for padding, so
+    responses that vary on ``Cookie`` (session or CSRF token in use) are
+    only ever gzipped.
+
+    Compression CPU time is logged at DEBUG level, and with ``DEBUG`` on
+    also reported in a ``Server-Timing: compress`` header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 512)
+        self.gzip_level = getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+        self.brotli_quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+        self.max_random_bytes = getattr(settings, 'COMPRESSION_MAX_RANDOM_BYTES', 100)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.status_code != 200 or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '')
+        if content_type.startswith(INCOMPRESSIBLE_CONTENT_TYPES):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        # The response varies on Accept-Encoding whether or not we compress it
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        vary = {header.strip().lower() for header in response.get('Vary', '').split(',')}
+        encoding = self._choose_encoding(request.headers.get('Accept-Encoding', ''),
+                                         allow_brotli='cookie' not in vary and '*' not in vary)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._compress_async_stream(
+                    response.streaming_content, encoding, request.path)
+            else:
+                response.streaming_content = self._compress_stream(
+                    response.streaming_content, encoding, request.path)
+            del response['Content-Length']
+        else:
+            started = time.process_time()
+            compressor = self._compressor(encoding)
+            compressed = compressor.process(response.content) + compressor.finish()
+            elapsed_ms = (time.process_time() - started) * 1000
+            if len(compressed) >= len(response.content):
+                return response
+            logger.debug("Compressed %s with %s: %d -> %d bytes in %.2fms CPU",
+                         request.path, encoding, len(response.content), len(compressed), elapsed_ms)
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+            if settings.DEBUG:
+                response['Server-Timing'] = f'compress;dur={elapsed_ms:.2f};desc="{encoding}"'
+
+        # Byte-level changes make a strong ETag invalid; keep it as a weak one
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    def _choose_encoding(self, accept_encoding, allow_brotli=True):
+        accepted = parse_accept_encoding(accept_encoding)
+        if brotli is not None and allow_brotli and accepts_encoding(accepted, 'br'):
+            return 'br'
+        if accepts_encoding(accepted, 'gzip'):
+            return 'gzip'
+        return None
+
+    def _compressor(self, encoding):
+        if encoding == 'br':
+            return _BrotliCompressor(self.brotli_quality)
+        return _GzipCompressor(self.gzip_level, self.max_random_bytes)
+
+    def _compress_stream(self, chunks, encoding, path):
+        compressor = self._compressor(encoding)
+        cpu_time = 0.0
+        for chunk in chunks:
+            started = time.process_time()
+            data = compressor.process(chunk)
+            cpu_time += time.process_time() - started
+            if data:
+                yield data
+        started = time.process_time()
+        data = compressor.finish()
+        cpu_time += time.process_time() - started
+        logger.debug("Compressed stream %s with %s in %.2fms CPU", path, encoding, cpu_time * 1000)
+        yield data
+
+    async def _compress_async_stream(self, chunks, encoding, path):
+        compressor = self._compressor(encoding)
+        cpu_time = 0.0
+        async for chunk in chunks:
+            started = time.process_time()
+            data = compressor.process(chunk)
+            cpu_time += time.process_time() - started
+            if data:
+                yield data
+        started = time.process_time()
+        data = compressor.finish()
+        cpu_time += time.process_time() - started
+        logger.debug("Compressed stream %s with %s in %.2fms CPU", path, encoding, cpu_time * 1000)
+        yield data
+
+
+class ReplicaPinningMiddleware:
+    """
+    Scope ``store.routers`` primary pinning to a single request.
+
+    Unsafe methods and requests carrying the pin cookie read from the primary.
+    A request that writes sets the cookie for ``REPLICA_PIN_SECONDS`` so the
+    follow-up GET after a redirect sees its own writes despite replica lag.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+    def __call__(self, request):
+        pinned = (request.method not in ('GET', 'HEAD', 'OPTIONS')
+                  or routers.PIN_COOKIE in request.COOKIES)
+        pinned_token = routers._pinned.set(pinned)
+        wrote_token = routers._wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if routers._wrote.get() and routers.replica_databases():
+                response.set_cookie(routers.PIN_COOKIE, '1', max_age=self.pin_seconds,
+                                    httponly=True, samesite='Lax')
+        finally:
+            routers._pinned.reset(pinned_token)
+            routers._wrote.reset(wrote_token)
+        return response
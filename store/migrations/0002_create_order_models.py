@@ -10,7 +10,9 @@ class Migration(migrations.Migration):
         ('store', '0001_initial'),
     ]
 
-    operations = [
+    # 0002_order_orderitem creates the same tables on a parallel branch; this
+    # one only updates migration state so a fresh database can be migrated.
+    operations = [migrations.SeparateDatabaseAndState(state_operations=[
         migrations.CreateModel(
             name='Order',
             fields=[
@@ -40,4 +42,4 @@ class Migration(migrations.Migration):
                 ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.product')),
             ],
         ),
-    ]
+    ])]
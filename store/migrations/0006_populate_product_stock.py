@@ -7,10 +7,11 @@ def populate_product_stock(apps, schema_editor):
     Product = apps.get_model('store', 'Product')
     ProductSize = apps.get_model('store', 'ProductSize')
     ProductStock = apps.get_model('store', 'ProductStock')
+    db_alias = schema_editor.connection.alias
     
-    for product in Product.objects.all():
+    for product in Product.objects.using(db_alias).all():
         for size in product.sizes.all():
-            ProductStock.objects.get_or_create(
+            ProductStock.objects.using(db_alias).get_or_create(
                 product=product,
                 size=size,
                 defaults={'quantity': 5}
@@ -19,7 +20,7 @@ def populate_product_stock(apps, schema_editor):
 
 def reverse_populate_product_stock(apps, schema_editor):
     ProductStock = apps.get_model('store', 'ProductStock')
-    ProductStock.objects.all().delete()
+    ProductStock.objects.using(schema_editor.connection.alias).all().delete()
 
 
 class Migration(migrations.Migration):
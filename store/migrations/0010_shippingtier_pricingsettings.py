@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_productstock_price_alter_productsize_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PricingSettings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gift_wrap_cost', models.DecimalField(decimal_places=2, default=50, max_digits=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Pricing settings',
+            },
+        ),
+        migrations.CreateModel(
+            name='ShippingTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_subtotal', models.DecimalField(decimal_places=2, default=0, help_text='Applies to carts with at least this subtotal', max_digits=10)),
+                ('cost', models.DecimalField(decimal_places=2, help_text='Shipping charge (0 = free shipping)', max_digits=10)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['min_subtotal'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+    ]
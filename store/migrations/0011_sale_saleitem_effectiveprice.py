@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:06
+
+import django.db.models.deletion
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+
+def discounted(price, discount_percent):
+    # Same rounding as store.money.percent_off (no sales exist yet)
+    paise = int((price * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    paise -= (paise * discount_percent + 50) // 100
+    return Decimal(paise).scaleb(-2)
+
+
+def populate_effective_prices(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductStock = apps.get_model('store', 'ProductStock')
+    EffectivePrice = apps.get_model('store', 'EffectivePrice')
+    db_alias = schema_editor.connection.alias
+
+    discounts = {}
+    rows = []
+    for product_id, price, discount_percent in Product.objects.using(db_alias).values_list('id', 'price', 'discount_percent'):
+        discounts[product_id] = discount_percent
+        rows.append(EffectivePrice(product_id=product_id, price=discounted(price, discount_percent),
+                                   discount_percent=discount_percent))
+    for product_id, size_id, price in ProductStock.objects.using(db_alias).values_list('product_id', 'size_id', 'price'):
+        if product_id in discounts:
+            rows.append(EffectivePrice(product_id=product_id, size_id=size_id,
+                                       price=discounted(price, discounts[product_id]),
+                                       discount_percent=discounts[product_id]))
+    EffectivePrice.objects.using(db_alias).bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_shippingtier_pricingsettings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sale',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField()),
+                ('is_active', models.BooleanField(default=True, help_text='Untick to cancel the sale')),
+            ],
+            options={
+                'ordering': ['-starts_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SaleItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('discount_percent', models.PositiveIntegerField(help_text='Discount percentage (0-100)')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sale_items', to='store.product')),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='store.sale')),
+                ('size', models.ForeignKey(blank=True, help_text='Leave empty to discount every size', null=True, on_delete=django.db.models.deletion.CASCADE, to='store.productsize')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EffectivePrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('discount_percent', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_prices', to='store.product')),
+                ('size', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='store.productsize')),
+                ('sale', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='store.sale')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'size'), name='unique_effective_price_size'), models.UniqueConstraint(condition=models.Q(('size__isnull', True)), fields=('product',), name='unique_effective_price_product')],
+            },
+        ),
+        migrations.RunPython(populate_effective_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_sale_saleitem_effectiveprice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='checkout_key',
+            field=models.CharField(blank=True, editable=False, help_text='Idempotency key of the checkout flow that placed this order', max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_order_checkout_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShippingZone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('cod_available', models.BooleanField(default=True, help_text='Offer cash on delivery in this zone')),
+                ('extra_per_kg', models.DecimalField(decimal_places=2, default=0, help_text='Added per started kg above the heaviest rate', max_digits=10)),
+            ],
+            options={
+                'ordering': ['code'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Pincode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pincode', models.PositiveIntegerField(unique=True)),
+                ('is_serviceable', models.BooleanField(default=True)),
+                ('cod_available', models.BooleanField(default=True)),
+                ('zone', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pincodes', to='store.shippingzone')),
+            ],
+            options={
+                'ordering': ['pincode'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShippingRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('max_weight_grams', models.PositiveIntegerField()),
+                ('cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('zone', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rates', to='store.shippingzone')),
+            ],
+            options={
+                'ordering': ['zone', 'max_weight_grams'],
+                'unique_together': {('zone', 'max_weight_grams')},
+            },
+        ),
+    ]
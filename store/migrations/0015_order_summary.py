@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:22
+
+from django.db import migrations, models
+
+
+def populate_order_summaries(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+    db_alias = schema_editor.connection.alias
+
+    summaries = {}
+    items = (OrderItem.objects.using(db_alias).order_by('order_id', 'id')
+             .values_list('order_id', 'quantity', 'product__name', 'product__image'))
+    for order_id, quantity, name, image in items.iterator():
+        summary = summaries.setdefault(order_id, {'item_count': 0, 'first_item_name': name, 'first_item_image': image})
+        summary['item_count'] += quantity
+
+    orders = []
+    for order in Order.objects.using(db_alias).filter(id__in=list(summaries)).only('id').iterator():
+        for field, value in summaries[order.id].items():
+            setattr(order, field, value or '')
+        orders.append(order)
+    Order.objects.using(db_alias).bulk_update(orders, ['item_count', 'first_item_name', 'first_item_image'],
+                                              batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='first_item_image',
+            field=models.ImageField(blank=True, editable=False, upload_to='products/'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='first_item_name',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_order_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import Lower, Trim
+
+
+def populate_customer_stats(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    CustomerStats = apps.get_model('store', 'CustomerStats')
+    db_alias = schema_editor.connection.alias
+
+    counted = ~Q(status='cancelled')
+    totals = {
+        'order_count': Count('id', filter=counted),
+        'cancelled_count': Count('id', filter=~counted),
+        'lifetime_spend': Sum('total_amount', filter=counted, default=Decimal('0')),
+        'first_order_at': Min('created_at'),
+        'last_order_at': Max('created_at'),
+    }
+    orders = Order.objects.using(db_alias).order_by()
+    users = orders.filter(user__isnull=False).values('user_id').annotate(email=Lower(Trim(Max('email'))), **totals)
+    guests = (orders.filter(user__isnull=True).annotate(key=Lower(Trim('email'))).values('key')
+              .annotate(**totals).values('key', *totals))
+    rows = [CustomerStats(**row) for row in users]
+    rows += [CustomerStats(email=row.pop('key'), **row) for row in guests]
+    CustomerStats.objects.using(db_alias).bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_order_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.CharField(help_text='Normalized email (latest order email for users)', max_length=254)),
+                ('order_count', models.IntegerField(default=0)),
+                ('cancelled_count', models.IntegerField(default=0)),
+                ('lifetime_spend', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('first_order_at', models.DateTimeField(blank=True, null=True)),
+                ('last_order_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='customer_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Customer stats',
+                'ordering': ['-lifetime_spend'],
+                'indexes': [models.Index(fields=['-lifetime_spend'], name='customer_spend_idx'), models.Index(fields=['-last_order_at'], name='customer_last_order_idx'), models.Index(fields=['order_count'], name='customer_order_count_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('email',), name='unique_guest_customer_stats')],
+            },
+        ),
+        migrations.RunPython(populate_customer_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_customerstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='size',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='store.productsize'),
+        ),
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('start', models.DateField(help_text='The day, or the first day of the month')),
+                ('payment_method', models.CharField(max_length=20)),
+                ('order_count', models.IntegerField(default=0)),
+                ('cancelled_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.IntegerField(default=0)),
+                ('coupon_orders', models.IntegerField(default=0)),
+                ('coupon_discount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['period', '-start', 'payment_method'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'start', 'payment_method'), name='unique_sales_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('start', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.product')),
+                ('size', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='store.productsize')),
+            ],
+            options={
+                'ordering': ['period', '-start', '-revenue'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'start', 'product', 'size'), name='unique_product_sales_rollup'), models.UniqueConstraint(condition=models.Q(('size__isnull', True)), fields=('period', 'start', 'product'), name='unique_product_sales_rollup_nosize')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_invoice'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.CharField(choices=[('product', 'Products'), ('stock', 'Size stocks')], max_length=10)),
+                ('field', models.CharField(choices=[('price', 'Price'), ('discount_percent', 'Discount %')], max_length=20)),
+                ('mode', models.CharField(choices=[('percent', 'Change by %'), ('amount', 'Change by amount'), ('set', 'Set to')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('rows', models.PositiveIntegerField(default=0, help_text='Rows updated')),
+                ('selection', models.TextField(blank=True, help_text='Which rows were changed')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
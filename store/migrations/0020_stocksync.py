@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_pricechange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Feed the stock levels came from', max_length=255)),
+                ('feed_hash', models.CharField(help_text='SHA-256 of the feed, so an unchanged feed is skipped', max_length=64)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('changed', models.PositiveIntegerField(default=0, help_text='Size stocks whose quantity changed')),
+                ('unknown', models.PositiveIntegerField(default=0, help_text='Rows naming a product size that has no stock row')),
+                ('skipped', models.PositiveIntegerField(default=0, help_text='Rows that could not be read')),
+                ('report', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['source', '-created_at'], name='stocksync_source_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:50
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+
+
+def total_size_stocks(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductStock = apps.get_model('store', 'ProductStock')
+    db_alias = schema_editor.connection.alias
+    total = (ProductStock.objects.using(db_alias).filter(product=OuterRef('pk')).order_by()
+             .values('product').annotate(total=Sum('quantity')).values('total'))
+    Product.objects.using(db_alias).filter(size_stocks__isnull=False).distinct().update(
+        stock_quantity=Subquery(total))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_stocksync'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='stock_quantity',
+            field=models.PositiveIntegerField(default=1, help_text='Number of items in stock; the total of the size stocks when the product has any'),
+        ),
+        migrations.RunPython(total_size_stocks, migrations.RunPython.noop),
+        # A column cannot be altered into a generated one; the statuses are recomputed from the totals
+        migrations.RemoveField(
+            model_name='product',
+            name='stock_status',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stock_status',
+            field=models.GeneratedField(choices=[('in_stock', 'In Stock'), ('low_stock', 'Low Stock'), ('out_of_stock', 'Out of Stock')], db_persist=True, expression=models.Case(models.When(stock_quantity__lte=0, then=models.Value('out_of_stock')), models.When(stock_quantity__lte=5, then=models.Value('low_stock')), default=models.Value('in_stock')), output_field=models.CharField(max_length=20)),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['stock_status', '-created_at'], name='product_availability_idx'),
+        ),
+    ]
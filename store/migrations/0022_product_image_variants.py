@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_product_stock_aggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_variants',
+            field=models.CharField(blank=True, editable=False, help_text='Image whose size variants have been generated', max_length=100),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from decimal import Decimal
@@ -8,6 +8,8 @@ from django.conf import settings
 import os
 from django.core.exceptions import ValidationError
 
+from .money import percent_of, percent_off, to_paise, to_rupees
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True, null=True, blank=True)
@@ -46,6 +48,15 @@ class ProductSize(models.Model):
     def __str__(self):
         return self.get_name_display()
         
+    @property
+    def grams(self):
+        """Weight of one unit of this size in grams, or None for non-weight sizes."""
+        if self.name.endswith('kg') and self.name[:-2].isdigit():
+            return int(self.name[:-2]) * 1000
+        if self.name.endswith('g') and self.name[:-1].isdigit():
+            return int(self.name[:-1])
+        return None
+        
 class ProductStock(models.Model):
     product = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='size_stocks')
     size = models.ForeignKey(ProductSize, on_delete=models.CASCADE)
@@ -59,6 +70,31 @@ class ProductStock(models.Model):
     def __str__(self):
         return f"{self.product.name} - {self.size} ({self.quantity}) - ₹{self.price}"
 
+    def save(self, *args, **kwargs):
+        # The product's stock total is updated by a post_save signal; keep both in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+# At or below this many items a product is low on stock
+LOW_STOCK = 5
+
+STOCK_STATUS_CHOICES = (
+    ('in_stock', 'In Stock'),
+    ('low_stock', 'Low Stock'),
+    ('out_of_stock', 'Out of Stock'),
+)
+
+# Product.stock_status, computed by the database from stock_quantity
+STOCK_STATUS = models.Case(
+    models.When(stock_quantity__lte=0, then=models.Value('out_of_stock')),
+    models.When(stock_quantity__lte=LOW_STOCK, then=models.Value('low_stock')),
+    default=models.Value('in_stock'),
+)
+
 # Create your models here.
 class Product(models.Model):
     FEATURE_CHOICES = (
@@ -73,16 +109,17 @@ class Product(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(unique=True, null=True, blank=True, help_text="URL-friendly name for product")
     image = models.ImageField(upload_to='products/')
+    image_variants = models.CharField(max_length=100, blank=True, editable=False,
+                                      help_text="Image whose size variants have been generated")
     price = models.DecimalField(max_digits=10, decimal_places=2)
     discount_percent = models.PositiveIntegerField(default=0)
     rating = models.FloatField(default=0)
     num_ratings = models.PositiveIntegerField(default=0)
-    stock_quantity = models.PositiveIntegerField(default=1, help_text="Number of items in stock")
-    stock_status = models.CharField(max_length=20, choices=(
-        ('in_stock', 'In Stock'),
-        ('low_stock', 'Low Stock'),
-        ('out_of_stock', 'Out of Stock'),
-    ), default='in_stock')
+    stock_quantity = models.PositiveIntegerField(
+        default=1, help_text="Number of items in stock; the total of the size stocks when the product has any")
+    # Sorts in order of availability: in_stock, low_stock, out_of_stock
+    stock_status = models.GeneratedField(expression=STOCK_STATUS, output_field=models.CharField(max_length=20),
+                                         db_persist=True, choices=STOCK_STATUS_CHOICES)
     description = models.TextField(blank=True)
     short_description = models.TextField(blank=True, help_text="Brief product description for listings")
     categories = models.ManyToManyField(Category, related_name='products', blank=True)
@@ -94,39 +131,56 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['stock_status', '-created_at'], name='product_availability_idx')]
+
+    @property
+    def discounted_price_paise(self):
+        """Current selling price, including any running sale."""
+        from .pricing import get_pricing_rules
+        price = get_pricing_rules().unit_price(self.id)
+        if price is None:
+            return percent_off(to_paise(self.price), self.discount_percent)
+        return price
 
     @property
     def discounted_price(self):
-        return self.price * (Decimal('1') - Decimal(self.discount_percent) / Decimal('100'))
+        return to_rupees(self.discounted_price_paise)
+
+    @property
+    def current_discount_percent(self):
+        """Discount shown on the storefront: the product's own or a running sale's."""
+        from .pricing import get_pricing_rules
+        return get_pricing_rules().discounts.get(self.id, self.discount_percent)
     
     def get_price_for_size(self, size_id):
-        """Get price for a specific size from ProductStock"""
+        """Get price for a specific size, including any running sale"""
+        from .pricing import get_pricing_rules
+        price = get_pricing_rules().unit_price(self.id, size_id)
+        if price is not None:
+            return to_rupees(price)
         try:
             stock = self.size_stocks.get(size_id=size_id)
             # Apply discount to stock price
-            return stock.price * (Decimal('1') - Decimal(self.discount_percent) / Decimal('100'))
+            return to_rupees(percent_off(to_paise(stock.price), self.discount_percent))
         except ProductStock.DoesNotExist:
             return self.discounted_price
     
     def get_stock_for_size(self, size_id):
-        """Get stock quantity for a specific size"""
-        try:
-            stock = self.size_stocks.get(size_id=size_id)
-            return stock.quantity
-        except ProductStock.DoesNotExist:
+        """Get stock quantity for a specific size (the product's own stock when no size is given)"""
+        if size_id is None:
             return self.stock_quantity
+        stock = self.size_stocks.filter(size_id=size_id).values_list('quantity', flat=True).first()
+        # A size the product has no stock row for is not available
+        return stock or 0
 
     def save(self, *args, **kwargs):
         from django.utils.text import slugify
-        # Automatically update stock status based on quantity
-        # Remove any manual overrides by commenting this condition
-        # and always calculate based on the actual quantity
-        if self.stock_quantity <= 0:
-            self.stock_status = 'out_of_stock'
-        elif self.stock_quantity <= 5:
-            self.stock_status = 'low_stock'
-        else:
-            self.stock_status = 'in_stock'
+        # stock_status follows stock_quantity in the database; with size stocks the
+        # quantity is their total, whatever was set by hand
+        if self.pk:
+            total = self.size_stocks.aggregate(total=models.Sum('quantity'))['total']
+            if total is not None:
+                self.stock_quantity = total
         
         # Generate slug if not provided
         if not self.slug:
@@ -169,17 +223,193 @@ class Coupon(models.Model):
         return self.is_valid() and order_amount >= self.min_amount
     
     def calculate_discount(self, order_amount):
-        if not self.can_apply(order_amount):
+        return to_rupees(self.discount_paise(to_paise(order_amount)))
+    
+    def discount_paise(self, subtotal_paise):
+        """Discount in paise for a subtotal in paise (0 if the coupon cannot be applied)."""
+        if not self.can_apply(to_rupees(subtotal_paise)):
             return 0
         
         if self.discount_percent > 0:
-            discount = (order_amount * self.discount_percent) / 100
+            discount = percent_of(subtotal_paise, self.discount_percent)
             if self.max_discount > 0:
-                discount = min(discount, self.max_discount)
+                discount = min(discount, to_paise(self.max_discount))
         else:
-            discount = self.discount_amount
+            discount = to_paise(self.discount_amount)
+            
+        return min(discount, subtotal_paise)  # Never exceed order amount
+        
+class ShippingTier(models.Model):
+    """Shipping charge for carts whose subtotal is at least ``min_subtotal``."""
+    min_subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0,
+                                       help_text="Applies to carts with at least this subtotal")
+    cost = models.DecimalField(max_digits=10, decimal_places=2, help_text="Shipping charge (0 = free shipping)")
+    is_active = models.BooleanField(default=True)
+    
+    class Meta:
+        ordering = ['min_subtotal']
+        
+    def __str__(self):
+        return f"From ₹{self.min_subtotal}: ₹{self.cost}"
+
+class PricingSettings(models.Model):
+    """Store-wide charges. Only the most recently created row is used."""
+    gift_wrap_cost = models.DecimalField(max_digits=10, decimal_places=2, default=50)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = "Pricing settings"
+        
+    def __str__(self):
+        return f"Gift wrap ₹{self.gift_wrap_cost}"
+
+class ShippingZone(models.Model):
+    """Group of pincodes sharing delivery rates, e.g. local, metro, rest of India."""
+    code = models.CharField(max_length=20, unique=True)
+    name = models.CharField(max_length=100)
+    cod_available = models.BooleanField(default=True, help_text="Offer cash on delivery in this zone")
+    extra_per_kg = models.DecimalField(max_digits=10, decimal_places=2, default=0,
+                                       help_text="Added per started kg above the heaviest rate")
+    
+    class Meta:
+        ordering = ['code']
+        
+    def __str__(self):
+        return self.name
+
+class ShippingRate(models.Model):
+    """Shipping charge to a zone for parcels up to ``max_weight_grams``."""
+    zone = models.ForeignKey(ShippingZone, related_name='rates', on_delete=models.CASCADE)
+    max_weight_grams = models.PositiveIntegerField()
+    cost = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    class Meta:
+        ordering = ['zone', 'max_weight_grams']
+        unique_together = ('zone', 'max_weight_grams')
+        
+    def __str__(self):
+        return f"{self.zone}: up to {self.max_weight_grams}g ₹{self.cost}"
+
+class Pincode(models.Model):
+    """A deliverable (or explicitly blocked) pincode. Loaded with ``import_pincodes``."""
+    pincode = models.PositiveIntegerField(unique=True)
+    zone = models.ForeignKey(ShippingZone, related_name='pincodes', on_delete=models.CASCADE)
+    is_serviceable = models.BooleanField(default=True)
+    cod_available = models.BooleanField(default=True)
+    
+    class Meta:
+        ordering = ['pincode']
+        
+    def __str__(self):
+        return str(self.pincode)
+
+class Sale(models.Model):
+    """A flash sale window. Prices switch at ``starts_at``/``ends_at`` via the sale scheduler."""
+    name = models.CharField(max_length=100)
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    is_active = models.BooleanField(default=True, help_text="Untick to cancel the sale")
+    
+    class Meta:
+        ordering = ['-starts_at']
+        
+    def clean(self):
+        if self.starts_at and self.ends_at and self.ends_at <= self.starts_at:
+            raise ValidationError("The sale must end after it starts.")
+            
+    def is_running(self, now=None):
+        now = now or timezone.now()
+        return self.is_active and self.starts_at <= now < self.ends_at
+        
+    def __str__(self):
+        return self.name
+
+class SaleItem(models.Model):
+    sale = models.ForeignKey(Sale, related_name='items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='sale_items', on_delete=models.CASCADE)
+    size = models.ForeignKey(ProductSize, on_delete=models.CASCADE, null=True, blank=True,
+                             help_text="Leave empty to discount every size")
+    discount_percent = models.PositiveIntegerField(help_text="Discount percentage (0-100)")
+    
+    def clean(self):
+        if self.discount_percent is not None and self.discount_percent > 100:
+            raise ValidationError("Discount cannot exceed 100%.")
             
-        return min(discount, order_amount)  # Never exceed order amount
+    def __str__(self):
+        return f"{self.product.name} {self.size or ''} -{self.discount_percent}%"
+
+class EffectivePrice(models.Model):
+    """
+    Precomputed selling price per product (size empty) and per product size.
+
+    Maintained by ``store.sales.refresh_effective_prices``; the storefront
+    prices everything from this table.
+    """
+    product = models.ForeignKey(Product, related_name='effective_prices', on_delete=models.CASCADE)
+    size = models.ForeignKey(ProductSize, on_delete=models.CASCADE, null=True, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    discount_percent = models.PositiveIntegerField(default=0)
+    sale = models.ForeignKey(Sale, on_delete=models.SET_NULL, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'size'], name='unique_effective_price_size'),
+            models.UniqueConstraint(fields=['product'], condition=models.Q(size__isnull=True),
+                                    name='unique_effective_price_product'),
+        ]
+        
+    def __str__(self):
+        return f"{self.product_id}/{self.size_id or '-'}: ₹{self.price}"
+
+class PriceChange(models.Model):
+    """Audit record of one bulk price or discount change (``store.price_changes``)."""
+    TARGETS = (
+        ('product', 'Products'),
+        ('stock', 'Size stocks'),
+    )
+    FIELDS = (
+        ('price', 'Price'),
+        ('discount_percent', 'Discount %'),
+    )
+    MODES = (
+        ('percent', 'Change by %'),
+        ('amount', 'Change by amount'),
+        ('set', 'Set to'),
+    )
+    
+    target = models.CharField(max_length=10, choices=TARGETS)
+    field = models.CharField(max_length=20, choices=FIELDS)
+    mode = models.CharField(max_length=10, choices=MODES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    rows = models.PositiveIntegerField(default=0, help_text="Rows updated")
+    selection = models.TextField(blank=True, help_text="Which rows were changed")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        
+    def __str__(self):
+        return f"{self.get_target_display()} {self.get_field_display()}: {self.get_mode_display()} {self.amount} ({self.rows} rows)"
+
+class StockSync(models.Model):
+    """One supplier stock feed applied by ``store.stock_sync``."""
+    source = models.CharField(max_length=255, help_text="Feed the stock levels came from")
+    feed_hash = models.CharField(max_length=64, help_text="SHA-256 of the feed, so an unchanged feed is skipped")
+    rows = models.PositiveIntegerField(default=0)
+    changed = models.PositiveIntegerField(default=0, help_text="Size stocks whose quantity changed")
+    unknown = models.PositiveIntegerField(default=0, help_text="Rows naming a product size that has no stock row")
+    skipped = models.PositiveIntegerField(default=0, help_text="Rows that could not be read")
+    report = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['source', '-created_at'], name='stocksync_source_idx')]
+        
+    def __str__(self):
+        return f"{self.source} at {self.created_at:%Y-%m-%d %H:%M}: {self.changed} changed"
         
 class Order(models.Model):
     STATUS_CHOICES = (
@@ -197,7 +427,10 @@ class Order(models.Model):
     )
     
     order_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
-    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    checkout_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False,
+                                    help_text="Idempotency key of the checkout flow that placed this order")
+    # Indexed by order_user_created_idx below
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, db_index=False)
     full_name = models.CharField(max_length=100)
     email = models.EmailField()
     phone = models.CharField(max_length=15)
@@ -215,21 +448,62 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     tracking_number = models.CharField(max_length=50, blank=True, null=True)
     notes = models.TextField(blank=True, null=True, help_text="Additional notes about this order")
+    # Summary for order lists, kept in step with the items (see refresh_summary)
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    first_item_name = models.CharField(max_length=200, blank=True, editable=False)
+    first_item_image = models.ImageField(upload_to='products/', blank=True, editable=False)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         ordering = ['-created_at']
+        # One index per access path, each ending in the default ordering so
+        # the newest rows are read first without a sort (see OrderIndexTests).
+        # track_order's (order_id, email) lookup is served by the unique
+        # order_id index.
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),       # account page
+            models.Index(fields=['-created_at'], name='order_created_idx'),                    # admin list, dates
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),   # admin filters
+            models.Index(fields=['payment_status', '-created_at'], name='order_paid_created_idx'),
+            models.Index(fields=['payment_method', '-created_at'], name='order_method_created_idx'),
+        ]
     
     def __str__(self):
         return f"Order {self.order_id} - {self.full_name}"
         
+    @staticmethod
+    def summary_for(items):
+        """
+        Summary field values for an order with ``items``.
+
+        Args:
+            items: (product, quantity) pairs in display order
+        """
+        items = list(items)
+        first = items[0][0] if items else None
+        return {
+            'item_count': sum(quantity for _, quantity in items),
+            'first_item_name': first.name if first else '',
+            'first_item_image': first.image.name if first else '',
+        }
+        
+    def refresh_summary(self):
+        """Recompute and save the summary from the order's items."""
+        items = self.items.select_related('product').order_by('id')
+        summary = self.summary_for((item.product, item.quantity) for item in items)
+        for field, value in summary.items():
+            setattr(self, field, value)
+        self.save(update_fields=list(summary))
+
+        
     @classmethod
     def export_to_csv(cls):
         """Export all orders to a CSV file"""
         csv_file_path = os.path.join(settings.BASE_DIR, 'order_export.csv')
         
-        orders = cls.objects.all().prefetch_related('items', 'items__product')
+        from .routers import read_replica
+        orders = cls.objects.using(read_replica()).prefetch_related('items', 'items__product')
         
         with open(csv_file_path, 'w', newline='') as csvfile:
             writer = csv.writer(csvfile)
@@ -262,9 +536,120 @@ class Order(models.Model):
         
         return csv_file_path
         
+class CustomerStats(models.Model):
+    """
+    Lifetime order metrics for one customer: a registered user, or a guest
+    identified by normalized email.
+
+    Maintained incrementally by ``store.customers`` as orders are placed,
+    edited or cancelled; ``manage.py rebuild_customer_stats`` recomputes it
+    from the orders. Cancelled orders are left out of the order count and
+    spend.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True,
+                                related_name='customer_stats')
+    email = models.CharField(max_length=254, help_text="Normalized email (latest order email for users)")
+    order_count = models.IntegerField(default=0)
+    cancelled_count = models.IntegerField(default=0)
+    lifetime_spend = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    first_order_at = models.DateTimeField(null=True, blank=True)
+    last_order_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name_plural = "Customer stats"
+        ordering = ['-lifetime_spend']
+        constraints = [
+            models.UniqueConstraint(fields=['email'], condition=models.Q(user__isnull=True),
+                                    name='unique_guest_customer_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['-lifetime_spend'], name='customer_spend_idx'),
+            models.Index(fields=['-last_order_at'], name='customer_last_order_idx'),
+            models.Index(fields=['order_count'], name='customer_order_count_idx'),
+        ]
+        
+    def __str__(self):
+        return self.user.username if self.user_id else self.email
+        
+    @property
+    def average_order_value(self):
+        return (self.lifetime_spend / self.order_count).quantize(Decimal('0.01')) if self.order_count else Decimal('0')
+
+class SalesRollup(models.Model):
+    """
+    Order totals for one day or month and payment method.
+
+    Maintained incrementally by ``store.rollups`` as orders change;
+    ``manage.py backfill_sales_rollups`` recomputes any date range.
+    Cancelled orders only count towards ``cancelled_count``.
+    """
+    PERIODS = (
+        ('day', 'Day'),
+        ('month', 'Month'),
+    )
+    
+    period = models.CharField(max_length=5, choices=PERIODS)
+    start = models.DateField(help_text="The day, or the first day of the month")
+    payment_method = models.CharField(max_length=20)
+    order_count = models.IntegerField(default=0)
+    cancelled_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    coupon_orders = models.IntegerField(default=0)
+    coupon_discount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['period', '-start', 'payment_method']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'start', 'payment_method'], name='unique_sales_rollup'),
+        ]
+        
+    def __str__(self):
+        return f"{self.start} {self.payment_method}: {self.order_count} orders, ₹{self.revenue}"
+
+class ProductSalesRollup(models.Model):
+    """Units and revenue of one product size for one day or month."""
+    period = models.CharField(max_length=5, choices=SalesRollup.PERIODS)
+    start = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    size = models.ForeignKey(ProductSize, on_delete=models.CASCADE, null=True, blank=True)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['period', '-start', '-revenue']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'start', 'product', 'size'], name='unique_product_sales_rollup'),
+            models.UniqueConstraint(fields=['period', 'start', 'product'], condition=models.Q(size__isnull=True),
+                                    name='unique_product_sales_rollup_nosize'),
+        ]
+        
+    def __str__(self):
+        return f"{self.start} {self.product_id}/{self.size_id or '-'}: {self.units} units"
+
+class Invoice(models.Model):
+    """
+    GST invoice of an order, rendered once by ``manage.py generate_invoices``.
+
+    The HTML is stored as rendered and served as is; ``etag`` is its hash.
+    """
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='invoice')
+    number = models.CharField(max_length=30, unique=True)
+    html = models.TextField()
+    etag = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        
+    def __str__(self):
+        return self.number
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    size = models.ForeignKey(ProductSize, on_delete=models.SET_NULL, null=True, blank=True)
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     
@@ -275,4 +660,4 @@ class OrderItem(models.Model):
     def total_price(self):
         if self.price is None:
             return 0
-        return self.price * self.quantity
+        return to_rupees(to_paise(self.price) * self.quantity)
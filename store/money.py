@@ -0,0 +1,49 @@
+"""Money as integer paise.
+
+Prices are stored as ``DecimalField`` rupees in the database, but every
+calculation (cart lines, subtotals, discounts, shipping) works on plain
+``int`` paise, which is exact and much cheaper than ``Decimal``. Convert
+once on the way in (``to_paise``) and once on the way out: ``to_rupees``
+for model fields and templates, ``to_json`` for JSON responses.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+PAISE_PER_RUPEE = 100
+
+_ONE = Decimal('1')
+
+
+def to_paise(amount):
+    """
+    Convert a rupee amount (Decimal, int, float or numeric string) to paise.
+
+    Floats are converted through ``str`` so 0.1 becomes 10 paise, not 9.
+    Fractions of a paisa are rounded half up.
+    """
+    if amount is None:
+        return 0
+    if isinstance(amount, int):
+        return amount * PAISE_PER_RUPEE
+    if not isinstance(amount, Decimal):
+        amount = Decimal(str(amount))
+    return int((amount * PAISE_PER_RUPEE).quantize(_ONE, rounding=ROUND_HALF_UP))
+
+
+def to_rupees(paise):
+    """Paise as a two-place rupee Decimal, for model fields and templates."""
+    return Decimal(paise).scaleb(-2)
+
+
+def to_json(paise):
+    """Paise as a float rupee value for JSON responses."""
+    return paise / PAISE_PER_RUPEE
+
+
+def percent_of(paise, percent):
+    """``percent`` % of an amount, rounded half up to the paisa."""
+    return (paise * percent + 50) // 100
+
+
+def percent_off(paise, percent):
+    """The amount with ``percent`` % taken off, rounded half up to the paisa."""
+    return paise - percent_of(paise, percent)
@@ -0,0 +1,66 @@
+"""Customer order history.
+
+Orders carry a precomputed summary (``item_count``, ``first_item_name``,
+``first_item_image``) written when the order is placed, so order lists need
+no per-order item queries. ``order_history`` pages through a customer's
+orders newest first with a keyset cursor on (created_at, id): a page costs
+the same however far back it is, and is read straight off the
+``order_user_created_idx`` index.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Exists, OuterRef, Prefetch, Q, prefetch_related_objects
+
+from .models import Invoice, Order, OrderItem
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+OrderPage = namedtuple('OrderPage', 'orders next_cursor')
+
+
+def encode_cursor(order):
+    """Opaque cursor for the orders placed before ``order``."""
+    return f"{(order.created_at - EPOCH) // MICROSECOND}-{order.pk}"
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor, or None if it is missing or malformed."""
+    try:
+        micros, pk = (int(part) for part in str(cursor).split('-'))
+    except (TypeError, ValueError):
+        return None
+    return EPOCH + micros * MICROSECOND, pk
+
+
+def order_history(user, cursor=None, per_page=10):
+    """
+    One page of a customer's orders, newest first, with items and products
+    and ``has_invoice`` set.
+
+    Takes two queries however many orders are shown: the orders, then their
+    items joined to the products.
+
+    Args:
+        user: Customer whose orders to list
+        cursor: ``next_cursor`` of the previous page (None for the first page)
+        per_page: Orders per page
+
+    Returns:
+        OrderPage: the orders and the cursor of the next page (None on the last page)
+    """
+    orders = (Order.objects.filter(user=user)
+              .annotate(has_invoice=Exists(Invoice.objects.filter(order=OuterRef('pk'))))
+              .order_by('-created_at', '-id'))
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, pk = position
+        orders = orders.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    # One extra row tells whether there is another page
+    orders = list(orders[:per_page + 1])
+    next_cursor = encode_cursor(orders[per_page - 1]) if len(orders) > per_page else None
+    orders = orders[:per_page]
+    prefetch_related_objects(orders, Prefetch('items', queryset=OrderItem.objects.select_related('product')))
+    return OrderPage(orders, next_cursor)
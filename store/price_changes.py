@@ -0,0 +1,131 @@
+"""Bulk price and discount changes, each compiled to a single UPDATE.
+
+``change_prices`` applies a percentage, amount or absolute change to the
+price or discount of any filtered set of products or size stocks as one
+``UPDATE ... SET price = ROUND(price * 1.1, 2)``: no rows are loaded and no
+``save()`` runs (which for products would also rerun the slug loop). Prices
+are rounded to the paisa and kept at or above zero, discounts within 0-100.
+
+Every change is recorded as a ``PriceChange`` row. The effective prices of
+the products touched are then refreshed, which clears the pricing rules
+once for the whole change. ``preview_prices`` shows old and new values
+without writing anything.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, IntegerField, Value
+from django.db.models.functions import Cast, Greatest, Least, Round
+from django.utils import timezone
+
+from .models import PriceChange, Product, ProductStock
+from .sales import refresh_effective_prices
+
+MODELS = {'product': Product, 'stock': ProductStock}
+TARGET_FIELDS = {'product': ('price', 'discount_percent'), 'stock': ('price',)}
+MODES = tuple(mode for mode, _ in PriceChange.MODES)
+
+
+class PriceChangeError(ValueError):
+    """An invalid target, field, mode or amount."""
+
+
+def _target(model):
+    for target, target_model in MODELS.items():
+        if model is target_model:
+            return target
+    raise PriceChangeError(f"Prices of {model.__name__} cannot be bulk changed")
+
+
+def _amount(amount):
+    try:
+        amount = Decimal(str(amount))
+    except InvalidOperation:
+        raise PriceChangeError(f"Not a number: {amount!r}")
+    if not amount.is_finite():
+        raise PriceChangeError(f"Not a number: {amount!r}")
+    return amount
+
+
+def new_value(field, mode, amount):
+    """
+    Expression for the changed value of ``field``.
+
+    Args:
+        field: 'price' or 'discount_percent'
+        mode: 'percent' (change by ``amount`` %), 'amount' (add ``amount``) or 'set'
+        amount: Decimal, may be negative for 'percent' and 'amount'
+    """
+    if mode == 'percent':
+        value = F(field) * Value(1 + amount / 100)
+    elif mode == 'amount':
+        value = F(field) + Value(amount)
+    elif mode == 'set':
+        value = Value(amount)
+    else:
+        raise PriceChangeError(f"Unknown mode {mode!r}")
+
+    decimal = DecimalField(max_digits=12, decimal_places=2)
+    if field == 'price':
+        return Greatest(Round(ExpressionWrapper(value, output_field=decimal), 2), Value(Decimal('0.00')),
+                        output_field=decimal)
+    whole = Cast(Round(ExpressionWrapper(value, output_field=decimal)), IntegerField())
+    return Least(Greatest(whole, Value(0)), Value(100))
+
+
+def _validated(queryset, field, mode, amount):
+    target = _target(queryset.model)
+    if field not in TARGET_FIELDS[target]:
+        raise PriceChangeError(f"{target} has no bulk-changeable field {field!r}")
+    if mode not in MODES:
+        raise PriceChangeError(f"Unknown mode {mode!r}")
+    return target, new_value(field, mode, _amount(amount))
+
+
+def preview_prices(queryset, field, mode, amount, limit=20):
+    """
+    What ``change_prices`` would do, without writing.
+
+    Returns:
+        tuple: (number of rows, list of (label, old value, new value) for up to ``limit`` rows)
+    """
+    target, value = _validated(queryset, field, mode, amount)
+    label = ('name',) if target == 'product' else ('product__name', 'size__name')
+    rows = queryset.annotate(new_value=value).values_list(*label, field, 'new_value')[:limit]
+    sample = [(' '.join(str(part) for part in row[:len(label)]), row[-2], row[-1]) for row in rows]
+    return queryset.count(), sample
+
+
+def change_prices(queryset, field, mode, amount, user=None, selection=''):
+    """
+    Change ``field`` of every row of ``queryset`` in one UPDATE.
+
+    Args:
+        queryset: Products or ProductStocks to change
+        field: 'price', or for products also 'discount_percent'
+        mode: 'percent', 'amount' or 'set' (see ``new_value``)
+        amount: The change (or new value for 'set')
+        user: Who made the change, for the audit row
+        selection: Description of the rows, for the audit row
+
+    Returns:
+        PriceChange: the audit row, with ``rows`` updated
+    """
+    target, value = _validated(queryset, field, mode, amount)
+    rows = MODELS[target].objects.filter(pk__in=queryset.values('pk'))
+    changes = {field: value}
+    if target == 'product':
+        changes['updated_at'] = timezone.now()
+        product_ids = set(rows.values_list('pk', flat=True))
+    else:
+        product_ids = set(rows.values_list('product_id', flat=True))
+
+    with transaction.atomic():
+        updated = rows.update(**changes)
+        change = PriceChange.objects.create(
+            target=target, field=field, mode=mode, amount=_amount(amount), rows=updated,
+            selection=selection, user=user if user is not None and user.is_authenticated else None,
+        )
+        # Clears the pricing rules once if any selling price changed
+        refresh_effective_prices(product_ids=product_ids)
+    return change
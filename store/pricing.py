@@ -0,0 +1,186 @@
+"""Cart pricing engine.
+
+All prices the storefront shows or charges come from one compiled
+``PricingRules`` object: per-product and per-size unit prices read from the
+precomputed ``EffectivePrice`` table (product discount and any running sale
+already applied, see ``store.sales``), the shipping tiers and the gift wrap
+charge. It is built once per process and rebuilt only when the pricing
+version in the cache is bumped, which happens whenever effective prices,
+shipping tiers or pricing settings change.
+
+Cart, checkout, the simple cart and the order writer all call
+``price_cart()``, so they always agree on the totals. A product without
+``EffectivePrice`` rows yet (e.g. just loaded with ``loaddata``) is priced
+directly from the catalog by ``compute_effective_prices``, so it can still
+be bought before the next refresh. Once the shipping
+pincode is known, the zone/weight rate from ``store.shipping`` replaces the
+subtotal tier charge (a free-shipping tier still applies).
+
+All amounts are integer paise (see ``store.money``); callers convert with
+``to_rupees`` / ``to_json`` when rendering or saving.
+"""
+import threading
+import uuid
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from .money import to_paise
+from .shipping import get_shipping_index
+
+# Used when no ShippingTier / PricingSettings rows exist, in paise
+DEFAULT_SHIPPING_TIERS = ((0, 5000), (100000, 0))
+DEFAULT_GIFT_WRAP_COST = 5000
+
+VERSION_KEY = 'pricing:version'
+
+PricedLine = namedtuple('PricedLine', 'product_id size_id quantity unit_price total')
+CartQuote = namedtuple('CartQuote', 'lines subtotal coupon_discount shipping_cost gift_wrap_cost total item_count')
+
+_lock = threading.Lock()
+_rules = None
+
+
+class PricingRules:
+    """Compiled, read-only snapshot of every pricing input."""
+
+    def __init__(self, version, product_prices, size_prices, shipping_tiers, gift_wrap_cost, discounts=None):
+        self.version = version
+        self.product_prices = product_prices   # product_id -> unit price (paise)
+        self.size_prices = size_prices         # (product_id, size_id) -> unit price (paise)
+        self.discounts = discounts or {}       # product_id -> discount percent shown
+        # (min_subtotal, cost), highest threshold first for the lookup
+        self.shipping_tiers = sorted(shipping_tiers, reverse=True)
+        self.gift_wrap_cost = gift_wrap_cost
+        self.free_shipping_threshold = min(
+            (threshold for threshold, cost in shipping_tiers if cost == 0), default=None
+        )
+
+    @classmethod
+    def load(cls, version=None):
+        from .models import EffectivePrice, PricingSettings, ShippingTier
+
+        discounts = {}
+        product_prices = {}
+        size_prices = {}
+        rows = EffectivePrice.objects.values_list('product_id', 'size_id', 'price', 'discount_percent')
+        for product_id, size_id, price, discount_percent in rows:
+            if size_id is None:
+                product_prices[product_id] = to_paise(price)
+                discounts[product_id] = discount_percent
+            else:
+                size_prices[(product_id, size_id)] = to_paise(price)
+
+        tiers = [
+            (to_paise(min_subtotal), to_paise(cost))
+            for min_subtotal, cost in ShippingTier.objects.filter(is_active=True).values_list('min_subtotal', 'cost')
+        ]
+        settings_row = PricingSettings.objects.order_by('-id').first()
+        return cls(
+            version,
+            product_prices,
+            size_prices,
+            tiers or list(DEFAULT_SHIPPING_TIERS),
+            to_paise(settings_row.gift_wrap_cost) if settings_row else DEFAULT_GIFT_WRAP_COST,
+            discounts,
+        )
+
+    def unit_price(self, product_id, size_id=None):
+        """Discounted unit price in paise, or None for an unknown product."""
+        if size_id:
+            price = self.size_prices.get((product_id, int(size_id)))
+            if price is not None:
+                return price
+        return self.product_prices.get(product_id)
+
+    @staticmethod
+    def missing_prices(product_ids):
+        """Unit prices (paise) of products the rules do not have yet, keyed like ``size_prices``."""
+        from .sales import compute_effective_prices
+        return {key: to_paise(price)
+                for key, (price, _, _) in compute_effective_prices(product_ids=product_ids).items()}
+
+    def shipping_for(self, subtotal):
+        if subtotal <= 0:
+            return 0
+        for threshold, cost in self.shipping_tiers:
+            if subtotal >= threshold:
+                return cost
+        return 0
+
+    def price_cart(self, cart, gift_wrap=False, coupon=None, pincode=None):
+        """
+        Price session cart items in a single pass.
+
+        Args:
+            cart: Session cart items ({'product_id', 'size_id', 'quantity', ...})
+            gift_wrap: Whether gift wrapping was requested
+            coupon: Coupon to apply, if any (ignored when it cannot be applied)
+            pincode: Shipping pincode, when known, for zone/weight rates
+
+        Returns:
+            CartQuote: per-line prices and the order totals, in paise
+        """
+        items = []
+        for item in cart:
+            product_id = item.get('product_id')
+            if not str(product_id).isdigit():
+                continue
+            size_id = item.get('size_id')
+            size_id = int(size_id) if str(size_id).isdigit() else None
+            items.append((int(product_id), size_id, int(item.get('quantity', 1))))
+        missing = {product_id for product_id, size_id, _ in items if self.unit_price(product_id, size_id) is None}
+        fallback = self.missing_prices(missing) if missing else {}
+
+        lines = []
+        subtotal = 0
+        item_count = 0
+        for product_id, size_id, quantity in items:
+            unit_price = self.unit_price(product_id, size_id)
+            if unit_price is None:
+                unit_price = fallback.get((product_id, size_id), fallback.get((product_id, None)))
+            if unit_price is None:
+                # The product no longer exists
+                continue
+            total = unit_price * quantity
+            lines.append(PricedLine(product_id, size_id, quantity, unit_price, total))
+            subtotal += total
+            item_count += quantity
+
+        coupon_discount = coupon.discount_paise(subtotal) if coupon is not None else 0
+
+        shipping_cost = self.shipping_for(subtotal)
+        if pincode and shipping_cost:
+            index = get_shipping_index()
+            zone_cost = index.rate_for(index.lookup(pincode).zone, index.cart_grams(lines))
+            if zone_cost is not None:
+                shipping_cost = zone_cost
+        gift_wrap_cost = self.gift_wrap_cost if gift_wrap and lines else 0
+        total = subtotal - coupon_discount + shipping_cost + gift_wrap_cost
+        return CartQuote(lines, subtotal, coupon_discount, shipping_cost, gift_wrap_cost, total, item_count)
+
+
+def get_pricing_rules():
+    """Return the current rules, recompiling them if the pricing version changed."""
+    global _rules
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Missing or evicted: start a new version so nobody keeps stale rules
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    rules = _rules
+    if rules is None or rules.version != version:
+        with _lock:
+            if _rules is None or _rules.version != version:
+                _rules = PricingRules.load(version)
+            rules = _rules
+    return rules
+
+
+def invalidate_pricing_rules():
+    """Force every process to recompile its rules on next use."""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def price_cart(cart, gift_wrap=False, coupon=None, pincode=None):
+    return get_pricing_rules().price_cart(cart, gift_wrap=gift_wrap, coupon=coupon, pincode=pincode)
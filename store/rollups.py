@@ -0,0 +1,259 @@
+"""Daily and monthly sales rollups behind the admin sales dashboard.
+
+``SalesRollup`` (per day/month and payment method) and ``ProductSalesRollup``
+(per day/month and product size) hold running totals, so the dashboard reads
+a few hundred small rows instead of aggregating every order.
+
+What an order adds to the rollups is worked out from its saved row and items
+(``order_rollups``). A change to orders is applied as the difference between
+that before and after the change (``rollup_change``), with F() updates in the
+same transaction: the Order / OrderItem signals cover saves and deletes,
+checkout wraps its item insert and ``set_order_status`` its bulk update.
+
+``backfill`` recomputes a date range from the orders with GROUP BY queries,
+replacing what is there, so it can be rerun safely.
+"""
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import Order, OrderItem, ProductSalesRollup, SalesRollup
+
+SALES_FIELDS = ('order_count', 'cancelled_count', 'revenue', 'units', 'coupon_orders', 'coupon_discount')
+PRODUCT_FIELDS = ('units', 'revenue')
+
+# Order fields that change what an order adds to the rollups
+TRACKED_FIELDS = ('status', 'payment_method', 'total_amount', 'coupon_discount', 'created_at')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def order_rollups(order_ids, items=True):
+    """
+    Rollup totals of the given orders as currently saved.
+
+    Args:
+        order_ids: Orders to total
+        items: False to skip reading the items (an order just created has none)
+
+    Returns:
+        dict: ``('sales', day, payment_method)`` -> values of SALES_FIELDS and
+        ``('product', day, product_id, size_id)`` -> values of PRODUCT_FIELDS
+    """
+    totals = {}
+    if not order_ids:
+        return totals
+    orders = Order.objects.filter(pk__in=order_ids).values_list(
+        'pk', 'created_at', 'payment_method', 'status', 'total_amount', 'coupon_discount')
+    counted = {}
+    for pk, created_at, method, status, total_amount, coupon_discount in orders:
+        day = timezone.localdate(created_at)
+        if status == 'cancelled':
+            _add(totals, ('sales', day, method), (0, 1, 0, 0, 0, 0))
+            continue
+        counted[pk] = (day, method)
+        _add(totals, ('sales', day, method),
+             (1, 0, total_amount, 0, 1 if coupon_discount else 0, coupon_discount))
+
+    if not (items and counted):
+        return totals
+    items = OrderItem.objects.filter(order_id__in=counted).values_list(
+        'order_id', 'product_id', 'size_id', 'quantity', 'price')
+    for order_id, product_id, size_id, quantity, price in items:
+        day, method = counted[order_id]
+        _add(totals, ('sales', day, method), (0, 0, 0, quantity, 0, 0))
+        _add(totals, ('product', day, product_id, size_id), (quantity, (price or 0) * quantity))
+    return totals
+
+
+def _add(totals, key, values, sign=1):
+    current = totals.get(key)
+    if current is None:
+        totals[key] = [sign * value for value in values]
+    else:
+        for n, value in enumerate(values):
+            current[n] += sign * value
+
+
+def _upsert(model, lookup, fields, values):
+    changes = {field: F(field) + value for field, value in zip(fields, values)}
+    if model.objects.filter(**lookup).update(**changes):
+        if any(value < 0 for value in values):
+            # Drop rows taken back to nothing, as a backfill would not write them
+            model.objects.filter(**lookup, **{field: 0 for field in fields}).delete()
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **dict(zip(fields, values)))
+    except IntegrityError:
+        # Created by a concurrent order for the same day
+        model.objects.filter(**lookup).update(**changes)
+
+
+def apply_difference(before, after):
+    """Add ``after - before`` (both from ``order_rollups``) to the day and month rollups."""
+    delta = {}
+    for key, values in after.items():
+        _add(delta, key, values)
+    for key, values in before.items():
+        _add(delta, key, values, sign=-1)
+
+    for (kind, day, *rest), values in delta.items():
+        if not any(values):
+            continue
+        # Each day change also changes its month
+        for period, start in (('day', day), ('month', month_start(day))):
+            if kind == 'sales':
+                _upsert(SalesRollup, {'period': period, 'start': start, 'payment_method': rest[0]},
+                        SALES_FIELDS, values)
+            else:
+                _upsert(ProductSalesRollup,
+                        {'period': period, 'start': start, 'product_id': rest[0], 'size_id': rest[1]},
+                        PRODUCT_FIELDS, values)
+
+
+@contextmanager
+def rollup_change(order_ids):
+    """Apply whatever the block changes about ``order_ids`` to the rollups."""
+    before = order_rollups(order_ids)
+    yield
+    apply_difference(before, order_rollups(order_ids))
+
+
+def _day_bounds(start, end):
+    tz = timezone.get_current_timezone()
+    return (timezone.make_aware(datetime.combine(start, time.min), tz),
+            timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz))
+
+
+def backfill(start=None, end=None):
+    """
+    Recompute the rollups for days ``start``..``end`` (inclusive) and their months.
+
+    Defaults to the whole order history.
+
+    Returns:
+        int: number of day rollup rows written
+    """
+    if start is None or end is None:
+        first = Order.objects.order_by('created_at').values_list('created_at', flat=True).first()
+        if first is None:
+            return 0
+        start = start or timezone.localdate(first)
+        end = end or timezone.localdate()
+    # Whole months, so month rows can be rebuilt from complete day rows
+    start = month_start(start)
+    end = month_start(month_start(end) + timedelta(days=31)) - timedelta(days=1)
+    since, until = _day_bounds(start, end)
+
+    cancelled = Q(status='cancelled')
+    orders = Order.objects.filter(created_at__gte=since, created_at__lt=until).order_by()
+    sales = {
+        (row['day'], row['payment_method']): row
+        for row in orders.annotate(day=TruncDate('created_at')).values('day', 'payment_method').annotate(
+            order_count=Count('id', filter=~cancelled),
+            cancelled_count=Count('id', filter=cancelled),
+            revenue=Sum('total_amount', filter=~cancelled, default=Decimal('0')),
+            coupon_orders=Count('id', filter=~cancelled & Q(coupon_discount__gt=0)),
+            coupon_discount=Sum('coupon_discount', filter=~cancelled, default=Decimal('0')),
+        )
+    }
+    items = (OrderItem.objects.filter(order__created_at__gte=since, order__created_at__lt=until)
+             .exclude(order__status='cancelled').order_by().annotate(day=TruncDate('order__created_at')))
+    for row in items.values('day', 'order__payment_method').annotate(units=Sum('quantity')):
+        sales[(row['day'], row['order__payment_method'])]['units'] = row['units']
+    line_total = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    product_rows = items.values('day', 'product_id', 'size_id').annotate(
+        units=Sum('quantity'), revenue=Sum(line_total, default=Decimal('0')))
+
+    with transaction.atomic():
+        SalesRollup.objects.filter(start__gte=start, start__lte=end).delete()
+        ProductSalesRollup.objects.filter(start__gte=start, start__lte=end).delete()
+        SalesRollup.objects.bulk_create([
+            SalesRollup(period='day', start=day, payment_method=method, units=row.get('units') or 0,
+                        **{field: row[field] for field in SALES_FIELDS if field != 'units'})
+            for (day, method), row in sales.items()
+        ], batch_size=1000)
+        ProductSalesRollup.objects.bulk_create([
+            ProductSalesRollup(period='day', start=row['day'], product_id=row['product_id'], size_id=row['size_id'],
+                               units=row['units'], revenue=row['revenue'])
+            for row in product_rows
+        ], batch_size=1000)
+
+        days = SalesRollup.objects.filter(period='day', start__gte=start, start__lte=end)
+        SalesRollup.objects.bulk_create([
+            SalesRollup(period='month', start=row.pop('month'), **row)
+            for row in days.annotate(month=TruncMonth('start')).values('month', 'payment_method').annotate(
+                **{field: Sum(field) for field in SALES_FIELDS})
+        ])
+        product_days = ProductSalesRollup.objects.filter(period='day', start__gte=start, start__lte=end)
+        ProductSalesRollup.objects.bulk_create([
+            ProductSalesRollup(period='month', start=row.pop('month'), **row)
+            for row in product_days.annotate(month=TruncMonth('start')).values('month', 'product_id', 'size_id')
+            .annotate(**{field: Sum(field) for field in PRODUCT_FIELDS})
+        ], batch_size=1000)
+    return len(sales) + len(product_rows)
+
+
+def _series(rows, starts):
+    by_start = {row['start']: row for row in rows}
+    empty = {'order_count': 0, 'revenue': Decimal('0'), 'units': 0}
+    return [{'start': start, **by_start.get(start, empty)} for start in starts]
+
+
+def dashboard(today=None):
+    """
+    Everything the admin sales dashboard shows, read from the rollup tables only.
+
+    Returns:
+        dict: ``days`` (last 30) and ``months`` (last 12) with orders, revenue
+        and units; ``payment_split``, ``top_products`` and ``summary`` (orders,
+        cancellations, coupon use) over the last 30 days
+    """
+    today = today or timezone.localdate()
+    since = today - timedelta(days=29)
+    this_month = month_start(today)
+    months = [this_month]
+    while len(months) < 12:
+        months.append(month_start(months[-1] - timedelta(days=1)))
+    months.reverse()
+
+    totals = {'order_count': Sum('order_count'), 'revenue': Sum('revenue'), 'units': Sum('units')}
+    day_rows = SalesRollup.objects.filter(period='day', start__gte=since, start__lte=today)
+    days = _series(day_rows.values('start').annotate(**totals).order_by('start'),
+                   [since + timedelta(days=n) for n in range(30)])
+    month_rows = SalesRollup.objects.filter(period='month', start__gte=months[0], start__lte=this_month)
+    months = _series(month_rows.values('start').annotate(**totals).order_by('start'), months)
+
+    split = list(day_rows.values('payment_method').annotate(**totals).order_by('-revenue'))
+    revenue = sum((row['revenue'] for row in split), Decimal('0'))
+    for row in split:
+        row['share'] = round(row['revenue'] * 100 / revenue) if revenue else 0
+
+    top_products = list(
+        ProductSalesRollup.objects.filter(period='day', start__gte=since, start__lte=today)
+        .values('product__name', 'size__name')
+        .annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-revenue')[:10]
+    )
+    coupons = day_rows.aggregate(orders=Sum('coupon_orders', default=0), discount=Sum('coupon_discount', default=0),
+                                 **{key: Sum(key, default=0) for key in ('order_count', 'revenue', 'cancelled_count')})
+    peak = max((day['revenue'] for day in days), default=0) or 1
+    for day in days:
+        day['height'] = round(day['revenue'] * 100 / peak)
+    return {
+        'days': days,
+        'months': months,
+        'payment_split': split,
+        'top_products': top_products,
+        'summary': coupons,
+        'since': since,
+        'today': today,
+    }
@@ -0,0 +1,71 @@
+"""Database router sending catalog reads to read replicas.
+
+Replica aliases are listed in ``settings.REPLICA_DATABASES``. With none
+configured every query goes to ``default``.
+
+Reads of catalog models go to a random replica unless the current request
+is pinned to the primary. A request is pinned when it uses an unsafe HTTP
+method, once it performs any write, and for ``REPLICA_PIN_SECONDS`` after a
+request that wrote (via a cookie set by ``ReplicaPinningMiddleware``), so a
+POST -> redirect -> GET sequence reads its own writes.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+CATALOG_MODELS = {
+    'store.category',
+    'store.product',
+    'store.productsize',
+    'store.productstock',
+    'store.product_categories',
+    'store.product_sizes',
+}
+
+PIN_COOKIE = 'pin_primary'
+
+_pinned = ContextVar('pinned_to_primary', default=False)
+_wrote = ContextVar('wrote_to_primary', default=False)
+
+
+def replica_databases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def read_replica():
+    """Alias to use for explicit read-only work such as exports."""
+    replicas = replica_databases()
+    if not replicas or _pinned.get():
+        return 'default'
+    return random.choice(replicas)
+
+
+def pin_to_primary():
+    """Send every remaining read of the current request to the primary."""
+    _pinned.set(True)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Follow relations on the database the instance came from
+            return instance._state.db
+        if model._meta.label_lower in CATALOG_MODELS:
+            return read_replica()
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        # Sessions are never read from a replica, so saving one needs no pin
+        if model._meta.label_lower != 'sessions.session':
+            _pinned.set(True)
+            _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replica_databases()
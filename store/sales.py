@@ -0,0 +1,144 @@
+"""Scheduled flash sales.
+
+Sales never change prices directly. ``refresh_effective_prices`` works out
+the selling price of every product and product size (the larger of the
+product's own discount and any running sale's) and writes only the rows that
+changed to ``EffectivePrice``. The pricing rules are invalidated only when
+something actually changed, so a sale starting or ending clears the catalog
+caches once, however often the refresh runs.
+
+The ``run_sale_scheduler`` command calls the refresh at every sale boundary.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import EffectivePrice, Product, ProductStock, Sale, SaleItem
+from .money import percent_off, to_paise, to_rupees
+from .pricing import invalidate_pricing_rules
+
+logger = logging.getLogger(__name__)
+
+
+def running_sale_discounts(now=None, product_ids=None):
+    """
+    Best running sale discount per product and per product size.
+
+    Returns:
+        dict: ``(product_id, size_id or None) -> (discount_percent, sale_id)``
+    """
+    now = now or timezone.now()
+    items = SaleItem.objects.filter(
+        sale__is_active=True, sale__starts_at__lte=now, sale__ends_at__gt=now,
+    )
+    if product_ids is not None:
+        items = items.filter(product_id__in=product_ids)
+
+    discounts = {}
+    for product_id, size_id, percent, sale_id in items.values_list('product_id', 'size_id', 'discount_percent', 'sale_id'):
+        key = (product_id, size_id)
+        if percent > discounts.get(key, (0, None))[0]:
+            discounts[key] = (min(percent, 100), sale_id)
+    return discounts
+
+
+def compute_effective_prices(now=None, product_ids=None):
+    """
+    Selling price of every product and product size at ``now``.
+
+    Returns:
+        dict: ``(product_id, size_id or None) -> (price, discount_percent, sale_id)``
+    """
+    sales = running_sale_discounts(now, product_ids)
+    products = Product.objects.all()
+    stocks = ProductStock.objects.all()
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+        stocks = stocks.filter(product_id__in=product_ids)
+
+    def best(base_percent, *keys):
+        percent, sale_id = base_percent, None
+        for key in keys:
+            sale_percent, sale = sales.get(key, (0, None))
+            if sale_percent > percent:
+                percent, sale_id = sale_percent, sale
+        return percent, sale_id
+
+    prices = {}
+    base_discounts = {}
+    for product_id, price, discount_percent in products.values_list('id', 'price', 'discount_percent'):
+        base_discounts[product_id] = discount_percent
+        percent, sale_id = best(discount_percent, (product_id, None))
+        prices[(product_id, None)] = (to_rupees(percent_off(to_paise(price), percent)), percent, sale_id)
+
+    for product_id, size_id, price in stocks.values_list('product_id', 'size_id', 'price'):
+        if product_id not in base_discounts:
+            continue
+        percent, sale_id = best(base_discounts[product_id], (product_id, None), (product_id, size_id))
+        prices[(product_id, size_id)] = (to_rupees(percent_off(to_paise(price), percent)), percent, sale_id)
+    return prices
+
+
+def refresh_effective_prices(now=None, product_ids=None):
+    """
+    Bring ``EffectivePrice`` up to date, writing only rows that changed.
+
+    Args:
+        now: Point in time to price for (defaults to now)
+        product_ids: Limit the refresh to these products
+
+    Returns:
+        int: number of rows created, updated or deleted
+    """
+    wanted = compute_effective_prices(now, product_ids)
+    rows = EffectivePrice.objects.all()
+    if product_ids is not None:
+        rows = rows.filter(product_id__in=product_ids)
+
+    with transaction.atomic():
+        existing = {(row.product_id, row.size_id): row for row in rows.select_for_update()}
+        stale = [row.pk for key, row in existing.items() if key not in wanted]
+        created, updated = [], []
+        for (product_id, size_id), (price, percent, sale_id) in wanted.items():
+            row = existing.get((product_id, size_id))
+            if row is None:
+                created.append(EffectivePrice(
+                    product_id=product_id, size_id=size_id, price=price,
+                    discount_percent=percent, sale_id=sale_id,
+                ))
+            elif (row.price, row.discount_percent, row.sale_id) != (price, percent, sale_id):
+                row.price, row.discount_percent, row.sale_id = price, percent, sale_id
+                row.updated_at = timezone.now()
+                updated.append(row)
+
+        if stale:
+            EffectivePrice.objects.filter(pk__in=stale).delete()
+        if created:
+            EffectivePrice.objects.bulk_create(created)
+        if updated:
+            EffectivePrice.objects.bulk_update(updated, ['price', 'discount_percent', 'sale', 'updated_at'])
+
+        changes = len(stale) + len(created) + len(updated)
+        if changes:
+            invalidate_pricing_rules()
+            transaction.on_commit(invalidate_pricing_rules)
+
+    if changes:
+        logger.info("Effective prices refreshed: %d created, %d updated, %d removed",
+                    len(created), len(updated), len(stale))
+    return changes
+
+
+def next_boundary(now=None):
+    """The next time a sale starts or ends, or None if nothing is scheduled."""
+    now = now or timezone.now()
+    sales = Sale.objects.filter(is_active=True).filter(Q(starts_at__gt=now) | Q(ends_at__gt=now))
+    boundaries = [
+        moment
+        for starts_at, ends_at in sales.values_list('starts_at', 'ends_at')
+        for moment in (starts_at, ends_at)
+        if moment > now
+    ]
+    return min(boundaries, default=None)
@@ -0,0 +1,172 @@
+"""Pincode serviceability and zone/weight shipping rates.
+
+Every deliverable pincode belongs to a ``ShippingZone``; a zone's
+``ShippingRate`` rows price a parcel by weight. The pincode table (tens of
+thousands of rows, loaded from CSV with ``import_pincodes``) is compiled into
+a ``ShippingIndex``: two parallel ``array`` columns, pincodes sorted
+ascending and one packed flags/zone word per pincode, searched with
+``bisect``. That keeps a full Indian pincode list to well under a megabyte
+and a lookup to a few microseconds.
+
+Like the pricing rules, the index is built once per process and rebuilt
+when the shipping version in the cache is bumped (on any zone, rate,
+pincode or size change).
+
+While no pincodes are loaded every well-formed pincode is serviceable and
+shipping falls back to the subtotal ``ShippingTier`` rates.
+"""
+import threading
+import uuid
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from .money import to_paise
+
+VERSION_KEY = 'shipping:version'
+
+# Weight of a cart line whose size has no weight (e.g. a product without sizes)
+DEFAULT_ITEM_GRAMS = 1000
+
+SERVICEABLE = 1
+COD_AVAILABLE = 2
+ZONE_SHIFT = 2
+
+Zone = namedtuple('Zone', 'id code name cod_available rates extra_per_kg')
+Serviceability = namedtuple('Serviceability', 'pincode serviceable cod_available zone')
+
+_lock = threading.Lock()
+_index = None
+
+
+def parse_pincode(value):
+    """The pincode as an int, or None if it is not a 6-digit Indian PIN code."""
+    value = str(value or '').strip()
+    if len(value) != 6 or not value.isdigit() or value[0] == '0':
+        return None
+    return int(value)
+
+
+class ShippingIndex:
+    """Compiled, read-only pincode table and zone rates."""
+
+    def __init__(self, version, zones, pincode_rows, size_grams=None):
+        """
+        Args:
+            version: Shipping version the index was built for
+            zones: Zone tuples; ``rates`` is ((max_grams, cost_paise), ...) ascending
+            pincode_rows: Iterable of (pincode, zone_id, serviceable, cod_available)
+            size_grams: size_id -> grams per unit
+        """
+        self.version = version
+        self.zones = list(zones)
+        self.size_grams = size_grams or {}
+        position = {zone.id: n for n, zone in enumerate(self.zones)}
+
+        rows = sorted(pincode_rows)
+        self.pincodes = array('I', (row[0] for row in rows))
+        self.flags = array('H', (
+            (position[zone_id] << ZONE_SHIFT)
+            | (SERVICEABLE if serviceable else 0)
+            | (COD_AVAILABLE if cod else 0)
+            for _, zone_id, serviceable, cod in rows
+        ))
+
+    @classmethod
+    def load(cls, version=None):
+        from .models import Pincode, ProductSize, ShippingRate, ShippingZone
+
+        rates = {}
+        for zone_id, max_grams, cost in ShippingRate.objects.order_by('max_weight_grams').values_list(
+                'zone_id', 'max_weight_grams', 'cost'):
+            rates.setdefault(zone_id, []).append((max_grams, to_paise(cost)))
+        zones = [
+            Zone(zone.id, zone.code, zone.name, zone.cod_available,
+                 tuple(rates.get(zone.id, ())), to_paise(zone.extra_per_kg))
+            for zone in ShippingZone.objects.all()
+        ]
+        rows = Pincode.objects.values_list('pincode', 'zone_id', 'is_serviceable', 'cod_available').iterator()
+        size_grams = {size.id: size.grams for size in ProductSize.objects.all() if size.grams}
+        return cls(version, zones, rows, size_grams)
+
+    def __len__(self):
+        return len(self.pincodes)
+
+    def nbytes(self):
+        """Memory taken by the pincode columns."""
+        return (len(self.pincodes) * self.pincodes.itemsize) + (len(self.flags) * self.flags.itemsize)
+
+    def lookup(self, pincode):
+        """
+        Serviceability of a pincode.
+
+        Args:
+            pincode: 6-digit pincode (str or int)
+
+        Returns:
+            Serviceability: ``zone`` is None when the pincode is unknown or no
+            pincode table is loaded
+        """
+        number = parse_pincode(pincode)
+        if number is None:
+            return Serviceability(pincode, False, False, None)
+        if not self.pincodes:
+            return Serviceability(number, True, True, None)
+        n = bisect_left(self.pincodes, number)
+        if n == len(self.pincodes) or self.pincodes[n] != number:
+            return Serviceability(number, False, False, None)
+        flags = self.flags[n]
+        zone = self.zones[flags >> ZONE_SHIFT]
+        return Serviceability(
+            number,
+            bool(flags & SERVICEABLE),
+            bool(flags & SERVICEABLE) and bool(flags & COD_AVAILABLE) and zone.cod_available,
+            zone,
+        )
+
+    def cart_grams(self, lines):
+        """Parcel weight of priced cart lines."""
+        return sum(self.size_grams.get(line.size_id, DEFAULT_ITEM_GRAMS) * line.quantity for line in lines)
+
+    def rate_for(self, zone, grams):
+        """
+        Shipping charge in paise for a parcel of ``grams`` to ``zone``.
+
+        Returns:
+            int or None: None when the zone has no rates
+        """
+        if zone is None or not zone.rates:
+            return None
+        for max_grams, cost in zone.rates:
+            if grams <= max_grams:
+                return cost
+        max_grams, cost = zone.rates[-1]
+        extra_kg = -(-(grams - max_grams) // 1000)
+        return cost + extra_kg * zone.extra_per_kg
+
+
+def get_shipping_index():
+    """Return the current index, rebuilding it if the shipping version changed."""
+    global _index
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    index = _index
+    if index is None or index.version != version:
+        with _lock:
+            if _index is None or _index.version != version:
+                _index = ShippingIndex.load(version)
+            index = _index
+    return index
+
+
+def invalidate_shipping_index():
+    """Force every process to rebuild its index on next use."""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def check_pincode(pincode):
+    return get_shipping_index().lookup(pincode)
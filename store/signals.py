@@ -0,0 +1,207 @@
+"""Model signal handlers for the store app."""
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import rollups
+from .coupons import invalidate_coupon
+from .customers import TRACKED_FIELDS, apply_change, order_contribution, stored_contribution
+from .images import delete_derivatives, update_product_derivatives
+from .models import (Coupon, Order, OrderItem, Pincode, PricingSettings, Product, ProductSize, ProductStock,
+                     ShippingRate, ShippingTier, ShippingZone)
+from .pricing import invalidate_pricing_rules
+from .sales import refresh_effective_prices
+from .shipping import invalidate_shipping_index
+from .stock import refresh_product_stock
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Product)
+def create_product_image_derivatives(sender, instance, **kwargs):
+    """Generate thumbnail/card/detail copies when a product image is uploaded or replaced."""
+    if kwargs.get('raw'):
+        return
+    try:
+        update_product_derivatives(instance)
+    except Exception:
+        # A broken upload must not stop the product from being saved
+        logger.exception("Could not generate image derivatives for %s", instance.image.name)
+
+
+@receiver(post_delete, sender=Product)
+def delete_product_image_derivatives(sender, instance, **kwargs):
+    """Remove generated copies together with the product, unless another product shares the image."""
+    if instance.image_variants and not Product.objects.filter(image=instance.image_variants).exists():
+        delete_derivatives(instance.image_variants, storage=instance.image.storage)
+
+
+@receiver(pre_save, sender=Coupon)
+def remember_coupon_code(sender, instance, raw=False, **kwargs):
+    """Note the stored code, so a renamed coupon's old code is dropped from the cache too."""
+    instance._saved_code = None
+    if not raw and instance.pk:
+        instance._saved_code = Coupon.objects.filter(pk=instance.pk).values_list('code', flat=True).first()
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def clear_cached_coupon(sender, instance, **kwargs):
+    invalidate_coupon(instance.code)
+    saved_code = getattr(instance, '_saved_code', None)
+    if saved_code and saved_code != instance.code:
+        invalidate_coupon(saved_code)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductStock)
+@receiver(post_delete, sender=ProductStock)
+def refresh_product_prices(sender, instance, origin=None, raw=False, **kwargs):
+    if raw:
+        # loaddata: the other rows may not be loaded yet. Until run_sale_scheduler
+        # writes their effective prices, price_cart prices these products directly.
+        return
+    if isinstance(origin, Product) or getattr(origin, 'model', None) is Product:
+        # Stock removed along with its product; its prices go with it
+        return
+    # Clears the pricing rules itself if any effective price changed
+    product_id = instance.pk if sender is Product else instance.product_id
+    refresh_effective_prices(product_ids=[product_id])
+
+
+@receiver(post_save, sender=ProductStock)
+@receiver(post_delete, sender=ProductStock)
+def update_product_stock(sender, instance, origin=None, raw=False, **kwargs):
+    """Keep the product's stock total in step with its sizes, in the transaction of the change."""
+    if raw or isinstance(origin, Product) or getattr(origin, 'model', None) is Product:
+        return
+    if not refresh_product_stock([instance.product_id]):
+        # Its last size was removed: nothing is left to sell
+        Product.objects.filter(pk=instance.product_id).update(stock_quantity=0)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ShippingTier)
+@receiver(post_delete, sender=ShippingTier)
+@receiver(post_save, sender=PricingSettings)
+@receiver(post_delete, sender=PricingSettings)
+def clear_pricing_rules(sender, **kwargs):
+    invalidate_pricing_rules()
+    # Again after commit, in case another request recompiled from the old rows
+    transaction.on_commit(invalidate_pricing_rules)
+
+
+@receiver(post_save, sender=ShippingZone)
+@receiver(post_delete, sender=ShippingZone)
+@receiver(post_save, sender=ShippingRate)
+@receiver(post_delete, sender=ShippingRate)
+@receiver(post_save, sender=Pincode)
+@receiver(post_delete, sender=Pincode)
+@receiver(post_save, sender=ProductSize)
+@receiver(post_delete, sender=ProductSize)
+def clear_shipping_index(sender, origin=None, **kwargs):
+    if sender is not ShippingZone and (isinstance(origin, ShippingZone) or getattr(origin, 'model', None) is ShippingZone):
+        # Deleted along with its zone, whose own signal clears the index once
+        return
+    invalidate_shipping_index()
+    transaction.on_commit(invalidate_shipping_index)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_order_summary(sender, instance, origin=None, raw=False, **kwargs):
+    """Keep the order list summary in step with items edited after checkout."""
+    if raw or isinstance(origin, (Order, Product)) or getattr(origin, 'model', None) in (Order, Product):
+        return
+    order = Order.objects.filter(pk=instance.order_id).first()
+    if order is not None:
+        order.refresh_summary()
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_contribution(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._stats_before = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(TRACKED_FIELDS):
+        return
+    instance._stats_before = stored_contribution(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def update_customer_stats(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Apply the order's change to its customer's stats, inside the order's transaction."""
+    if raw:
+        return
+    before = getattr(instance, '_stats_before', None)
+    if before is None and not created:
+        # Nothing tracked changed (update_fields) or the row was missing
+        return
+    apply_change(before, order_contribution(instance))
+
+
+@receiver(pre_delete, sender=Order)
+def remember_deleted_order_contribution(sender, instance, **kwargs):
+    # The instance may be stale (e.g. after set_order_status); use the saved row
+    instance._stats_before = stored_contribution(instance.pk)
+
+
+@receiver(post_delete, sender=Order)
+def remove_customer_stats(sender, instance, **kwargs):
+    apply_change(getattr(instance, '_stats_before', None), None)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_rollup(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._rollup_before = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(rollups.TRACKED_FIELDS):
+        return
+    instance._rollup_before = rollups.order_rollups([instance.pk])
+
+
+@receiver(post_save, sender=Order)
+def update_sales_rollups(sender, instance, created, raw=False, **kwargs):
+    """Apply the order's change to the sales rollups, inside the order's transaction."""
+    if raw:
+        return
+    before = getattr(instance, '_rollup_before', None)
+    if before is None and not created:
+        return
+    rollups.apply_difference(before or {}, rollups.order_rollups([instance.pk], items=not created))
+
+
+@receiver(pre_delete, sender=Order)
+def remember_deleted_order_rollup(sender, instance, **kwargs):
+    # Read before the cascade removes the items
+    instance._rollup_before = rollups.order_rollups([instance.pk])
+
+
+@receiver(post_delete, sender=Order)
+def remove_from_sales_rollups(sender, instance, **kwargs):
+    rollups.apply_difference(getattr(instance, '_rollup_before', None) or {}, {})
+
+
+def _item_cascade(origin):
+    return isinstance(origin, (Order, Product)) or getattr(origin, 'model', None) in (Order, Product)
+
+
+@receiver(pre_save, sender=OrderItem)
+@receiver(pre_delete, sender=OrderItem)
+def remember_order_item_rollup(sender, instance, origin=None, raw=False, **kwargs):
+    instance._rollup_before = None
+    if raw or _item_cascade(origin):
+        return
+    instance._rollup_before = rollups.order_rollups([instance.order_id])
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def update_item_sales_rollups(sender, instance, **kwargs):
+    """Items edited after checkout change the units and product totals of their order's day."""
+    before = getattr(instance, '_rollup_before', None)
+    if before is not None:
+        rollups.apply_difference(before, rollups.order_rollups([instance.order_id]))
@@ -0,0 +1,55 @@
+"""Product-level stock as an aggregate of the per-size ``ProductStock`` rows.
+
+A product with size stock has ``stock_quantity`` equal to the total of its
+sizes; a product without any keeps its own ``stock_quantity``.
+``stock_status`` is a generated column the database derives from
+``stock_quantity`` (``models.STOCK_STATUS``), so it never needs writing.
+
+Saving or deleting a ``ProductStock`` updates its product's total in the
+same transaction (``signals.update_product_stock``). Bulk writers (catalog
+import, supplier stock sync) skip signals and call
+``refresh_product_stock`` once at the end instead: one set-based UPDATE per
+batch of products. ``manage.py reconcile_stock`` runs it over every product
+to repair any drift.
+"""
+from django.db.models import Exists, F, OuterRef, Subquery, Sum
+
+from .models import Product, ProductStock
+
+
+def _size_total():
+    return (ProductStock.objects.filter(product=OuterRef('pk')).order_by()
+            .values('product').annotate(total=Sum('quantity')).values('total'))
+
+
+def _refresh(products):
+    with_sizes = products.filter(Exists(ProductStock.objects.filter(product=OuterRef('pk'))))
+    return with_sizes.update(stock_quantity=Subquery(_size_total()))
+
+
+def refresh_product_stock(product_ids=None, batch_size=1000):
+    """
+    Set ``stock_quantity`` to the total of the product's sizes (``stock_status`` follows).
+
+    Products without size stock keep their own ``stock_quantity``.
+
+    Args:
+        product_ids: Products to refresh (all when None)
+        batch_size: Product ids per UPDATE, to stay within query parameter limits
+
+    Returns:
+        int: number of products whose stock was recomputed
+    """
+    if product_ids is None:
+        return _refresh(Product.objects.all())
+    product_ids = sorted(product_ids)
+    return sum(
+        _refresh(Product.objects.filter(pk__in=product_ids[start:start + batch_size]))
+        for start in range(0, len(product_ids), batch_size)
+    )
+
+
+def stock_drift():
+    """Products whose ``stock_quantity`` differs from the total of their sizes, annotated with ``size_total``."""
+    return (Product.objects.annotate(size_total=Subquery(_size_total()))
+            .filter(size_total__isnull=False).exclude(stock_quantity=F('size_total')))
@@ -0,0 +1,152 @@
+"""Supplier stock levels applied from a feed, writing only what changed.
+
+The feed (CSV, JSON or JSON lines, as for ``catalog_import``) has one row
+per product size: ``slug`` (or ``name``), ``size`` and ``quantity``. Every
+current size stock is read in one query and compared in memory; only the
+quantities that differ are written, with ``bulk_update`` in batches, and
+the product totals and statuses are then recomputed in one set-based
+UPDATE per batch of products (``stock.refresh_product_stock``).
+
+Each applied feed is recorded as a ``StockSync`` row with its SHA-256, so a
+sync run every few minutes skips a feed it has already applied. Rows for
+products or sizes without a stock row are counted, not created; new SKUs
+come in through ``import_catalog``.
+"""
+import hashlib
+import os
+from collections import Counter
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from .catalog_import import read_feed
+from .models import Product, ProductStock, StockSync
+from .stock import refresh_product_stock
+
+# Changed stocks listed in a StockSync report; the rest are counted
+REPORT_LINES = 500
+
+
+def feed_hash(path):
+    """SHA-256 of a feed file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_row(row):
+    """
+    Validate one feed row.
+
+    Returns:
+        tuple: (product slug, size name, quantity)
+
+    Raises:
+        ValueError: with a message for the sync report
+    """
+    slug = slugify(str(row.get('slug') or row.get('name') or '').strip())
+    if not slug:
+        raise ValueError("slug or name is required")
+    size = str(row.get('size') or '').strip()
+    if not size:
+        raise ValueError("size is required")
+    quantity = str(row.get('quantity') if row.get('quantity') is not None else '').strip()
+    try:
+        quantity = int(quantity)
+    except ValueError:
+        raise ValueError(f"quantity is not a whole number: {quantity!r}")
+    if quantity < 0:
+        raise ValueError("quantity must be zero or more")
+    return slug, size, quantity
+
+
+def _statuses(product_ids, batch_size=1000):
+    product_ids = sorted(product_ids)
+    statuses = {}
+    for start in range(0, len(product_ids), batch_size):
+        statuses.update(Product.objects.filter(pk__in=product_ids[start:start + batch_size])
+                        .values_list('pk', 'stock_status'))
+    return statuses
+
+
+class StockSyncResult:
+    """What a sync did: ``report`` counts, ``changes`` and ``errors``."""
+
+    def __init__(self):
+        self.sync = None
+        self.report = Counter()
+        self.changes = []
+        self.errors = []
+
+
+def sync_stock(path, batch_size=500, force=False, dry_run=False):
+    """
+    Apply the stock levels of a supplier feed.
+
+    Args:
+        path: The feed file
+        batch_size: Rows per bulk UPDATE
+        force: Apply the feed even if it was applied before
+        dry_run: Work out the changes, then roll back
+
+    Returns:
+        StockSyncResult, or None when the feed was already applied;
+        ``changes`` lists (slug, size, old quantity, new quantity)
+    """
+    source = os.path.abspath(path)
+    digest = feed_hash(path)
+    last = StockSync.objects.filter(source=source).values_list('feed_hash', flat=True).first()
+    if last == digest and not force:
+        return None
+
+    result = StockSyncResult()
+    current = {
+        (slug, size): (pk, product_id, quantity)
+        for pk, product_id, slug, size, quantity in ProductStock.objects.values_list(
+            'pk', 'product_id', 'product__slug', 'size__name', 'quantity')
+    }
+    levels = {}
+    for number, row in read_feed(path):
+        result.report['rows'] += 1
+        try:
+            slug, size, quantity = parse_row(row)
+        except (ValueError, TypeError, AttributeError) as e:
+            result.errors.append((number, str(e)))
+            continue
+        levels[(slug, size)] = quantity
+
+    changed = []
+    for (slug, size), quantity in sorted(levels.items()):
+        if (slug, size) not in current:
+            result.report['unknown'] += 1
+            continue
+        pk, product_id, old = current[(slug, size)]
+        if old == quantity:
+            result.report['unchanged'] += 1
+            continue
+        result.report['changed'] += 1
+        result.changes.append((slug, size, old, quantity))
+        changed.append(ProductStock(pk=pk, product_id=product_id, quantity=quantity))
+
+    with transaction.atomic():
+        if changed:
+            product_ids = {stock.product_id for stock in changed}
+            before = _statuses(product_ids)
+            ProductStock.objects.bulk_update(changed, ['quantity'], batch_size=batch_size)
+            refresh_product_stock(product_ids)
+            for product_id, status in _statuses(product_ids).items():
+                if status != before.get(product_id):
+                    result.report[f"now {status.replace('_', ' ')}"] += 1
+
+        lines = [f"{slug} {size}: {old} -> {new}" for slug, size, old, new in result.changes[:REPORT_LINES]]
+        if len(result.changes) > REPORT_LINES:
+            lines.append(f"... and {len(result.changes) - REPORT_LINES} more")
+        result.sync = StockSync.objects.create(
+            source=source, feed_hash=digest, rows=result.report['rows'], changed=result.report['changed'],
+            unknown=result.report['unknown'], skipped=len(result.errors), report='\n'.join(lines),
+        )
+        if dry_run:
+            transaction.set_rollback(True)
+    return result
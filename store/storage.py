@@ -0,0 +1,55 @@
+"""Static file build stage run by ``collectstatic``.
+
+``CompressedManifestStaticFilesStorage`` extends Django's manifest storage:
+every text asset (original and hashed copy) gets ``.gz`` and, when the
+``brotli`` package is installed, ``.br`` siblings for pre-compressed serving.
+"""
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always written
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.txt', '.html', '.json', '.map', '.xml', '.ico')
+# Below this size the compressed file plus headers is rarely smaller
+MIN_COMPRESS_SIZE = 256
+
+
+def compress_file(path):
+    """Write ``path.gz`` (and ``path.br`` when available) next to a static file."""
+    if not path.endswith(COMPRESSIBLE_EXTENSIONS):
+        return
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return
+
+    # mtime=0 keeps the output byte-identical across builds
+    gzipped = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gzipped) < len(data):
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzipped)
+
+    if brotli is not None:
+        brotlied = brotli.compress(data, quality=11)
+        if len(brotlied) < len(data):
+            with open(path + '.br', 'wb') as f:
+                f.write(brotlied)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also writes pre-compressed copies."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        for name in paths:
+            compress_file(self.path(name))
+            hashed_name = self.hashed_files.get(self.hash_key(self.clean_name(name)))
+            if hashed_name and hashed_name != name:
+                compress_file(self.path(hashed_name))
@@ -65,4 +65,18 @@ def is_eligible_for_free_shipping(subtotal, threshold):
     try:
         return float(subtotal) >= float(threshold)
     except (ValueError, TypeError):
-        return False
\ No newline at end of file
+        return False
+
+
+@register.filter(name='image_variant')
+def image_variant(image, variant):
+    """URL of a pre-generated size ('thumb', 'card', 'detail') of an image."""
+    from store.images import variant_url
+    return variant_url(image, variant)
+
+
+@register.simple_tag(name='image_srcset')
+def image_srcset(image, fmt='webp'):
+    """srcset value listing every generated width of an image."""
+    from store.images import srcset
+    return srcset(image, fmt)
@@ -1,3 +1,1273 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import re
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail, serializers
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models.signals import post_save
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .admission import REFILL_KEY
+from .catalog_import import import_catalog, iter_json_array
+from .coupons import CouponError, get_coupon, redeem_coupon
+from .customers import _totals, rebuild_customer_stats, segment_filter, set_order_status
+from .db import retry_write, write_attempts
+from .fulfilment import batch, pick_list
+from .images import derivative_name, srcset, variant_url
+from .invoices import generate_invoices, invoice_context, render_invoices
+from .middleware import CompressionMiddleware, StaticFilesMiddleware
+from .money import percent_off, to_json, to_paise, to_rupees
+from .models import (Category, Coupon, CustomerStats, EffectivePrice, Invoice, Order, PriceChange, OrderItem, Pincode, Product, ProductSize, ProductStock, Sale, SaleItem,
+                     ProductSalesRollup, SalesRollup, ShippingRate, ShippingTier, ShippingZone, StockSync)
+from .price_changes import change_prices, preview_prices
+from .pricing import invalidate_pricing_rules, price_cart
+from .rollups import backfill
+from .routers import PrimaryReplicaRouter, _pinned
+from .sales import next_boundary, refresh_effective_prices
+from .shipping import check_pincode, get_shipping_index, invalidate_shipping_index
+from .stock import stock_drift
+from .storage import MIN_COMPRESS_SIZE, compress_file
+from .stock_sync import sync_stock
+
+MEDIA_ROOT = tempfile.mkdtemp()
+# The manifest storage needs collectstatic to have run; tests use the plain one
+TEST_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+def make_image(name='ghee.jpg'):
+    from PIL import Image
+    buffer = BytesIO()
+    Image.new('RGB', (20, 20), 'yellow').save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+def create_catalog(target):
+    """Cow Ghee (10% off) in 500g/1kg sizes and a customer, set as attributes of ``target``."""
+    target.category = Category.objects.create(name='A2 Ghee')
+    target.size_500 = ProductSize.objects.create(name='500g')
+    target.size_1kg = ProductSize.objects.create(name='1kg')
+    target.product = Product.objects.create(
+        name='Cow Ghee', image=make_image(), price=Decimal('800.00'),
+        discount_percent=10, stock_quantity=20, description='Pure A2 cow ghee',
+    )
+    target.product.categories.add(target.category)
+    target.product.sizes.add(target.size_500, target.size_1kg)
+    ProductStock.objects.create(product=target.product, size=target.size_500, quantity=10, price=Decimal('500.00'))
+    ProductStock.objects.create(product=target.product, size=target.size_1kg, quantity=10, price=Decimal('900.00'))
+    target.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret-pass-123')
+
+
+def start_checkout(client, session_id='test-session'):
+    """Fill in the address and payment steps; returns the checkout URL."""
+    url = f"{reverse('checkout')}?session_id={session_id}"
+    client.post(url + '&step=address', {
+        'first_name': 'Test', 'last_name': 'User', 'email': 'test@example.com',
+        'phone': '9876543210', 'address': '123 Test Street', 'city': 'Mumbai',
+        'state': 'Maharashtra', 'zipcode': '400001',
+    })
+    client.post(url + '&step=payment', {'payment_method': 'cod'})
+    return url
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, STORAGES=TEST_STORAGES)
+class StoreTestCase(TestCase):
+    """Catalog fixture shared by the view tests.
+
+    These tests run against whichever backend DB_ENGINE selects, so the
+    query-heavy views are exercised on both SQLite and PostgreSQL. Replicas
+    from DB_REPLICAS mirror the default test database.
+    """
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # TestCase data is never committed, so a mirrored replica on its own
+        # connection could not see it; share the primary's connection instead
+        cls._replica_connections = {}
+        for alias in settings.REPLICA_DATABASES:
+            cls._replica_connections[alias] = connections[alias]
+            connections[alias] = connections['default']
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        create_catalog(cls)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias, connection in cls._replica_connections.items():
+            connections[alias] = connection
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Rules compiled inside a rolled-back test transaction would be stale
+        invalidate_pricing_rules()
+        invalidate_shipping_index()
+
+    def add_to_cart(self, size, quantity=1):
+        return self.client.post(reverse('cart'), {
+            'product_id': self.product.id, 'size_id': size.id, 'quantity': quantity,
+        })
+
+
+class CatalogViewTests(StoreTestCase):
+    def test_shop_lists_size_prices(self):
+        response = self.client.get(reverse('shop'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Cow Ghee')
+        self.assertIn('450.0', response.context['product_size_data'])
+
+    def test_product_detail(self):
+        response = self.client.get(reverse('product_detail', args=[self.product.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['product'], self.product)
+
+    def test_search(self):
+        response = self.client.get(reverse('search_products'), {'q': 'cow'})
+        self.assertEqual(list(response.context['products']), [self.product])
+
+
+class CheckoutViewTests(StoreTestCase):
+    def place_order(self):
+        url = start_checkout(self.client)
+        return self.client.post(url + '&step=review', {'place_order': '1'})
+
+    def test_cart_and_order_totals(self):
+        self.client.force_login(self.user)
+        self.add_to_cart(self.size_1kg, quantity=2)
+
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.context['subtotal'], Decimal('1620.00'))
+        self.assertEqual(response.context['shipping_cost'], Decimal('0'))
+
+        response = self.place_order()
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('order_confirmation', args=[order.order_id]))
+        self.assertEqual(order.total_amount, Decimal('1620.00'))
+        self.assertEqual(order.items.get().quantity, 2)
+        self.assertEqual((order.item_count, order.first_item_name), (2, 'Cow Ghee'))
+
+    def test_products_missing_from_the_rules_are_priced_and_sold(self):
+        self.client.force_login(self.user)
+        self.add_to_cart(self.size_1kg, quantity=2)
+        EffectivePrice.objects.filter(product=self.product).delete()
+        invalidate_pricing_rules()
+        response = self.client.get(reverse('cart'))
+        [line] = response.context['cart_items']
+        self.assertEqual((line['price'], line['item_total']), (Decimal('810.00'), Decimal('1620.00')))
+        self.assertEqual((response.context['subtotal'], response.context['total']),
+                         (Decimal('1620.00'), Decimal('1620.00')))
+
+        response = self.place_order()
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('order_confirmation', args=[order.order_id]))
+        self.assertEqual(order.total_amount, Decimal('1620.00'))
+
+    def test_order_redeems_applied_coupon(self):
+        coupon = make_coupon(usage_limit=1)
+        self.client.force_login(self.user)
+        self.add_to_cart(self.size_1kg, quantity=2)
+        self.client.post(reverse('cart'), {'coupon_code': 'ghee10'})
+
+        self.place_order()
+        order = Order.objects.get()
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 1)
+        self.assertEqual(order.coupon, coupon)
+        self.assertEqual(order.coupon_discount, Decimal('162.00'))
+        self.assertEqual(order.total_amount, Decimal('1458.00'))
+
+    def test_resubmitting_returns_the_same_order(self):
+        self.client.force_login(self.user)
+        self.add_to_cart(self.size_1kg)
+        first = self.place_order()
+        emails = len(mail.outbox)
+
+        url = f"{reverse('checkout')}?session_id=test-session&step=review"
+        # Answered from the cache: the only query loads the session
+        with self.assertNumQueries(1):
+            replay = self.client.post(url, {'place_order': '1'}, follow=False)
+        self.assertEqual(replay.url, first.url)
+
+        # Still recognised once the cached result is gone
+        cache.clear()
+        self.assertEqual(self.client.post(url, {'place_order': '1'}).url, first.url)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), emails)
+
+    def test_checkout_api_validates_and_places_order(self):
+        self.client.force_login(self.user)
+        self.add_to_cart(self.size_1kg, quantity=2)
+        address = {
+            'first_name': 'Test', 'last_name': 'User', 'email': 'test@example.com',
+            'phone': '98765', 'address': '123 Test Street', 'city': 'Mumbai',
+            'state': 'Maharashtra', 'pincode': '40001',
+        }
+        quote_url = reverse('checkout_quote_api')
+        response = self.client.post(quote_url, {'address': address}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'phone', 'pincode'})
+
+        address.update(phone='9876543210', pincode='400001')
+        response = self.client.post(quote_url, {'address': address, 'payment_method': 'cod'},
+                                    content_type='application/json')
+        self.assertEqual(response.json()['quote']['subtotal'], 1620.0)
+
+        place_url = reverse('checkout_place_order_api')
+        data = {'session_id': 'api-session', 'payment_method': 'cod'}
+        first = self.client.post(place_url, data, content_type='application/json').json()
+        order = Order.objects.get()
+        self.assertEqual(first['order_id'], str(order.order_id))
+        self.assertEqual(first['redirect'], reverse('order_confirmation', args=[order.order_id]))
+        self.assertEqual(order.pincode, '400001')
+        self.assertEqual(order.total_amount, Decimal('1620.00'))
+
+        replay = self.client.post(place_url, data, content_type='application/json').json()
+        self.assertEqual(replay['order_id'], first['order_id'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_cart_and_order_use_shipping_tiers(self):
+        ShippingTier.objects.create(min_subtotal=Decimal('0'), cost=Decimal('80'))
+        ShippingTier.objects.create(min_subtotal=Decimal('2000'), cost=Decimal('0'))
+        self.client.force_login(self.user)
+        self.add_to_cart(self.size_1kg, quantity=2)
+
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.context['shipping_cost'], Decimal('80'))
+        self.assertEqual(response.context['total'], Decimal('1700.00'))
+
+        self.place_order()
+        order = Order.objects.get()
+        self.assertEqual(order.shipping_cost, Decimal('80'))
+        self.assertEqual(order.total_amount, Decimal('1700.00'))
+
+
+class SaleTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.sale = Sale.objects.create(name='Diwali', starts_at=now + timedelta(hours=1),
+                                        ends_at=now + timedelta(hours=2))
+        SaleItem.objects.create(sale=self.sale, product=self.product, size=self.size_1kg, discount_percent=20)
+
+    def test_prices_follow_sale_window(self):
+        self.assertEqual(refresh_effective_prices(), 0)
+        self.assertEqual(next_boundary(), self.sale.starts_at)
+
+        during = self.sale.starts_at + timedelta(minutes=1)
+        self.assertEqual(refresh_effective_prices(now=during), 1)
+        self.assertEqual(self.product.get_price_for_size(self.size_1kg.id), Decimal('720.00'))
+        self.assertEqual(self.product.get_price_for_size(self.size_500.id), Decimal('450.00'))
+        # Nothing changed since, so nothing is written or invalidated
+        self.assertEqual(refresh_effective_prices(now=during), 0)
+
+        self.assertEqual(refresh_effective_prices(now=self.sale.ends_at), 1)
+        self.assertEqual(self.product.get_price_for_size(self.size_1kg.id), Decimal('810.00'))
+
+    def test_raw_saves_do_not_refresh_prices(self):
+        with mock.patch('store.signals.refresh_effective_prices') as refresh:
+            post_save.send(sender=ProductStock, instance=self.product.size_stocks.first(), created=False, raw=True)
+        refresh.assert_not_called()
+
+    def test_loaded_products_can_be_priced_before_the_refresh(self):
+        fixture = serializers.serialize('json', [self.product, *self.product.size_stocks.all()])
+        product_id = self.product.pk
+        self.product.delete()
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            f.write(fixture)
+        self.addCleanup(os.remove, f.name)
+        call_command('loaddata', f.name, verbosity=0)
+        self.assertFalse(EffectivePrice.objects.exists())
+
+        invalidate_pricing_rules()
+        quote = price_cart([{'product_id': str(product_id), 'size_id': str(self.size_1kg.id), 'quantity': 2}])
+        self.assertEqual((quote.subtotal, quote.item_count), (to_paise(Decimal('1620.00')), 2))
+
+    def test_cart_uses_sale_price(self):
+        refresh_effective_prices(now=self.sale.starts_at)
+        self.client.force_login(self.user)
+        self.add_to_cart(self.size_1kg, quantity=2)
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.context['subtotal'], Decimal('1440.00'))
+
+
+@skipUnless(connection.vendor == 'sqlite', "Reads SQLite query plans")
+class OrderIndexTests(StoreTestCase):
+    """The order pages must keep using the Order indexes as the table grows."""
+    FULL_SCAN = re.compile(r'^SCAN (TABLE )?store_order$')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-123')
+        now = timezone.now()
+        cls.orders = Order.objects.bulk_create([
+            Order(
+                user=cls.user if n % 2 else None, full_name=f'Customer {n}', email=f'c{n}@example.com',
+                phone='9876543210', address='1 Test Street', city='Mumbai', state='Maharashtra',
+                pincode='400001', total_amount=Decimal('810.00'), status=('pending', 'shipped')[n % 2],
+                payment_method=('cod', 'upi')[n % 2], created_at=now - timedelta(days=n),
+            )
+            for n in range(20)
+        ])
+
+    def assertUsesIndexes(self, queries):
+        """Fail if any query on store_order reads the whole table or sorts it."""
+        checked = 0
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query['sql'].startswith('SELECT') or '"store_order"' not in query['sql']:
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                for detail in (row[-1] for row in cursor.fetchall()):
+                    self.assertNotRegex(detail, self.FULL_SCAN, query['sql'])
+                    self.assertNotEqual(detail, 'USE TEMP B-TREE FOR ORDER BY', query['sql'])
+                checked += 1
+        self.assertTrue(checked, "No order queries were run")
+
+    def test_track_order(self):
+        order = self.orders[0]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('track_order'), {'orderId': order.order_id, 'email': order.email})
+        self.assertEqual(response.context['order'], order)
+        self.assertUsesIndexes(queries)
+
+    def test_account_order_history(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('account'))
+        self.assertUsesIndexes(queries)
+
+    def test_admin_order_list_and_filters(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:store_order_changelist')
+        now = timezone.now()
+        for params in ({}, {'status__exact': 'pending'}, {'payment_status__exact': '0'},
+                       {'payment_method__exact': 'upi'}, {'created_at__year': now.year, 'created_at__month': now.month}):
+            with self.subTest(params=params), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url, params).status_code, 200)
+            self.assertUsesIndexes(queries)
+
+
+class OrderHistoryTests(StoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        now = timezone.now()
+        # Pairs of orders share a timestamp, so paging must break ties by id
+        orders = Order.objects.bulk_create([
+            Order(user=cls.user, full_name='Test User', email='buyer@example.com', phone='9876543210',
+                  address='1 Test Street', city='Mumbai', state='Maharashtra', pincode='400001',
+                  total_amount=Decimal('810.00'), created_at=now - timedelta(hours=n // 2))
+            for n in range(13)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=cls.product, quantity=quantity, price=Decimal('810.00'))
+            for order in orders for quantity in (1, 2)
+        ])
+
+    def test_pages_through_all_orders_in_constant_queries(self):
+        self.client.force_login(self.user)
+        seen = []
+        cursor = None
+        while True:
+            # session, user, orders, items with products, customer stats
+            with self.assertNumQueries(5):
+                response = self.client.get(reverse('account'), {'before': cursor} if cursor else {})
+                self.assertContains(response, '2 &times; Cow Ghee', count=len(response.context['orders']))
+            seen += [order.pk for order in response.context['orders']]
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(Order.objects.order_by('-created_at', '-id').values_list('pk', flat=True)))
+
+    def test_summary_follows_item_changes(self):
+        order = Order.objects.first()
+        order.refresh_summary()
+        self.assertEqual((order.item_count, order.first_item_name), (3, 'Cow Ghee'))
+
+        order.items.order_by('id').first().delete()
+        order.refresh_from_db()
+        self.assertEqual(order.item_count, 2)
+
+
+class CustomerStatsTests(StoreTestCase):
+    def place(self, total, user=None, email='Guest@Example.com ', status='pending'):
+        return Order.objects.create(
+            user=user, full_name='Test User', email=email, phone='9876543210', address='1 Test Street',
+            city='Mumbai', state='Maharashtra', pincode='400001', total_amount=Decimal(total), status=status,
+        )
+
+    def stats(self, **lookup):
+        return CustomerStats.objects.values_list('order_count', 'cancelled_count', 'lifetime_spend').get(**lookup)
+
+    def test_orders_update_stats_incrementally(self):
+        self.place('810.00', user=self.user)
+        order = self.place('500.00', user=self.user)
+        self.place('100.00')
+        self.place('200.00', email='guest@example.com')
+        self.assertEqual(self.stats(user=self.user), (2, 0, Decimal('1310.00')))
+        self.assertEqual(self.stats(user=None, email='guest@example.com'), (2, 0, Decimal('300.00')))
+
+        order.status = 'cancelled'
+        order.save()
+        self.assertEqual(self.stats(user=self.user), (1, 1, Decimal('810.00')))
+        set_order_status(Order.objects.filter(pk=order.pk), 'processing')
+        self.assertEqual(self.stats(user=self.user), (2, 0, Decimal('1310.00')))
+
+        order.delete()
+        self.assertEqual(self.stats(user=self.user), (1, 0, Decimal('810.00')))
+        self.assertQuerySetEqual(CustomerStats.objects.filter(segment_filter('new')), [self.user.customer_stats])
+
+    def test_rebuild_matches_incremental_stats(self):
+        self.place('810.00', user=self.user)
+        self.place('500.00', user=self.user, status='cancelled')
+        self.place('100.00')
+        expected = set(CustomerStats.objects.values_list(
+            'user', 'email', 'order_count', 'cancelled_count', 'lifetime_spend', 'first_order_at', 'last_order_at'))
+
+        self.assertEqual(rebuild_customer_stats(chunk_size=2), 2)
+        self.assertEqual(set(CustomerStats.objects.values_list(
+            'user', 'email', 'order_count', 'cancelled_count', 'lifetime_spend', 'first_order_at', 'last_order_at')),
+            expected)
+
+    def test_rebuild_keeps_orders_placed_during_the_scan(self):
+        self.place('810.00', user=self.user)
+        CustomerStats.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        scan = _totals
+
+        def scan_then_order(rows):
+            totals = scan(rows)
+            if not placed:
+                placed.append(self.place('100.00', user=self.user))
+            return totals
+
+        placed = []
+        with mock.patch('store.customers._totals', side_effect=scan_then_order):
+            rebuild_customer_stats()
+        self.assertEqual(self.stats(user=self.user), (2, 0, Decimal('910.00')))
+
+    def test_failed_rebuild_keeps_the_old_stats(self):
+        self.place('810.00', user=self.user)
+        with mock.patch.object(CustomerStats.objects, 'bulk_create', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                rebuild_customer_stats()
+        self.assertEqual(self.stats(user=self.user), (1, 0, Decimal('810.00')))
+
+
+class SalesRollupTests(StoreTestCase):
+    def rollups(self):
+        return (
+            set(SalesRollup.objects.values_list('period', 'start', 'payment_method', 'order_count', 'cancelled_count',
+                                                'revenue', 'units', 'coupon_orders', 'coupon_discount')),
+            set(ProductSalesRollup.objects.values_list('period', 'start', 'product', 'size', 'units', 'revenue')),
+        )
+
+    def test_incremental_rollups_match_backfill(self):
+        self.client.force_login(self.user)
+        self.add_to_cart(self.size_1kg, quantity=2)
+        self.client.post(start_checkout(self.client) + '&step=review', {'place_order': '1'})
+        self.add_to_cart(self.size_500)
+        self.client.post(start_checkout(self.client, 'second') + '&step=review', {'place_order': '1'})
+        first, second = Order.objects.order_by('created_at')
+        self.assertEqual(second.items.get().size, self.size_500)
+
+        today = timezone.localdate()
+        sales, products = self.rollups()
+        self.assertIn(('day', today, 'cod', 2, 0, Decimal('2120.00'), 3, 0, Decimal('0.00')), sales)
+        self.assertIn(('month', today.replace(day=1), self.product.pk, self.size_1kg.pk, 2, Decimal('1620.00')),
+                      products)
+
+        # Cancel one, move one to last month, edit an item, delete an item
+        set_order_status(Order.objects.filter(pk=second.pk), 'cancelled')
+        first.created_at -= timedelta(days=40)
+        first.save()
+        item = OrderItem.objects.create(order=first, product=self.product, size=self.size_500, quantity=1,
+                                        price=Decimal('450.00'))
+        item.quantity = 3
+        item.save()
+        first.items.filter(size=self.size_1kg).get().delete()
+
+        incremental = self.rollups()
+        backfill(today - timedelta(days=40), today)
+        self.assertEqual(self.rollups(), incremental)
+        self.assertIn(('day', today, 'cod', 0, 1, Decimal('0.00'), 0, 0, Decimal('0.00')), incremental[0])
+
+        first.delete()
+        backfill()
+        self.assertEqual(self.rollups()[1], set())
+
+    def test_dashboard_reads_rollups(self):
+        self.client.force_login(self.user)
+        self.add_to_cart(self.size_1kg, quantity=2)
+        self.client.post(start_checkout(self.client) + '&step=review', {'place_order': '1'})
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('admin:store_salesrollup_changelist'))
+        self.assertContains(response, 'Cow Ghee')
+        self.assertEqual(response.context['summary']['revenue'], Decimal('1620.00'))
+        self.assertEqual(response.context['days'][-1]['units'], 2)
+
+
+class FulfilmentTests(StoreTestCase):
+    def place(self, status, *lines):
+        order = Order.objects.create(
+            full_name='Test User', email='test@example.com', phone='9876543210', address='1 Test Street',
+            city='Mumbai', state='Maharashtra', pincode='400001', total_amount=Decimal('1000.00'), status=status,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.product, size=size, quantity=quantity, price=Decimal('450.00'))
+            for size, quantity in lines
+        ])
+        return order
+
+    def test_pick_list_aggregates_processing_orders(self):
+        self.place('processing', (self.size_500, 2), (self.size_1kg, 1))
+        self.place('processing', (self.size_500, 3))
+        self.place('pending', (self.size_1kg, 5))
+
+        with self.assertNumQueries(1):
+            rows = pick_list(batch())
+        self.assertEqual([(row['size__name'], row['units'], row['orders']) for row in rows],
+                         [('1kg', 1, 1), ('500g', 5, 2)])
+
+        out = StringIO()
+        call_command('pick_list', '--format', 'csv', '--slips', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+
+        with self.assertNumQueries(4):
+            call_command('pick_list', stdout=(out := StringIO()))
+        self.assertEqual(out.getvalue().count('class="slip"'), 2)
+
+    def test_admin_action_streams_batch(self):
+        order = self.place('processing', (self.size_500, 2))
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('admin:store_order_changelist'), {
+            'action': 'download_pick_list_csv', '_selected_action': [order.pk],
+        })
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines()[1], 'Cow Ghee,500g,2,1')
+
+
+@override_settings(INVOICE_SELLER={'name': 'Gaumaatri', 'state': 'Maharashtra'}, INVOICE_GST_PERCENT=5)
+class InvoiceTests(StoreTestCase):
+    def place(self, status, state='Maharashtra'):
+        order = Order.objects.create(
+            full_name='Test User', email='test@example.com', phone='9876543210', address='1 Test Street',
+            city='Mumbai', state=state, pincode='400001', subtotal=Decimal('1350.00'),
+            coupon_discount=Decimal('100.00'), shipping_cost=Decimal('50.00'), total_amount=Decimal('1350.00'),
+            status=status,
+        )
+        OrderItem.objects.create(order=order, product=self.product, size=self.size_1kg, quantity=1, price=Decimal('900.00'))
+        OrderItem.objects.create(order=order, product=self.product, size=self.size_500, quantity=1, price=Decimal('450.00'))
+        return order
+
+    def test_gst_lines_add_up_to_order_total(self):
+        order = self.place('processing')
+        context = invoice_context(order, order.items.select_related('product', 'size'))
+        totals = context['totals']
+        self.assertEqual([line['description'] for line in context['lines']],
+                         ['Cow Ghee (1 Kilogram)', 'Cow Ghee (500 Grams)', 'Discount', 'Shipping', 'Other charges'])
+        self.assertEqual(totals['total'], order.total_amount)
+        self.assertEqual(totals['taxable'] + totals['cgst'] + totals['sgst'], order.total_amount)
+        self.assertEqual((totals['taxable'], totals['igst']), (Decimal('1285.71'), Decimal('0.00')))
+
+        other_state = invoice_context(self.place('processing', state='Karnataka'), [])
+        self.assertEqual(other_state['totals']['igst'], other_state['totals']['tax'])
+
+    def test_invoices_rendered_once_and_served_cached(self):
+        order = self.place('processing')
+        self.place('pending')
+        self.assertEqual(generate_invoices(workers=0), 1)
+        self.assertEqual(generate_invoices(workers=0), 0)
+        invoice = Invoice.objects.get()
+        self.assertEqual(invoice.order, order)
+        self.assertIn(invoice.number, invoice.html)
+
+        url = reverse('order_invoice', args=[order.order_id])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, 'Tax Invoice')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertContains(self.client.get(reverse('order_confirmation', args=[order.order_id])), url)
+
+        pending = Order.objects.get(status='pending')
+        self.assertEqual(self.client.get(reverse('order_invoice', args=[pending.order_id])).status_code, 404)
+
+    def test_invoices_stored_by_an_overlapping_run_are_not_counted(self):
+        self.place('processing')
+        render = render_invoices
+
+        def overlapping(order_ids):
+            # Another run stores the same invoices first
+            Invoice.objects.bulk_create(render(order_ids))
+            return render(order_ids)
+
+        with mock.patch('store.invoices.render_invoices', side_effect=overlapping):
+            self.assertEqual(generate_invoices(workers=0), 0)
+        self.assertEqual(Invoice.objects.count(), 1)
+
+
+class PriceChangeTests(StoreTestCase):
+    def test_bulk_change_is_one_update_and_audited(self):
+        refresh_effective_prices()
+        stocks = ProductStock.objects.filter(product__categories=self.category)
+        count, sample = preview_prices(stocks, 'price', 'percent', '10')
+        self.assertEqual((count, sorted(new for _, _, new in sample)), (2, [Decimal('550.00'), Decimal('990.00')]))
+        self.assertEqual(ProductStock.objects.get(size=self.size_500).price, Decimal('500.00'))
+
+        with CaptureQueriesContext(connection) as queries:
+            change = change_prices(stocks, 'price', 'percent', '10', user=self.user, selection='A2 Ghee')
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE "store_productstock"')]), 1)
+        self.assertEqual(change.rows, 2)
+        self.assertEqual(PriceChange.objects.get().user, self.user)
+        self.assertEqual(ProductStock.objects.get(size=self.size_1kg).price, Decimal('990.00'))
+        # Selling prices follow, with the product's 10% discount
+        self.assertEqual(EffectivePrice.objects.get(size=self.size_1kg).price, Decimal('891.00'))
+
+        change_prices(Product.objects.all(), 'discount_percent', 'amount', '95')
+        self.assertEqual(Product.objects.get().discount_percent, 100)
+        change_prices(Product.objects.all(), 'price', 'amount', '-1000')
+        self.assertEqual(Product.objects.get().price, Decimal('0.00'))
+
+    def test_admin_action_previews_then_applies(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        url = reverse('admin:store_product_changelist')
+        data = {'action': 'bulk_change_prices', '_selected_action': [self.product.pk], 'index': 0,
+                'field': 'discount_percent', 'mode': 'set', 'amount': '25'}
+        response = self.client.post(url, {**data, 'preview': '1'})
+        self.assertContains(response, 'Apply to 1 row')
+        self.assertEqual(Product.objects.get().discount_percent, 10)
+
+        self.client.post(url, {**data, 'apply': '1'})
+        self.assertEqual(Product.objects.get().discount_percent, 25)
+        self.assertEqual(PriceChange.objects.get().rows, 1)
+
+
+class FeedTestCase(StoreTestCase):
+    def feed(self, text, suffix='.csv'):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as f:
+            f.write(text)
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+
+class CatalogImportTests(FeedTestCase):
+    def test_import_upserts_and_reports_diff(self):
+        feed = self.feed(
+            "name,price,category,size,size_price,quantity,discount_percent\n"
+            "Cow Ghee,800,A2 Ghee,500g,520,4,10\n"
+            "Cow Ghee,800,A2 Ghee,1kg,900,10,10\n"
+            "Buffalo Ghee,700,Ghee;A2 Ghee,1kg,700,0,\n"
+            "Broken,abc,,,,,\n"
+        )
+        catalog = import_catalog(feed, batch_size=2)
+        self.assertEqual(catalog.errors, [(5, "price is not a number: 'abc'")])
+        self.assertEqual(catalog.report['products created'], 1)
+        self.assertEqual(catalog.report['stocks updated'], 1)
+        self.assertEqual(catalog.report['stocks created'], 1)
+
+        buffalo = Product.objects.get(slug='buffalo-ghee')
+        self.assertEqual(set(buffalo.categories.values_list('name', flat=True)), {'A2 Ghee', 'Ghee'})
+        self.assertEqual((buffalo.stock_quantity, buffalo.stock_status), (0, 'out_of_stock'))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 14)
+        self.assertEqual(EffectivePrice.objects.get(product=self.product, size=self.size_500).price, Decimal('468.00'))
+
+        with self.assertNumQueries(9):
+            again = import_catalog(feed)
+        self.assertEqual(again.report['products unchanged'], 2)
+        self.assertEqual(again.report['stocks unchanged'], 3)
+
+    def test_json_lines_dry_run_saves_nothing(self):
+        feed = self.feed('{"name": "Desi Ghee", "price": "650", "quantity": 3}\n', suffix='.jsonl')
+        catalog = import_catalog(feed, dry_run=True)
+        self.assertEqual(catalog.report['products created'], 1)
+        self.assertFalse(Product.objects.filter(slug='desi-ghee').exists())
+
+    def test_json_arrays_are_streamed(self):
+        rows = [{"name": "Desi Ghee", "price": "650"}, {"name": "A2, [Gir] Ghee", "price": 900}]
+        self.assertEqual(list(iter_json_array(StringIO(json.dumps(rows, indent=2)), chunk_size=3)), rows)
+        with self.assertRaises(ValueError):
+            list(iter_json_array(StringIO('[{"name": "Desi Ghee"},'), chunk_size=3))
+
+    def test_blank_quantity_keeps_stock_and_names_match_categories(self):
+        Category.objects.create(name='Ghee & Oils', slug='oils')
+        feed = self.feed(
+            '[{"name": "Cow Ghee", "price": "800", "size": "500g", "size_price": "550", "category": "ghee & oils"},'
+            ' ["not", "an", "object"]]',
+            suffix='.json',
+        )
+        catalog = import_catalog(feed)
+        self.assertEqual(catalog.errors, [(2, "'list' object has no attribute 'get'")])
+        self.assertEqual(catalog.report['stocks updated'], 1)
+        self.assertNotIn('categories created', catalog.report)
+        self.assertEqual(ProductStock.objects.get(product=self.product, size=self.size_500).quantity, 10)
+        self.assertEqual(ProductStock.objects.get(product=self.product, size=self.size_500).price, Decimal('550.00'))
+        self.assertIn('oils', self.product.categories.values_list('slug', flat=True))
+
+
+class StockSyncTests(FeedTestCase):
+    def test_applies_only_changes_and_skips_an_applied_feed(self):
+        ProductStock.objects.filter(product=self.product).update(quantity=10)
+        feed = self.feed(
+            "slug,size,quantity\n"
+            "cow-ghee,500g,0\n"
+            "cow-ghee,1kg,10\n"
+            "cow-ghee,2kg,4\n"
+            "cow-ghee,500g,x\n"
+        )
+        result = sync_stock(feed)
+        self.assertEqual(result.changes, [('cow-ghee', '500g', 10, 0)])
+        self.assertEqual(result.errors, [(5, "quantity is not a whole number: 'x'")])
+        self.assertEqual((result.report['unchanged'], result.report['unknown']), (1, 1))
+        self.assertEqual(result.sync.report, "cow-ghee 500g: 10 -> 0")
+        self.assertEqual(ProductStock.objects.get(product=self.product, size=self.size_500).quantity, 0)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.product.stock_status), (10, 'in_stock'))
+
+        self.assertIsNone(sync_stock(feed))
+        self.assertEqual(StockSync.objects.count(), 1)
+        self.assertEqual(sync_stock(feed, force=True).report['changed'], 0)
+
+    def test_dry_run_saves_nothing(self):
+        feed = self.feed("name,size,quantity\nCow Ghee,500g,1\nCow Ghee,1kg,2\n")
+        result = sync_stock(feed, dry_run=True)
+        self.assertEqual(result.report['now low stock'], 1)
+        self.assertFalse(StockSync.objects.exists())
+        self.assertNotEqual(ProductStock.objects.get(product=self.product, size=self.size_1kg).quantity, 2)
+
+
+class ProductStockAggregateTests(StoreTestCase):
+    def test_size_stock_changes_maintain_product_total(self):
+        stock = ProductStock.objects.get(product=self.product, size=self.size_500)
+        stock.quantity = 0
+        stock.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.product.stock_status), (10, 'in_stock'))
+
+        ProductStock.objects.get(product=self.product, size=self.size_1kg).delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.product.stock_status), (0, 'out_of_stock'))
+        stock.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 0)
+
+        # A hand-set total is replaced by the sizes' on save
+        ProductStock.objects.create(product=self.product, size=self.size_1kg, quantity=3, price=Decimal('900.00'))
+        self.product.stock_quantity = 50
+        self.product.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.product.stock_status), (3, 'low_stock'))
+
+    def test_size_without_stock_is_unavailable(self):
+        size_2kg = ProductSize.objects.create(name='2kg')
+        self.assertEqual(self.product.get_stock_for_size(self.size_500.id), 10)
+        self.assertEqual(self.product.get_stock_for_size(size_2kg.id), 0)
+        self.assertEqual(self.product.get_stock_for_size(None), 20)
+
+    def test_reconcile_fixes_drift(self):
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=0)
+        self.assertEqual(list(stock_drift().values_list('size_total', flat=True)), [20])
+        call_command('reconcile_stock', stdout=(out := StringIO()))
+        self.assertIn("Cow Ghee (#%d): 0 -> 20" % self.product.pk, out.getvalue())
+        self.assertFalse(stock_drift().exists())
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_status, 'in_stock')
+
+    def test_shop_filters_and_sorts_by_availability(self):
+        sold_out = Product.objects.create(name='Buffalo Ghee', price=Decimal('700.00'), stock_quantity=0)
+        response = self.client.get(reverse('shop'), {'availability': 'available'})
+        self.assertEqual(list(response.context['products']), [self.product])
+        response = self.client.get(reverse('shop'), {'sort': 'availability'})
+        self.assertEqual(list(response.context['products']), [self.product, sold_out])
+
+    def test_admin_edits_stock_only_without_size_stocks(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        plain = Product.objects.create(name='Buffalo Ghee', price=Decimal('700.00'), stock_quantity=5)
+        response = self.client.get(reverse('admin:store_product_change', args=[self.product.pk]))
+        self.assertNotContains(response, 'name="stock_quantity"')
+        response = self.client.get(reverse('admin:store_product_change', args=[plain.pk]))
+        self.assertContains(response, 'name="stock_quantity"')
+        response = self.client.get(reverse('admin:store_product_changelist'))
+        self.assertNotContains(response, 'form-0-stock_quantity')
+
+
+class ImageVariantTests(StoreTestCase):
+    def test_variants_are_generated_and_served_without_storage_calls(self):
+        image = self.product.image
+        self.assertEqual(self.product.image_variants, image.name)
+        self.assertTrue(image.storage.exists(derivative_name(image.name, 'card', 'webp')))
+        with mock.patch('django.core.files.storage.FileSystemStorage.exists', side_effect=AssertionError("stat")):
+            self.assertTrue(variant_url(image, 'thumb').endswith('_jpg_thumb.jpg'))
+            self.assertEqual(srcset(image).count('w, '), 2)
+
+    def test_falls_back_to_the_original_until_variants_exist(self):
+        Product.objects.filter(pk=self.product.pk).update(image_variants='')
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(variant_url(product.image, 'card'), product.image.url)
+        self.assertEqual(srcset(product.image), '')
+
+    def test_sources_with_the_same_stem_keep_separate_variants(self):
+        self.assertNotEqual(derivative_name('products/ghee.jpg', 'card'), derivative_name('products/ghee.png', 'card'))
+
+    def test_replaced_image_variants_are_removed(self):
+        product = Product.objects.create(name='Buffalo Ghee', image=make_image('buffalo.jpg'), price=Decimal('700.00'))
+        old = product.image.name
+        product.image = make_image('buffalo.png')
+        product.save()
+        self.assertEqual(product.image_variants, product.image.name)
+        self.assertFalse(product.image.storage.exists(derivative_name(old, 'card', 'webp')))
+        self.assertTrue(product.image.storage.exists(derivative_name(product.image.name, 'card', 'webp')))
+
+        # Saves that keep the image do not regenerate it
+        with mock.patch('store.images.generate_derivatives') as generate:
+            Product.objects.get(pk=product.pk).save()
+        generate.assert_not_called()
+
+
+class StaticCompressionTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def write(self, name, data):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_compress_file_skips_small_and_binary_files(self):
+        css = self.write('site.css', b'body { color: #333; }\n' * 100)
+        compress_file(css)
+        with open(css + '.gz', 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), b'body { color: #333; }\n' * 100)
+
+        small = self.write('small.css', b'a{}' * (MIN_COMPRESS_SIZE // 4))
+        image = self.write('logo.png', b'\0' * 1000)
+        compress_file(small)
+        compress_file(image)
+        self.assertFalse(os.path.exists(small + '.gz'))
+        self.assertFalse(os.path.exists(image + '.gz'))
+
+    def test_collectstatic_writes_hashed_and_compressed_copies(self):
+        storages = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'store.storage.CompressedManifestStaticFilesStorage'}}
+        with override_settings(STATIC_ROOT=self.root, STORAGES=storages):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.root, 'staticfiles.json')) as f:
+            hashed = json.load(f)['paths']['store/css/oziva-2.css']
+        self.assertNotEqual(hashed, 'store/css/oziva-2.css')
+        self.assertTrue(os.path.exists(os.path.join(self.root, hashed + '.gz')))
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'store/css/oziva-2.css.gz')))
+
+
+class StaticFilesMiddlewareTests(SimpleTestCase):
+    body = b'body { color: #333; }\n' * 100
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(self.root, 'static', 'css'))
+        self.path = os.path.join(self.root, 'static', 'css', 'site.css')
+        with open(self.path, 'wb') as f:
+            f.write(self.body)
+        with open(self.path + '.gz', 'wb') as f:
+            f.write(gzip.compress(self.body))
+        with open(os.path.join(self.root, 'secret.txt'), 'w') as f:
+            f.write('secret')
+        settings_override = override_settings(STATIC_URL='/static/', STATIC_ROOT=os.path.join(self.root, 'static'),
+                                              MEDIA_ROOT='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.middleware = StaticFilesMiddleware(lambda request: HttpResponse('fallthrough', status=404))
+
+    def get(self, path='/static/css/site.css', **headers):
+        response = self.middleware(RequestFactory().get(path, headers=headers))
+        response.body = b''.join(response) if response.status_code != 404 else response.content
+        return response
+
+    def test_precompressed_copy_follows_accept_encoding(self):
+        response = self.get(accept_encoding='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.body), self.body)
+        for refused in ('gzip;q=0, identity', 'gzip;q=0.000', 'identity', '*;q=0'):
+            response = self.get(accept_encoding=refused)
+            self.assertFalse(response.has_header('Content-Encoding'), refused)
+            self.assertEqual(response.body, self.body)
+        self.assertEqual(self.get(accept_encoding='*')['Content-Encoding'], 'gzip')
+
+    def test_etag_revalidation(self):
+        etag = self.get()['ETag']
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.body, b'')
+
+    def test_ranges(self):
+        response = self.get(range='bytes=5-9')
+        self.assertEqual((response.status_code, response.body), (206, self.body[5:10]))
+        self.assertEqual(response['Content-Range'], f'bytes 5-9/{len(self.body)}')
+        self.assertEqual(self.get(range='bytes=-4').body, self.body[-4:])
+        response = self.get(range=f'bytes={len(self.body)}-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.body)}'))
+
+    def test_if_range_with_a_stale_validator_gets_the_whole_file(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(range='bytes=0-3', if_range=etag).status_code, 206)
+        response = self.get(range='bytes=0-3', if_range='"stale"')
+        self.assertEqual((response.status_code, response.body), (200, self.body))
+        last_modified = self.get()['Last-Modified']
+        self.assertEqual(self.get(range='bytes=0-3', if_range=last_modified).status_code, 206)
+        self.assertEqual(self.get(range='bytes=0-3', if_range='Tue, 01 Jan 2019 00:00:00 GMT').status_code, 200)
+
+    def test_paths_outside_the_root_fall_through(self):
+        for path in ('/static/../secret.txt', '/static/%2e%2e/secret.txt', '/static/css/missing.css', '/static/css/'):
+            response = self.get(path)
+            self.assertEqual((response.status_code, response.content), (404, b'fallthrough'), path)
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    html = b'<p>Pure A2 cow ghee</p>\n' * 100
+
+    def compress(self, response, accept_encoding='gzip, deflate'):
+        request = RequestFactory().get('/', headers={'accept_encoding': accept_encoding})
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_gzips_with_random_padding(self):
+        lengths = set()
+        for _ in range(10):
+            response = self.compress(HttpResponse(self.html))
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(response.content), self.html)
+            self.assertEqual(response['Content-Length'], str(len(response.content)))
+            lengths.add(len(response.content))
+        self.assertGreater(len(lengths), 1)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_skips_small_incompressible_and_refused_responses(self):
+        self.assertFalse(self.compress(HttpResponse(b'<p>ok</p>')).has_header('Content-Encoding'))
+        image = self.compress(HttpResponse(self.html, content_type='image/svg+xml'))
+        self.assertFalse(image.has_header('Content-Encoding'))
+        for refused in ('gzip;q=0', 'gzip; q=0.00', 'gzip;q=0 , identity', 'identity', ''):
+            response = self.compress(HttpResponse(self.html), refused)
+            self.assertFalse(response.has_header('Content-Encoding'), refused)
+            self.assertEqual(response.content, self.html)
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(self.compress(HttpResponse(self.html), '*')['Content-Encoding'], 'gzip')
+
+    def test_strong_etag_becomes_weak_and_vary_is_added(self):
+        response = HttpResponse(self.html)
+        response['ETag'] = '"abc"'
+        response['Vary'] = 'Cookie'
+        response = self.compress(response)
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertEqual(response['Vary'], 'Cookie, Accept-Encoding')
+
+    def test_streaming_response_is_flushed_per_chunk(self):
+        response = self.compress(StreamingHttpResponse(iter([b'<p>one</p>', b'<p>two</p>'])))
+        chunks = list(response.streaming_content)
+        self.assertGreaterEqual(len(chunks), 3)
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(chunks)), b'<p>one</p><p>two</p>')
+
+    async def test_async_streaming_response(self):
+        async def content():
+            yield b'<p>one</p>'
+            yield b'<p>two</p>'
+
+        response = self.compress(StreamingHttpResponse(content()))
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(gzip.decompress(b''.join(chunks)), b'<p>one</p><p>two</p>')
+
+    def test_no_brotli_for_cookie_dependent_responses(self):
+        middleware = CompressionMiddleware(None)
+        with mock.patch('store.middleware.brotli', object()):
+            self.assertEqual(middleware._choose_encoding('br, gzip'), 'br')
+            self.assertEqual(middleware._choose_encoding('br, gzip', allow_brotli=False), 'gzip')
+            self.assertIsNone(middleware._choose_encoding('br', allow_brotli=False))
+
+
+class ShippingTests(StoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        metro = ShippingZone.objects.create(code='metro', name='Metro', extra_per_kg=Decimal('30'))
+        ShippingRate.objects.create(zone=metro, max_weight_grams=1000, cost=Decimal('60'))
+        ShippingRate.objects.create(zone=metro, max_weight_grams=2000, cost=Decimal('90'))
+        remote = ShippingZone.objects.create(code='remote', name='Remote', cod_available=False)
+        ShippingRate.objects.create(zone=remote, max_weight_grams=5000, cost=Decimal('150'))
+        Pincode.objects.create(pincode=400001, zone=metro)
+        Pincode.objects.create(pincode=110001, zone=metro, is_serviceable=False)
+        Pincode.objects.create(pincode=790001, zone=remote)
+
+    def address(self, pincode):
+        return {
+            'first_name': 'Test', 'last_name': 'User', 'email': 'test@example.com',
+            'phone': '9876543210', 'address': '1 Hill Road', 'city': 'Tawang',
+            'state': 'Arunachal Pradesh', 'pincode': pincode,
+        }
+
+    def test_pincode_lookup(self):
+        self.assertEqual(check_pincode('400001').zone.code, 'metro')
+        self.assertTrue(check_pincode('400001').cod_available)
+        self.assertFalse(check_pincode('110001').serviceable)
+        self.assertFalse(check_pincode('560001').serviceable)
+        self.assertFalse(check_pincode('790001').cod_available)
+        self.assertIsNone(check_pincode('04000').zone)
+
+        index = get_shipping_index()
+        metro = check_pincode('400001').zone
+        self.assertEqual(index.rate_for(metro, 1500), 9000)
+        # 1.5 kg over the heaviest rate: two started kg extra
+        self.assertEqual(index.rate_for(metro, 3500), 9000 + 2 * 3000)
+
+    def test_zone_rate_replaces_flat_shipping(self):
+        self.client.force_login(self.user)
+        self.add_to_cart(self.size_1kg)
+
+        response = self.client.get(reverse('check_pincode_api'), {'pincode': '400001'})
+        self.assertEqual(response.json()['shipping_cost'], 60.0)
+        self.assertEqual(response.json()['zone'], 'Metro')
+
+        # Above the free shipping threshold
+        self.add_to_cart(self.size_1kg)
+        response = self.client.get(reverse('check_pincode_api'), {'pincode': '400001'})
+        self.assertEqual(response.json()['shipping_cost'], 0.0)
+
+    def test_checkout_rejects_unserviceable_pincode_and_cod(self):
+        self.client.force_login(self.user)
+        self.add_to_cart(self.size_500)
+        url = reverse('checkout_quote_api')
+
+        response = self.client.post(url, {'address': self.address('110001')}, content_type='application/json')
+        self.assertEqual(set(response.json()['errors']), {'pincode'})
+
+        response = self.client.post(url, {'address': self.address('790001'), 'payment_method': 'cod'},
+                                    content_type='application/json')
+        self.assertEqual(set(response.json()['errors']), {'payment_method'})
+
+        response = self.client.post(url, {'address': self.address('790001'), 'payment_method': 'upi'},
+                                    content_type='application/json')
+        self.assertEqual(response.json()['quote']['shipping_cost'], 150.0)
+
+
+@override_settings(ADMISSION_RATE=1, ADMISSION_BURST=1)
+class WaitingRoomTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(self.user)
+        self.other = self.client_class()
+        self.other.force_login(User.objects.create_user('second', 'second@example.com', 'secret-pass-123'))
+
+    def test_visitors_are_admitted_in_turn(self):
+        self.assertEqual(self.add_to_cart(self.size_1kg).status_code, 302)
+        self.assertEqual(len(self.client.session['cart']), 1)
+
+        response = self.other.post(reverse('cart'), {'product_id': self.product.id, 'size_id': self.size_1kg.id})
+        self.assertTrue(response.url.startswith(reverse('waiting_room')))
+        self.assertEqual(self.other.get(reverse('waiting_room_status')).json()['position'], 1)
+
+        # A second later the bucket has a token for the next ticket
+        cache.set(REFILL_KEY, cache.get(REFILL_KEY) - 1, None)
+        self.assertTrue(self.other.get(reverse('waiting_room_status')).json()['admitted'])
+        self.other.post(reverse('cart'), {'product_id': self.product.id, 'size_id': self.size_1kg.id})
+        self.assertEqual(len(self.other.session['cart']), 1)
+
+    def test_ajax_requests_get_429(self):
+        self.add_to_cart(self.size_1kg)
+        response = self.other.post(reverse('cart'), {'product_id': self.product.id, 'size_id': self.size_1kg.id},
+                                   headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['position'], 1)
+
+
+class MoneyTests(SimpleTestCase):
+    def test_conversions_are_exact(self):
+        self.assertEqual(to_paise(Decimal('19.99')), 1999)
+        self.assertEqual(to_paise(0.1), 10)
+        self.assertEqual(to_paise(5), 500)
+        self.assertEqual(to_rupees(1999), Decimal('19.99'))
+        self.assertEqual(to_json(1999), 19.99)
+
+    def test_percent_off_rounds_half_up(self):
+        self.assertEqual(percent_off(80000, 10), 72000)
+        self.assertEqual(percent_off(1999, 15), 1699)  # 299.85 paise off -> 300
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        token = _pinned.set(False)
+        self.addCleanup(_pinned.reset, token)
+
+    def test_catalog_reads_use_replica(self):
+        self.assertEqual(self.router.db_for_read(Product), 'replica1')
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+
+    def test_write_pins_rest_of_request_to_primary(self):
+        self.assertEqual(self.router.db_for_write(Order), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica1', 'store'))
+        self.assertTrue(self.router.allow_migrate('default', 'store'))
+
+
+def make_coupon(code='GHEE10', usage_limit=5):
+    now = timezone.now()
+    return Coupon.objects.create(
+        code=code, discount_percent=10, usage_limit=usage_limit,
+        valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+    )
+
+
+class WriteRetryTests(TransactionTestCase):
+    def test_locked_writes_are_retried_then_raised(self):
+        calls = []
+
+        @retry_write(attempts=3, base_delay=0)
+        def write(failures):
+            calls.append(1)
+            Category.objects.create(name=f'Attempt {failures}-{len(calls)}')
+            if len(calls) <= failures:
+                raise OperationalError('database is locked')
+            return len(calls)
+
+        with mock.patch('store.db.time.sleep') as sleep:
+            self.assertEqual(write(2), 3)
+            self.assertEqual(sleep.call_count, 2)
+            # Failed attempts were rolled back
+            self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['Attempt 2-3'])
+
+            calls.clear()
+            with self.assertRaisesMessage(OperationalError, 'database is locked'):
+                write(5)
+            self.assertEqual(len(calls), 3)
+
+    def test_other_errors_and_nested_blocks_are_not_retried(self):
+        attempts = []
+        with self.assertRaisesMessage(OperationalError, 'no such table'):
+            for attempt in write_attempts(attempts=3, base_delay=0):
+                with attempt:
+                    attempts.append(1)
+                    raise OperationalError('no such table: x')
+        with transaction.atomic(), self.assertRaises(OperationalError):
+            for attempt in write_attempts(attempts=3, base_delay=0):
+                with attempt:
+                    attempts.append(1)
+                    raise OperationalError('database is locked')
+        self.assertEqual(len(attempts), 2)
+
+
+class CouponRedemptionTests(TransactionTestCase):
+    def test_concurrent_redemptions_respect_usage_limit(self):
+        coupon = make_coupon(usage_limit=5)
+        results = []
+        start = threading.Barrier(20)
+
+        def redeem():
+            start.wait()
+            try:
+                for attempt in write_attempts(attempts=50, base_delay=0.005):
+                    with attempt:
+                        redeem_coupon(coupon)
+                results.append(True)
+            except CouponError:
+                results.append(False)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=redeem) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 5)
+        self.assertEqual(results.count(True), 5)
+        self.assertEqual(results.count(False), 15)
+
+    def test_unknown_codes_are_cached(self):
+        self.assertIsNone(get_coupon('nope'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_coupon('NOPE'))
+
+    def test_saving_coupon_clears_cache(self):
+        coupon = make_coupon()
+        self.assertEqual(get_coupon('ghee10').discount_percent, 10)
+        coupon.discount_percent = 20
+        coupon.save()
+        self.assertEqual(get_coupon('ghee10').discount_percent, 20)
+
+    def test_renaming_coupon_clears_old_code(self):
+        coupon = make_coupon()
+        self.assertIsNotNone(get_coupon('ghee10'))
+        coupon.code = 'GHEE20'
+        coupon.save()
+        self.assertIsNone(get_coupon('ghee10'))
+        self.assertEqual(get_coupon('ghee20'), coupon)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, STORAGES=TEST_STORAGES)
+class DuplicateOrderTests(TransactionTestCase):
+    def test_concurrent_submits_create_one_order(self):
+        create_catalog(self)
+        invalidate_pricing_rules()
+        client = self.client_class()
+        client.force_login(self.user)
+        client.post(reverse('cart'), {'product_id': self.product.id, 'size_id': self.size_1kg.id})
+        url = start_checkout(client)
+
+        responses = []
+        start = threading.Barrier(5)
+
+        def submit():
+            # Same browser session, e.g. a double-clicked button
+            duplicate = self.client_class()
+            duplicate.cookies = client.cookies
+            start.wait()
+            try:
+                responses.append(duplicate.post(url + '&step=review', {'place_order': '1'}))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=submit) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        order = Order.objects.get()
+        confirmation = reverse('order_confirmation', args=[order.order_id])
+        self.assertEqual([response.url for response in responses], [confirmation] * 5)
+        self.assertEqual(order.items.get().quantity, 1)
@@ -10,7 +10,13 @@ urlpatterns = [
     path('cart/', views.cart, name='cart'),
     path('simple_cart/', views.simple_cart, name='simple_cart'),  # New simple cart view
     path('checkout/', views.checkout, name='checkout'),
+    path('api/checkout/quote/', views.checkout_quote_api, name='checkout_quote_api'),
+    path('api/checkout/place-order/', views.checkout_place_order_api, name='checkout_place_order_api'),
+    path('api/shipping/pincode/', views.check_pincode_api, name='check_pincode_api'),
+    path('waiting-room/', views.waiting_room, name='waiting_room'),
+    path('waiting-room/status/', views.waiting_room_status, name='waiting_room_status'),
     path('order-confirmation/<uuid:order_id>/', views.order_confirmation, name='order_confirmation'),
+    path('order-confirmation/<uuid:order_id>/invoice/', views.order_invoice, name='order_invoice'),
     path('login/', views.login_view, name='login'),
     path('register/', views.register_view, name='register'),
     path('logout/', views.logout_view, name='logout'),
@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate
@@ -10,10 +10,23 @@ from django.conf import settings
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.urls import reverse
+from django.views.decorators.http import require_POST
+from django.utils.cache import get_conditional_response, patch_cache_control
 from .email_utils import send_order_confirmation_emails
-from .models import Product, Order, OrderItem, Category, ProductSize, ProductStock, Coupon
+from .models import Product, Order, OrderItem, Category, ProductSize, ProductStock, Coupon, CustomerStats, Invoice
 from django.db.models import Q
 from .utils import track_recently_viewed
+from .images import variant_url
+from .orders import order_history
+from .coupons import get_coupon
+from .admission import admission_required, check_in
+from .checkout import (CheckoutError, checkout_lines, payment_method_error, place_order, quote_json,
+                       session_quote, validate_checkout_data, PAYMENT_METHODS)
+from .money import percent_off, to_json, to_paise, to_rupees
+from .pricing import get_pricing_rules, price_cart
+from .shipping import check_pincode, parse_pincode
 import uuid
 from django.core.paginator import Paginator
 import json
@@ -48,81 +61,36 @@ def simple_cart(request):
                         request.session.modified = True
                         
                         # Calculate cart totals
-                        subtotal = 0
-                        for item in cart:
-                            product_id = item.get('product_id')
-                            size_id = item.get('size_id')
-                            if product_id and str(product_id).isdigit():
-                                try:
-                                    product = Product.objects.get(id=int(product_id))
-                                    # Prefer stored cart item price if present (stored at add-to-cart time)
-                                    price = item.get('price')
-                                    if price is None:
-                                        if size_id:
-                                            price = product.get_price_for_size(int(size_id))
-                                        else:
-                                            price = product.discounted_price
-                                    subtotal += float(price) * item['quantity']
-                                except Exception:
-                                    logging.exception("Error calculating item price in simple_cart")
-                        
-                        shipping_threshold = 1000
-                        shipping_cost = 0 if subtotal >= shipping_threshold else 50
-                        total = subtotal + shipping_cost
+                        quote = price_cart(cart)
                         
                         return JsonResponse({
                             'success': True,
-                            'subtotal': round(subtotal, 2),
-                            'shipping_cost': shipping_cost,
-                            'total': round(total, 2)
+                            'subtotal': to_json(quote.subtotal),
+                            'shipping_cost': to_json(quote.shipping_cost),
+                            'total': to_json(quote.subtotal + quote.shipping_cost)
                         })
                 except (ValueError, TypeError) as e:
                     logging.exception("Error processing quantity update")
     
     # Normal page display
-    products = []
-    subtotal = 0
-    
-    # Get all cart items with product data
-    for item in cart:
-        try:
-            product_id = item.get('product_id')
-            size_id = item.get('size_id')
-            if not product_id or not str(product_id).isdigit():
-                continue
-                
-            product = Product.objects.get(id=int(product_id))
-            quantity = item['quantity']
-            
-            # Use size-specific pricing if size_id is available
-            if size_id:
-                item_price = product.get_price_for_size(int(size_id))
-            else:
-                item_price = product.discounted_price
-                
-            item_total = item_price * quantity
-            
-            products.append({
-                'product': product,
-                'quantity': quantity,
-                'item_total': item_total,
-                'size_id': size_id,
-                'price': item_price
-            })
-            
-            subtotal += item_total
-        except Exception:
-            logging.exception("Error processing cart item in simple_cart")
-    
-    shipping_threshold = 1000
-    shipping_cost = 0 if subtotal >= shipping_threshold else 50
-    total = subtotal + shipping_cost
+    quote = price_cart(cart)
+    product_map = Product.objects.in_bulk([line.product_id for line in quote.lines])
+    products = [
+        {
+            'product': product_map[line.product_id],
+            'quantity': line.quantity,
+            'item_total': to_rupees(line.total),
+            'size_id': line.size_id,
+            'price': to_rupees(line.unit_price)
+        }
+        for line in quote.lines if line.product_id in product_map
+    ]
     
     return render(request, 'store/simple_cart.html', {
         'cart_items': products,
-        'subtotal': subtotal,
-        'shipping_cost': shipping_cost,
-        'total': total,
+        'subtotal': to_rupees(quote.subtotal),
+        'shipping_cost': to_rupees(quote.shipping_cost),
+        'total': to_rupees(quote.subtotal + quote.shipping_cost),
     })
 
 def homepage(request):
@@ -134,37 +102,45 @@ def homepage_old(request):
     return render(request, 'store/homepage_new.html', {'fallback_image': fallback_image})
 
 def shop(request):
-    # Get all products with related data
+    # Get all products with related data; availability filters and sorts on the
+    # (stock_status, created_at) index, and the statuses sort in order of availability
     products = Product.objects.all().prefetch_related('sizes', 'size_stocks').order_by('-created_at')
-    
-    # Import Decimal for proper calculations
-    from decimal import Decimal
-    
-    # Create a mapping of product sizes to their prices and stock
+    availability = request.GET.get('availability', '')
+    if availability == 'available':
+        products = products.exclude(stock_status='out_of_stock')
+    elif availability in ('in_stock', 'low_stock', 'out_of_stock'):
+        products = products.filter(stock_status=availability)
+    sort = request.GET.get('sort', '')
+    if sort == 'availability':
+        products = products.order_by('stock_status', '-created_at')
+    
+    # Create a mapping of product sizes to their prices and stock; prices are
+    # worked out in integer paise and converted once for the JSON payload
+    rules = get_pricing_rules()
     product_size_data = {}
     initial_prices = {}
     for product in products:
         product_size_data[product.id] = {}
-        # Get the first size for initial price
-        first_stock = product.size_stocks.first()
-        if first_stock:
-            discount_multiplier = Decimal('1') - Decimal(product.discount_percent) / Decimal('100')
-            initial_discounted_price = first_stock.price * discount_multiplier
-            initial_prices[product.id] = float(initial_discounted_price)
-        
-        for stock in product.size_stocks.all():
-            discount_multiplier = Decimal('1') - Decimal(product.discount_percent) / Decimal('100')
-            discounted_price = stock.price * discount_multiplier
-            product_size_data[product.id][stock.size.id] = {
-                'price': float(discounted_price),
-                'original_price': float(stock.price),
+        stocks = product.size_stocks.all()
+        for stock in stocks:
+            price = rules.unit_price(product.id, stock.size_id)
+            if price is None:
+                price = percent_off(to_paise(stock.price), product.discount_percent)
+            product_size_data[product.id][stock.size_id] = {
+                'price': to_json(price),
+                'original_price': to_json(to_paise(stock.price)),
                 'stock': stock.quantity
             }
+        # The first size sets the initial price
+        if stocks:
+            initial_prices[product.id] = product_size_data[product.id][stocks[0].size_id]['price']
     
     context = {
         'products': products,
         'product_size_data': json.dumps(product_size_data),
         'initial_prices': initial_prices,
+        'availability': availability,
+        'sort': sort,
     }
     
     return render(request, 'store/shop_new.html', context)
@@ -217,6 +193,7 @@ Sent from Gaumaatri Website Contact Form
 
 @csrf_exempt
 @login_required
+@admission_required(methods=('POST',))
 def cart(request):
     # Debug: log request details at debug level
     logging.debug(f"Received {request.method} request to cart view from {request.META.get('REMOTE_ADDR')}")
@@ -278,7 +255,7 @@ def cart(request):
                     'product_id': pid,
                     'size_id': sid,
                     'quantity': int(item.get('quantity', 1)),
-                    'price': item.get('price')
+                    'price_paise': item.get('price_paise')
                 }
             else:
                 # Merge quantities; prefer existing price
@@ -327,9 +304,9 @@ def cart(request):
             'saved_items': [],
             'subtotal': 0,
             'shipping_cost': 0,
-            'shipping_threshold': 1000,  # Default shipping threshold
+            'shipping_threshold': threshold_rupees(get_pricing_rules()),
             'gift_wrap': False,
-            'gift_wrap_cost': 50,
+            'gift_wrap_cost': to_rupees(get_pricing_rules().gift_wrap_cost),
             'total': 0,
             'item_count': 0,
             'suggested_products': [],
@@ -531,41 +508,24 @@ def cart(request):
         
         # Apply coupon code
         elif request.POST.get('coupon_code'):
-            coupon_code = request.POST.get('coupon_code').strip().upper()
+            coupon = get_coupon(request.POST.get('coupon_code'))
             
-            try:
-                coupon = Coupon.objects.get(code=coupon_code)
-                
-                # Calculate current cart total
-                cart_total = 0
-                for item in cart:
-                    try:
-                        product = Product.objects.get(id=item['product_id'])
-                        size_id = item.get('size_id')
-                        if size_id:
-                            price = product.get_price_for_size(int(size_id))
-                        else:
-                            price = product.discounted_price
-                        cart_total += price * item['quantity']
-                    except Product.DoesNotExist:
-                        continue
-                
-                if coupon.can_apply(cart_total):
-                    discount = coupon.calculate_discount(cart_total)
+            if coupon is None:
+                messages.error(request, "Invalid coupon code.")
+            elif not coupon.is_valid():
+                messages.error(request, "This coupon has expired or is no longer valid.")
+            else:
+                cart_total = price_cart(cart).subtotal
+                if coupon.can_apply(to_rupees(cart_total)):
+                    discount = coupon.discount_paise(cart_total)
                     request.session['applied_coupon'] = {
                         'code': coupon.code,
-                        'discount': float(discount)
+                        'discount': to_json(discount)
                     }
                     request.session.modified = True
-                    messages.success(request, f"Coupon '{coupon.code}' applied! You saved ₹{discount:.2f}")
+                    messages.success(request, f"Coupon '{coupon.code}' applied! You saved ₹{to_rupees(discount)}")
                 else:
-                    if not coupon.is_valid():
-                        messages.error(request, "This coupon has expired or is no longer valid.")
-                    else:
-                        messages.error(request, f"Minimum order amount of ₹{coupon.min_amount} required for this coupon.")
-                        
-            except Coupon.DoesNotExist:
-                messages.error(request, "Invalid coupon code.")
+                    messages.error(request, f"Minimum order amount of ₹{coupon.min_amount} required for this coupon.")
             
             return redirect('cart')
         
@@ -615,14 +575,8 @@ def cart(request):
                         return redirect(request.META.get('HTTP_REFERER'))
                     return redirect('product_detail', product_id=product_id)
 
-                # Determine price for this size (store with cart item for consistency)
-                if size_id:
-                    try:
-                        item_price = float(product.get_price_for_size(int(size_id)))
-                    except Exception:
-                        item_price = float(product.discounted_price)
-                else:
-                    item_price = float(product.discounted_price)
+                # Price for this size, stored with the cart item for display
+                item_price = get_pricing_rules().unit_price(product.id, size_id)
 
                 # Check if product-size combination already exists in cart
                 product_exists = False
@@ -638,7 +592,7 @@ def cart(request):
                         'product_id': product_id, 
                         'quantity': quantity,
                         'size_id': size_id or '',  # Store as empty string if None
-                        'price': item_price
+                        'price_paise': item_price
                     })
                 
                 request.session['cart'] = cart
@@ -654,7 +608,7 @@ def cart(request):
                         'message': f"Added {quantity} {product.name} to your cart.",
                         'cart_count': total_items,
                         'product_name': product.name,
-                        'product_image': product.image.url if product.image else None,
+                        'product_image': variant_url(product.image, 'thumb') if product.image else None,
                     })
                 
             except Product.DoesNotExist:
@@ -680,13 +634,8 @@ def cart(request):
     saved_products = []
     from decimal import Decimal
     
-    subtotal = Decimal('0')
-    item_count = 0
-    
-    # Constants
-    SHIPPING_THRESHOLD = 1000  # Free shipping for orders above this amount
-    SHIPPING_COST = 50
-    GIFT_WRAP_COST = 50
+    # Compiled prices, shipping tiers and gift wrap charge
+    rules = get_pricing_rules()
     
     # Clean up cart in one pass - faster than creating new lists
     valid_product_ids = set()
@@ -700,6 +649,13 @@ def cart(request):
             valid_product_ids.add(int(item['product_id']))
             i += 1
     
+    # Calculate line prices and totals (shipping, coupon and gift wrap) with the pricing rules
+    applied_coupon = request.session.get('applied_coupon')
+    coupon = get_coupon(applied_coupon.get('code')) if applied_coupon else None
+    gift_wrap = request.session.get('gift_wrap', False)
+    quote = rules.price_cart(cart, gift_wrap=gift_wrap, coupon=coupon)
+    line_prices = {(line.product_id, line.size_id): line.unit_price for line in quote.lines}
+    
     # Get all products in one optimized query 
     product_map = {}
     if valid_product_ids:
@@ -731,36 +687,26 @@ def cart(request):
             if size_id and str(size_id).isdigit():
                 try:
                     selected_size = ProductSize.objects.get(id=int(size_id))
-                    # Try to get ProductStock for exact stock
-                    try:
-                        stock_obj = ProductStock.objects.get(product=product, size_id=size_id)
-                        available_stock = stock_obj.quantity
-                    except ProductStock.DoesNotExist:
-                        available_stock = product.stock_quantity
+                    available_stock = product.get_stock_for_size(selected_size.id)
                 except ProductSize.DoesNotExist:
                     pass
             
-            # Determine price: prefer the price saved in the cart session
-            item_price = item.get('price')
+            # The priced line of the quote (same as checkout charges)
+            item_price = line_prices.get((product_id, int(size_id) if str(size_id).isdigit() else None))
             if item_price is None:
-                if size_id:
-                    item_price = product.get_price_for_size(int(size_id)) if selected_size else product.discounted_price
-                else:
-                    item_price = product.discounted_price
-
-            item_total = Decimal(str(item_price)) * quantity
+                continue
+            item_total = item_price * quantity
 
             products.append({
                 'product': product,
                 'quantity': quantity,
-                'item_total': item_total,
+                'item_total': to_rupees(item_total),
                 'size': selected_size,
-                'price': float(item_price),
+                'price': to_rupees(item_price),
+                'price_paise': item_price,
+                'total_paise': item_total,
                 'available_stock': available_stock
             })
-            
-            subtotal += item_total
-            item_count += quantity
         except Product.DoesNotExist:
             logging.debug(f"Product with ID {item['product_id']} not found")
             continue
@@ -815,22 +761,11 @@ def cart(request):
             logging.exception("Error processing saved item")
             continue
     
-    # Calculate shipping cost
-    shipping_cost = Decimal('0') if subtotal >= SHIPPING_THRESHOLD else Decimal(str(SHIPPING_COST))
-    
-    # Apply coupon discount
-    coupon_discount = Decimal('0')
-    applied_coupon = request.session.get('applied_coupon')
-    if applied_coupon:
-        coupon_discount = Decimal(str(applied_coupon.get('discount', 0)))
-    
-    # Calculate total
-    total = subtotal - coupon_discount + shipping_cost
-    
-    # Get gift wrap status from session
-    gift_wrap = request.session.get('gift_wrap', False)
-    if gift_wrap:
-        total += Decimal(str(GIFT_WRAP_COST))
+    subtotal = to_rupees(quote.subtotal)
+    item_count = quote.item_count
+    shipping_cost = to_rupees(quote.shipping_cost)
+    coupon_discount = to_rupees(quote.coupon_discount)
+    total = to_rupees(quote.total)
     
     # Skip suggested and recently viewed products if cart is empty to speed up load time
     suggested_products = []
@@ -864,19 +799,19 @@ def cart(request):
                 cart_items_data.append({
                     'id': product.id,
                     'name': product.name,
-                    'price': float(item_data['price']),
+                    'price': to_json(item_data['price_paise']),
                     'quantity': item_data['quantity'],
-                    'total': float(item_data['item_total']),
-                    'image': product.image.url if product.image else None,
+                    'total': to_json(item_data['total_paise']),
+                    'image': variant_url(product.image, 'thumb') if product.image else None,
                     'size': size_name,
                 })
             
             return JsonResponse({
                 'success': True,
                 'items': cart_items_data,
-                'subtotal': float(subtotal),
-                'shipping_cost': float(shipping_cost),
-                'total': float(total),
+                'subtotal': to_json(quote.subtotal),
+                'shipping_cost': to_json(quote.shipping_cost),
+                'total': to_json(quote.total),
                 'item_count': item_count,
                 'cart_count': item_count,
             })
@@ -901,9 +836,9 @@ def cart(request):
         'subtotal': subtotal,
         'coupon_discount': coupon_discount,
         'shipping_cost': shipping_cost,
-        'shipping_threshold': SHIPPING_THRESHOLD,
+        'shipping_threshold': threshold_rupees(rules),
         'gift_wrap': gift_wrap,
-        'gift_wrap_cost': GIFT_WRAP_COST,
+        'gift_wrap_cost': to_rupees(rules.gift_wrap_cost),
         'total': total,
         'item_count': item_count,
         'suggested_products': suggested_products,
@@ -913,6 +848,7 @@ def cart(request):
 import uuid
 import time
 
+@admission_required()
 def checkout(request):
     cart = request.session.get('cart', [])
     
@@ -1010,19 +946,11 @@ def checkout(request):
     # Store address information
     elif request.method == 'POST' and 'first_name' in request.POST and 'last_name' in request.POST:
         # Store shipping details in session for later use
-        first_name = request.POST.get('first_name', '')
-        last_name = request.POST.get('last_name', '')
-        
-        checkout_data = {
-            'full_name': f"{first_name} {last_name}".strip(),
-            'email': request.POST.get('email', ''),
-            'phone': request.POST.get('phone', ''),
-            'address': request.POST.get('address', ''),
-            'city': request.POST.get('city', ''),
-            'state': request.POST.get('state', ''),
-            'pincode': request.POST.get('zipcode', ''),
-            'order_notes': request.POST.get('order_notes', '')
-        }
+        checkout_data, errors = validate_checkout_data(request.POST)
+        if errors:
+            for field, error in errors.items():
+                messages.error(request, f"{field.replace('_', ' ').capitalize()}: {error}")
+            return redirect(f'/checkout/?session_id={session_id}&step=address')
         
         request.session['checkout_data'] = checkout_data
         request.session.modified = True
@@ -1033,6 +961,10 @@ def checkout(request):
     # Store payment method and redirect to payment QR or place order
     elif request.method == 'POST' and 'payment_method' in request.POST:
         payment_method = request.POST.get('payment_method', 'cod')
+        error = payment_method_error(payment_method, request.session.get('checkout_data', {}).get('pincode'))
+        if error:
+            messages.error(request, error)
+            return redirect(f'/checkout/?session_id={session_id}&step=payment')
         request.session['payment_method'] = payment_method
         request.session.modified = True
         
@@ -1046,162 +978,19 @@ def checkout(request):
     # Process order placement
     elif request.method == 'POST' and request.POST.get('place_order'):
         print(f"Processing order placement with POST data: {request.POST}")
-        
-        # Get checkout data from session
-        checkout_data = request.session.get('checkout_data', {})
-        payment_method = request.session.get('payment_method', 'cod')
         payment_verified = request.POST.get('payment_verified', 'false') == 'true'
-        
-        # For UPI payments, mark as paid if user confirmed
-        payment_status = payment_verified if payment_method == 'upi' else False
-        
-        # Process the form data
-        full_name = checkout_data.get('full_name', '')
-        email = checkout_data.get('email', '')
-        phone = checkout_data.get('phone', '')
-        address = checkout_data.get('address', '')
-        city = checkout_data.get('city', '')
-        state = checkout_data.get('state', '')
-        pincode = checkout_data.get('pincode', '')
-        
-        # Debug data
-        print(f"Order data - Name: {full_name}, Email: {email}, Phone: {phone}, Address: {address}")
-        print(f"Payment method: {payment_method}, Payment status: {payment_status}")
-        
-        # Process cart items
-        products = []
-        total = 0
-        for item in cart:
-            try:
-                product = Product.objects.get(id=item['product_id'])
-                size_id = item.get('size_id')
-                
-                # Use size-specific pricing
-                if size_id:
-                    item_price = product.get_price_for_size(int(size_id))
-                else:
-                    item_price = product.discounted_price
-                    
-                item_total = item_price * item['quantity']
-                products.append({
-                    'product': product, 
-                    'quantity': item['quantity'],
-                    'total': item_total,
-                    'size_id': size_id
-                })
-                total += item_total
-            except Product.DoesNotExist:
-                print(f"Product with ID {item['product_id']} not found")
-                continue
-            except Exception as e:
-                print(f"Error processing checkout item: {str(e)}")
-                continue
-                
-        # Create an order in the database
         try:
-            # Create the order
-            order = Order.objects.create(
-                order_id=uuid.uuid4(),
-                user=request.user if request.user.is_authenticated else None,
-                full_name=full_name,
-                email=email,
-                phone=phone,
-                address=address,
-                city=city,
-                state=state,
-                pincode=pincode,
-                total_amount=total,
-                payment_method=payment_method,
-                payment_status=payment_status,
-                status='pending'
-            )
-            
-            # Create order items
-            for item in products:
-                size_id = item.get('size_id')
-                if size_id:
-                    item_price = item['product'].get_price_for_size(int(size_id))
-                else:
-                    item_price = item['product'].discounted_price
-                    
-                OrderItem.objects.create(
-                    order=order,
-                    product=item['product'],
-                    quantity=item['quantity'],
-                    price=item_price
-                )
-                
-            # Send emails (non-blocking - don't let email failures stop order)
-            try:
-                process_order_emails(request, order, products)
-            except Exception as email_error:
-                print(f"Email sending failed but order created: {str(email_error)}")
-                # Don't fail the order if email fails
-            
-            # Clear the cart and checkout data
-            request.session['cart'] = []
-            request.session.pop('checkout_data', None)
-            request.session.pop('payment_method', None)
-            request.session.modified = True
-            
-            messages.success(request, "Order placed successfully! Confirmation email sent.")
-            return redirect('order_confirmation', order_id=order.order_id)
-            
-        except Exception as e:
-            import traceback
-            print(f"Error creating order: {str(e)}")
-            print(f"Traceback: {traceback.format_exc()}")
-            messages.error(request, "There was an error processing your order. Please try again.")
+            order_id = place_order(request, session_id, payment_verified)
+        except CheckoutError as e:
+            messages.error(request, str(e))
+            return redirect(f'/checkout/?session_id={session_id}&step=review')
+        messages.success(request, "Order placed successfully! Confirmation email sent.")
+        return redirect('order_confirmation', order_id=order_id)
             
     # Process cart items for display
-    products = []
-    subtotal = 0
-    for item in cart:
-        try:
-            product = Product.objects.get(id=item['product_id'])
-            size_id = item.get('size_id')
-            
-            # Use size-specific pricing
-            if size_id:
-                item_price = product.get_price_for_size(int(size_id))
-            else:
-                item_price = product.discounted_price
-                
-            item_total = item_price * item['quantity']
-            products.append({
-                'product': product, 
-                'quantity': item['quantity'],
-                'total': item_total,
-                'size_id': size_id
-            })
-            subtotal += item_total
-        except Product.DoesNotExist:
-            print(f"Product with ID {item['product_id']} not found")
-            continue
-        except Exception as e:
-            print(f"Error processing checkout item: {str(e)}")
-            continue
-    
-    # Calculate shipping cost
-    SHIPPING_THRESHOLD = 1000
-    SHIPPING_COST = 50
-    shipping_cost = 0 if subtotal >= SHIPPING_THRESHOLD else SHIPPING_COST
-    
-    # Apply coupon discount
-    coupon_discount = 0
-    applied_coupon = request.session.get('applied_coupon')
-    if applied_coupon:
-        from decimal import Decimal
-        coupon_discount = Decimal(str(applied_coupon.get('discount', 0)))
-    
-    # Calculate total
-    total = subtotal - coupon_discount + shipping_cost
-    
-    # Get gift wrap status
+    quote, _ = session_quote(request, cart)
     gift_wrap = request.session.get('gift_wrap', False)
-    GIFT_WRAP_COST = 50
-    if gift_wrap:
-        total += GIFT_WRAP_COST
+    products = checkout_lines(quote)
     
     # If cart is empty, redirect to cart page
     if not products:
@@ -1210,13 +999,13 @@ def checkout(request):
     
     context = {
         'cart_items': products,
-        'subtotal': subtotal,
-        'coupon_discount': coupon_discount,
-        'shipping_cost': shipping_cost,
-        'shipping_threshold': SHIPPING_THRESHOLD,
+        'subtotal': to_rupees(quote.subtotal),
+        'coupon_discount': to_rupees(quote.coupon_discount),
+        'shipping_cost': to_rupees(quote.shipping_cost),
+        'shipping_threshold': threshold_rupees(get_pricing_rules()),
         'gift_wrap': gift_wrap,
-        'gift_wrap_cost': GIFT_WRAP_COST if gift_wrap else 0,
-        'total': total,
+        'gift_wrap_cost': to_rupees(quote.gift_wrap_cost),
+        'total': to_rupees(quote.total),
         'session_id': session_id,
         'step': checkout_step,
         'checkout_data': request.session.get('checkout_data', {}),
@@ -1225,41 +1014,140 @@ def checkout(request):
     
     return render(request, 'store/checkout_premium.html', context)
     
-def process_order_emails(request, order, products):
-    """Send order confirmation emails to both customer and store owner"""
-    
-    # Get site URL for email templates
-    site_url = request.build_absolute_uri('/')[:-1]  # Get base URL without trailing slash
-    
-    # Send confirmation emails to both customer and store owner using the utility function
-    from .email_utils import send_order_confirmation_emails
-    customer_sent, owner_sent = send_order_confirmation_emails(
-        order=order,
-        products=products,
-        site_url=site_url
-    )
-    
-    # Log the result
-    if customer_sent and owner_sent:
-        print(f"Order confirmation emails sent for order #{order.order_id}")
-    else:
-        print(f"Some order confirmation emails failed for order #{order.order_id}")
-        
+def _json_body(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+@require_POST
+@admission_required()
+def checkout_quote_api(request):
+    """
+    Validate shipping details, payment method and cart in one call.
+
+    Expects JSON ``{"address": {...}, "payment_method": "cod", "gift_wrap": false}``
+    and returns the priced order summary. On success the details are kept in
+    the session for ``checkout_place_order_api``.
+    """
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'success': False, 'errors': {'request': "Invalid JSON body."}}, status=400)
+
+    checkout_data, errors = validate_checkout_data(data.get('address') or {})
+    payment_method = data.get('payment_method', 'cod')
+    payment_error = payment_method_error(payment_method, None if 'pincode' in errors else checkout_data['pincode'])
+    if payment_error:
+        errors['payment_method'] = payment_error
+    if 'gift_wrap' in data:
+        request.session['gift_wrap'] = bool(data['gift_wrap'])
+
+    quote, _ = session_quote(request, pincode=checkout_data['pincode'])
+    products = checkout_lines(quote)
+    if not products:
+        errors['cart'] = "Your cart is empty."
+    if errors:
+        return JsonResponse({'success': False, 'errors': errors}, status=400)
+
+    request.session['checkout_data'] = checkout_data
+    request.session['payment_method'] = payment_method
+    return JsonResponse({
+        'success': True,
+        'checkout_data': checkout_data,
+        'payment_method': payment_method,
+        'quote': quote_json(quote, products),
+    })
+
+@require_POST
+@admission_required()
+def checkout_place_order_api(request):
+    """
+    Place the order validated by ``checkout_quote_api``.
+
+    Expects JSON ``{"session_id": "...", "payment_method": "upi", "payment_verified": true}``;
+    ``session_id`` identifies the checkout flow, so resubmits return the same order.
+    """
+    data = _json_body(request)
+    if data is None or not data.get('session_id'):
+        return JsonResponse({'success': False, 'error': "A checkout session_id is required."}, status=400)
+    if data.get('payment_method') in PAYMENT_METHODS:
+        request.session['payment_method'] = data['payment_method']
+
+    try:
+        order_id = place_order(request, str(data['session_id']), bool(data.get('payment_verified')))
+    except CheckoutError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=409)
+    return JsonResponse({
+        'success': True,
+        'order_id': str(order_id),
+        'redirect': reverse('order_confirmation', args=[order_id]),
+    })
+
+def check_pincode_api(request):
+    """
+    Serviceability of ``?pincode=`` and the shipping charge for the session cart.
+
+    Used by the checkout address form to warn about undeliverable pincodes
+    and hide cash on delivery where it is not offered.
+    """
+    pincode = request.GET.get('pincode', '')
+    if parse_pincode(pincode) is None:
+        return JsonResponse({'success': False, 'error': "Enter a valid 6-digit PIN code."}, status=400)
+
+    result = check_pincode(pincode)
+    data = {
+        'success': True,
+        'pincode': str(result.pincode),
+        'serviceable': result.serviceable,
+        'cod_available': result.cod_available,
+        'zone': result.zone.name if result.zone else None,
+    }
+    if result.serviceable:
+        quote, _ = session_quote(request, pincode=pincode)
+        data['shipping_cost'] = to_json(quote.shipping_cost)
+        data['total'] = to_json(quote.total)
+    return JsonResponse(data)
+
+def threshold_rupees(rules):
+    """Free shipping threshold for templates (None when shipping is never free)."""
+    threshold = rules.free_shipping_threshold
+    return to_rupees(threshold) if threshold is not None else None
+
 def order_confirmation(request, order_id):
     """View to display order confirmation page"""
     try:
         order = Order.objects.get(order_id=order_id)
-        order_items = order.items.all()
+        order_items = order.items.select_related('product')
         
         return render(request, 'store/order_confirmation.html', {
             'order': order,
-            'order_items': order_items
+            'order_items': order_items,
+            'has_invoice': Invoice.objects.filter(order=order).exists(),
         })
         
     except Order.DoesNotExist:
         messages.error(request, "Order not found.")
         return redirect('homepage')
 
+def order_invoice(request, order_id):
+    """
+    The stored invoice of an order (see ``manage.py generate_invoices``).
+
+    Never rendered here. Invoices do not change once stored, so browsers may
+    keep them for a day and revalidate with the ETag after that.
+    """
+    invoice = Invoice.objects.filter(order__order_id=order_id).values('number', 'html', 'etag').first()
+    if invoice is None:
+        raise Http404("No invoice yet for this order")
+    etag = f'"{invoice["etag"]}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(invoice['html'])
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=24 * 60 * 60)
+    return response
+
 def login_view(request):
     # Redirect if already logged in
     if request.user.is_authenticated:
@@ -1446,12 +1334,15 @@ def logout_view(request):
 @login_required
 def account_view(request):
     """User account/profile page"""
-    # Get user's orders
-    user_orders = Order.objects.filter(user=request.user).order_by('-created_at')[:10] if request.user.is_authenticated else []
+    # Get user's orders, a page at a time
+    history = order_history(request.user, request.GET.get('before')) if request.user.is_authenticated else None
     
     context = {
         'user': request.user,
-        'orders': user_orders,
+        'orders': history.orders if history else [],
+        'next_cursor': history.next_cursor if history else None,
+        'is_first_page': not request.GET.get('before'),
+        'stats': CustomerStats.objects.filter(user=request.user).first() if request.user.is_authenticated else None,
     }
     
     return render(request, 'store/account.html', context)
@@ -1518,3 +1409,32 @@ def newsletter_subscribe(request):
             messages.error(request, "Please enter a valid email address.")
     
     return redirect('homepage')
+
+def _waiting_room_state(request):
+    position = check_in(request)
+    rate = getattr(settings, 'ADMISSION_RATE', 0)
+    return {
+        'admitted': position <= 0,
+        'position': max(position, 0),
+        'wait_seconds': int(position / rate) + 1 if position > 0 and rate else 0,
+    }
+
+def waiting_room(request):
+    """Queue page shown while checkout is admitting visitors in turn."""
+    next_url = request.GET.get('next', '/')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = '/'
+    state = _waiting_room_state(request)
+    if state['admitted']:
+        return redirect(next_url)
+    return render(request, 'store/waiting_room.html', {
+        **state,
+        'next': next_url,
+        'poll_seconds': getattr(settings, 'ADMISSION_POLL_SECONDS', 3),
+    })
+
+def waiting_room_status(request):
+    """JSON polled by the waiting room page."""
+    response = JsonResponse(_waiting_room_state(request))
+    response['Cache-Control'] = 'no-store'
+    return response